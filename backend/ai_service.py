@@ -5,41 +5,49 @@ import io
 from huggingface_hub import InferenceClient
 from datetime import datetime
 from model_integration import get_dental_model
+from model_registry import registry
+from request_timing import timed
 import logging
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Updated image analysis function using actual model
+@timed('analyze')
 def analyze_dental_image(image_data):
     """
     Analyze dental image using AI model.
     Returns raw model predictions.
     """
-    logger.info("Analyzing dental image...")
+    logger.debug("Analyzing dental image...")
     
     try:
-        # Get the model
-        model = get_dental_model()
-        
-        # Make prediction
-        result = model.predict(image_data)
+        # Borrow the active model; a reload waits for this prediction to finish
+        with registry.use() as handle:
+            result = handle.model.predict(image_data)
+        result['model_version'] = handle.version
         
         # Add timestamp
         result['analysis_timestamp'] = datetime.now().isoformat()
-        result['model_used'] = 'MobileNet_Dental_v1' if result.get('model_loaded') else 'Mock_Fallback'
+        if not result.get('model_loaded'):
+            result['model_used'] = 'Mock_Fallback'
+        elif result.get('backend') == 'fake':
+            result['model_used'] = 'Fake_Backend'
+        else:
+            result['model_used'] = 'MobileNet_Dental_v1'
         
-        logger.info(f"Analysis complete. Detected conditions: {len(result.get('detected_conditions', []))}")
+        logger.debug("Analysis complete. Detected conditions: %d", len(result.get('detected_conditions', [])))
         
         return result
         
     except Exception as e:
-        logger.error(f"Error in dental image analysis: {e}", exc_info=True)
-        # Fallback to mock data
+        logger.error("Error in dental image analysis: %s", e, exc_info=True)
+        # Fallback to mock data, versioned like any other mock prediction
         model = get_dental_model()
-        return model.get_mock_predictions(error=str(e))
+        result = model.get_mock_predictions(error=str(e))
+        result['model_version'] = f"{model.backend_name}:mock"
+        return result
 
+@timed('recommendations')
 def get_ai_recommendations(analysis_results, habits_data):
     """
     Get comprehensive, disease-specific recommendations based on analysis and habits
@@ -238,5 +246,5 @@ def get_ai_recommendations(analysis_results, habits_data):
         return result
         
     except Exception as e:
-        logger.error(f"Error getting recommendations: {e}")
+        logger.error("Error getting recommendations: %s", e)
         return "# AI Dental Recommendations\n\n1. Brush teeth twice daily for 2 minutes\n2. Floss regularly\n3. Use fluoride toothpaste\n4. Visit dentist for regular checkups\n\n*Note: Consult a dental professional for personalized advice.*"
\ No newline at end of file
@@ -1,19 +1,38 @@
-from flask import Flask, request, jsonify, session, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
-from functools import wraps
-from werkzeug.security import generate_password_hash, check_password_hash
 import os
 from dotenv import load_dotenv
 from models import db, User, DailyHabit, AICheckup, Reminder
+from auth import init_auth, login_required, current_user_id
+from db_engine import init_engine
+from write_queue import init_write_queue, run_write
 import ai_service
+from habit_encoding import encode_habit_calendar, MAX_CALENDAR_DAYS
+from export_service import generate_account_export
+from habit_sync import MAX_SYNC_ENTRIES, parse_habit_fields, parse_sync_entry, upsert_habits
+from reminder_bulk import BulkRequestError, bulk_statement
+from calendar_service import build_calendar_window, MAX_WINDOW_DAYS
+from checkup_trends import (BUCKETS, BUCKET_DAYS, MAX_TREND_POINTS, build_trend, class_probabilities,
+                            condition_rows, typed_columns)
+from population_analytics import population_summary, refresh_rollups
+from email_outbox import outbox_summary, retry_dead_letters
+from dashboard_service import init_dashboard_cache, invalidate_dashboard, get_dashboard, streak_stats
 from email_service import init_mail
+from compression import init_compression
+from metrics import init_metrics
+from request_timing import admin_required, init_request_timing, span
 from scheduler import start_scheduler
+from upload_store import init_upload_store, get_upload_store
+from model_registry import registry, resolve_model_path
 from datetime import datetime, date, timedelta, time
 import json
 import base64
-import traceback
+import logging
+from logging_config import setup_logging
 
 load_dotenv()
+setup_logging()
+logger = logging.getLogger(__name__)
 
 # Configure Flask to serve static files from the 'static' folder
 app = Flask(__name__, static_folder='static', static_url_path='')
@@ -31,6 +50,34 @@ app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# SQLite engine profile (ignored for other databases)
+app.config['SQLITE_WAL'] = os.environ.get('SQLITE_WAL', 'True') == 'True'
+app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 268435456))
+app.config['SQLITE_CACHE_SIZE_KB'] = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 20000))
+app.config['SQLITE_POOL_SIZE'] = int(os.environ.get('SQLITE_POOL_SIZE', 5))
+app.config['SQLITE_MAX_OVERFLOW'] = int(os.environ.get('SQLITE_MAX_OVERFLOW', 10))
+
+# Postgres engine profile (ignored for other databases)
+app.config['WEB_THREADS'] = int(os.environ.get('WEB_THREADS', 8))
+app.config['DB_POOL_SIZE'] = int(os.environ['DB_POOL_SIZE']) if os.environ.get('DB_POOL_SIZE') else None
+app.config['DB_BACKGROUND_CONNECTIONS'] = int(os.environ['DB_BACKGROUND_CONNECTIONS']) \
+    if os.environ.get('DB_BACKGROUND_CONNECTIONS') else None
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 0))
+app.config['DB_MAX_CONNECTIONS'] = int(os.environ['DB_MAX_CONNECTIONS']) if os.environ.get('DB_MAX_CONNECTIONS') else None
+app.config['DB_POOL_TIMEOUT'] = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+app.config['DB_POOL_PRE_PING'] = os.environ.get('DB_POOL_PRE_PING', 'True') == 'True'
+app.config['DB_CONNECT_TIMEOUT'] = int(os.environ.get('DB_CONNECT_TIMEOUT', 10))
+app.config['DB_STATEMENT_TIMEOUT_MS'] = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+app.config['DB_PGBOUNCER'] = os.environ.get('DB_PGBOUNCER', 'False') == 'True'
+
+# Single-writer queue
+app.config['DB_WRITE_QUEUE'] = os.environ.get('DB_WRITE_QUEUE', 'False') == 'True'
+app.config['DB_WRITE_QUEUE_MAX_BATCH'] = int(os.environ.get('DB_WRITE_QUEUE_MAX_BATCH', 50))
+app.config['DB_WRITE_QUEUE_MAX_WAIT_MS'] = float(os.environ.get('DB_WRITE_QUEUE_MAX_WAIT_MS', 0))
+
 # Email configuration
 app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
 app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
@@ -39,87 +86,98 @@ app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER')
 
-# Initialize database
-db.init_app(app)
+# Response compression configuration
+app.config['COMPRESS_ENABLED'] = os.environ.get('COMPRESS_ENABLED', 'True') == 'True'
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
+app.config['COMPRESS_BR_LEVEL'] = int(os.environ.get('COMPRESS_BR_LEVEL', 4))
+
+# Account export configuration
+app.config['EXPORT_BATCH_SIZE'] = int(os.environ.get('EXPORT_BATCH_SIZE', 500))
+app.config['EXPORT_CHUNK_SIZE'] = int(os.environ.get('EXPORT_CHUNK_SIZE', 65536))
+
+# Dashboard cache (seconds; 0 disables)
+app.config['DASHBOARD_CACHE_TTL'] = int(os.environ.get('DASHBOARD_CACHE_TTL', 30))
+app.config['DASHBOARD_CACHE_MAX_ENTRIES'] = int(os.environ.get('DASHBOARD_CACHE_MAX_ENTRIES', 10000))
+
+# Background scheduler (jobs that can run at once; each may hold a database connection)
+app.config['SCHEDULER_THREADS'] = int(os.environ.get('SCHEDULER_THREADS', 5))
+
+# Reminder emails (leases and claims shared by every instance)
+app.config['REMINDER_EMAIL_LEASE_SECONDS'] = int(os.environ.get('REMINDER_EMAIL_LEASE_SECONDS', 300))
+app.config['REMINDER_EMAIL_CHUNK_SIZE'] = int(os.environ.get('REMINDER_EMAIL_CHUNK_SIZE', 100))
+app.config['REMINDER_EMAIL_CLAIM_SECONDS'] = int(os.environ.get('REMINDER_EMAIL_CLAIM_SECONDS', 600))
+app.config['REMINDER_EMAIL_CATCHUP_DAYS'] = int(os.environ.get('REMINDER_EMAIL_CATCHUP_DAYS', 1))
+
+# Email outbox sender (retries with exponential backoff, then dead-letters)
+app.config['EMAIL_OUTBOX_POLL_SECONDS'] = int(os.environ.get('EMAIL_OUTBOX_POLL_SECONDS', 10))
+app.config['EMAIL_OUTBOX_BATCH_SIZE'] = int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE', 50))
+app.config['EMAIL_OUTBOX_CONCURRENCY'] = int(os.environ.get('EMAIL_OUTBOX_CONCURRENCY', 4))
+app.config['EMAIL_OUTBOX_LEASE_SECONDS'] = int(os.environ.get('EMAIL_OUTBOX_LEASE_SECONDS', 300))
+app.config['EMAIL_OUTBOX_MAX_ATTEMPTS'] = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', 8))
+app.config['EMAIL_OUTBOX_BACKOFF_SECONDS'] = int(os.environ.get('EMAIL_OUTBOX_BACKOFF_SECONDS', 30))
+app.config['EMAIL_OUTBOX_BACKOFF_MAX_SECONDS'] = int(os.environ.get('EMAIL_OUTBOX_BACKOFF_MAX_SECONDS', 3600))
+app.config['EMAIL_OUTBOX_RETENTION_DAYS'] = int(os.environ.get('EMAIL_OUTBOX_RETENTION_DAYS', 7))
+
+# Population analytics rollups (refreshed by the scheduler)
+app.config['ANALYTICS_REFRESH_MINUTES'] = int(os.environ.get('ANALYTICS_REFRESH_MINUTES', 15))
+app.config['ANALYTICS_SETTLE_SECONDS'] = int(os.environ.get('ANALYTICS_SETTLE_SECONDS', 60))
+
+# Upload store (content-addressed checkup images)
+app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', 'uploads')
+app.config['UPLOAD_GC_INTERVAL_HOURS'] = int(os.environ.get('UPLOAD_GC_INTERVAL_HOURS', 24))
+app.config['UPLOAD_GC_GRACE_SECONDS'] = int(os.environ.get('UPLOAD_GC_GRACE_SECONDS', 3600))
+
+# Model hot reloads (POST /api/admin/model/reload)
+app.config['MODEL_WARMUP_IMAGES'] = int(os.environ.get('MODEL_WARMUP_IMAGES', 8))
+app.config['MODEL_DRAIN_TIMEOUT'] = int(os.environ.get('MODEL_DRAIN_TIMEOUT', 30))
+
+# Stateless JWT authentication (signed with SECRET_KEY unless an RSA key pair is given)
+app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY') or app.config['SECRET_KEY']
+app.config['JWT_PRIVATE_KEY_FILE'] = os.environ.get('JWT_PRIVATE_KEY_FILE')
+app.config['JWT_PUBLIC_KEY_FILE'] = os.environ.get('JWT_PUBLIC_KEY_FILE')
+app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=int(os.environ.get('JWT_ACCESS_TOKEN_HOURS', 168)))
+app.config['JWT_COOKIE_SECURE'] = os.environ.get('JWT_COOKIE_SECURE', 'False') == 'True'
+app.config['JWT_COOKIE_CSRF_PROTECT'] = os.environ.get('JWT_COOKIE_CSRF_PROTECT', 'True') == 'True'
+app.config['JWT_DENYLIST_SYNC_SECONDS'] = int(os.environ.get('JWT_DENYLIST_SYNC_SECONDS', 5))
+
+# Request timing configuration
+app.config['SERVER_TIMING_ENABLED'] = os.environ.get('SERVER_TIMING_ENABLED', 'False') == 'True'
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+
+# Initialize database with its engine profile
+init_engine(app)
+
+# Initialize the single-writer queue (DB_WRITE_QUEUE)
+init_write_queue(app)
+
+# Initialize the per-user dashboard cache
+init_dashboard_cache(app)
 
 # Initialize email service
 init_mail(app)
 
-# Create uploads directory
-UPLOAD_FOLDER = 'uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+# Initialize response compression
+init_compression(app)
 
-# Helper decorator to check if user is logged in
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            return jsonify({'error': 'Authentication required'}), 401
-        return f(*args, **kwargs)
-    return decorated_function
+# Initialize Prometheus metrics (/metrics, for scrapers on these networks or with X-Admin-Token)
+app.config['METRICS_ALLOWED_NETWORKS'] = os.environ.get('METRICS_ALLOWED_NETWORKS', '127.0.0.1/32,::1/128')
+init_metrics(app)
 
-@app.route('/api/register', methods=['POST'])
-def register():
-    data = request.get_json()
-    
-    if not data or not data.get('email') or not data.get('password') or not data.get('username'):
-        return jsonify({'error': 'Missing required fields'}), 400
-    
-    if User.query.filter_by(email=data['email']).first():
-        return jsonify({'error': 'Email already exists'}), 400
-    
-    if User.query.filter_by(username=data['username']).first():
-        return jsonify({'error': 'Username already exists'}), 400
-    
-    hashed_password = generate_password_hash(data['password'])
-    
-    user = User(
-        username=data['username'],
-        email=data['email'],
-        password=hashed_password
-    )
-    
-    db.session.add(user)
-    db.session.commit()
-    
-    return jsonify({'message': 'User created successfully'}), 201
+# Initialize Server-Timing headers and on-demand profiling
+init_request_timing(app)
 
-@app.route('/api/login', methods=['POST'])
-def login():
-    data = request.get_json()
-    
-    if not data or not data.get('email') or not data.get('password'):
-        return jsonify({'error': 'Missing email or password'}), 400
-    
-    user = User.query.filter_by(email=data['email']).first()
-    
-    if not user or not check_password_hash(user.password, data['password']):
-        return jsonify({'error': 'Invalid credentials'}), 401
-    
-    # Store user info in session
-    session['user_id'] = user.id
-    session['username'] = user.username
-    session['email'] = user.email
-    
-    return jsonify({
-        'message': 'Login successful',
-        'user': {
-            'id': user.id,
-            'username': user.username,
-            'email': user.email
-        }
-    }), 200
+# Initialize the content-addressed upload store (creates UPLOAD_FOLDER)
+init_upload_store(app)
+UPLOAD_FOLDER = app.config['UPLOAD_FOLDER']
 
-@app.route('/api/logout', methods=['POST'])
-def logout():
-    session.clear()
-    return jsonify({'message': 'Logout successful'}), 200
+# Initialize stateless token authentication (/api/register, /api/login, /api/logout, /api/check-auth)
+init_auth(app)
 
 @app.route('/api/profile', methods=['GET'])
 @login_required
 def get_profile():
-    user_id = session['user_id']
+    user_id = current_user_id()
     user = User.query.get(user_id)
     
     if not user:
@@ -129,13 +187,52 @@ def get_profile():
         'id': user.id,
         'username': user.username,
         'email': user.email,
-        'created_at': user.created_at.isoformat()
+        'created_at': user.created_at.isoformat(),
+        'reminder_digest': user.reminder_digest
     }), 200
 
+@app.route('/api/profile', methods=['PUT'])
+@login_required
+def update_profile():
+    """Update notification preferences"""
+    user_id = current_user_id()
+    data = request.get_json(silent=True) or {}
+    
+    if not isinstance(data.get('reminder_digest'), bool):
+        return jsonify({'error': 'reminder_digest must be true or false'}), 400
+    
+    reminder_digest = data['reminder_digest']
+    updated = run_write(lambda db_session: db_session.query(User)
+                        .filter_by(id=user_id)
+                        .update({'reminder_digest': reminder_digest}))
+    if not updated:
+        return jsonify({'error': 'User not found'}), 404
+    
+    return jsonify({'message': 'Profile updated', 'reminder_digest': reminder_digest}), 200
+
+@app.route('/api/export', methods=['GET'])
+@login_required
+def export_account():
+    """Stream a zip of all the user's habits, reminders, checkups and images"""
+    user_id = current_user_id()
+    filename = f"dental-tracker-export-{date.today().isoformat()}.zip"
+    
+    archive = generate_account_export(
+        user_id,
+        UPLOAD_FOLDER,
+        batch_size=app.config['EXPORT_BATCH_SIZE'],
+        chunk_size=app.config['EXPORT_CHUNK_SIZE']
+    )
+    return Response(
+        stream_with_context(archive),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
 @app.route('/api/habits/today', methods=['GET', 'POST'])
 @login_required
 def handle_today_habit():
-    user_id = session['user_id']
+    user_id = current_user_id()
     today = date.today()
     
     if request.method == 'GET':
@@ -157,76 +254,90 @@ def handle_today_habit():
             }), 200
     
     elif request.method == 'POST':
-        data = request.get_json()
-        
-        habit = DailyHabit.query.filter_by(user_id=user_id, date=today).first()
+        data = request.get_json() or {}
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Expected a JSON object'}), 400
         
-        if not habit:
-            habit = DailyHabit(user_id=user_id, date=today)
+        fields, error = parse_habit_fields(data)
+        if error:
+            return jsonify({'error': error}), 400
         
-        if 'brushed' in data:
-            habit.brushed = data['brushed']
-        if 'flossed' in data:
-            habit.flossed = data['flossed']
-        if 'brushing_time' in data:
-            habit.brushing_time = data['brushing_time']
+        # Native upsert: no SELECT-then-INSERT race on unique_daily_habit
+        row = {'date': today, 'updated_at': datetime.utcnow(), **fields}
         
-        db.session.add(habit)
-        db.session.commit()
+        run_write(lambda db_session: upsert_habits(db_session, user_id, [row]))
+        invalidate_dashboard(user_id)
         
         return jsonify({'message': 'Habit updated successfully'}), 200
 
-@app.route('/api/habits/streak', methods=['GET'])
+@app.route('/api/habits/sync', methods=['POST'])
 @login_required
-def get_streak():
-    user_id = session['user_id']
+def sync_habits():
+    """
+    Batch upsert of habits recorded offline. Each entry is
+    {date, brushed?, flossed?, brushing_time?, updated_at?}; a day is only
+    overwritten by an entry at least as new as the stored one.
+    """
+    user_id = current_user_id()
+    data = request.get_json() or {}
+    entries = data.get('entries') if isinstance(data, dict) else None
     
-    # Get all habits sorted by date
-    habits = DailyHabit.query.filter_by(user_id=user_id)\
-        .order_by(DailyHabit.date.desc()).all()
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'error': 'entries must be a non-empty list'}), 400
+    if len(entries) > MAX_SYNC_ENTRIES:
+        return jsonify({'error': f'At most {MAX_SYNC_ENTRIES} entries per sync'}), 400
     
-    current_streak = 0
-    last_date = date.today()
+    now = datetime.utcnow()
+    rows = []
+    for index, entry in enumerate(entries):
+        row, error = parse_sync_entry(entry, now)
+        if error:
+            return jsonify({'error': f'Entry {index}: {error}'}), 400
+        rows.append(row)
     
-    for habit in habits:
-        if habit.brushed and habit.date == last_date:
-            current_streak += 1
-            last_date = habit.date - timedelta(days=1)
-        else:
-            break
-    
-    # Calculate consistency over last 30 days
-    thirty_days_ago = date.today() - timedelta(days=30)
-    recent_habits = [h for h in habits if h.date >= thirty_days_ago]
-    
-    # Calculate percentage based on 30 days, not number of records
-    if recent_habits:
-        brushed_days = len([h for h in recent_habits if h.brushed])
-        flossed_days = len([h for h in recent_habits if h.flossed])
-        # Divide by 30 to get true percentage (not by len(recent_habits))
-        brushing_consistency = (brushed_days / 30) * 100
-        flossing_consistency = (flossed_days / 30) * 100
-    else:
-        brushing_consistency = 0
-        flossing_consistency = 0
+    applied = run_write(lambda db_session: upsert_habits(db_session, user_id, rows))
+    invalidate_dashboard(user_id)
     
-    # Calculate average brushing time
-    brushing_times = [h.brushing_time for h in habits if h.brushing_time]
-    avg_brushing_time = sum(brushing_times) / len(brushing_times) if brushing_times else 0
+    # Return the merged server state so the client can reconcile
+    dates = sorted({row['date'] for row in rows})
+    habits = DailyHabit.query.filter(
+        DailyHabit.user_id == user_id,
+        DailyHabit.date.in_(dates)
+    ).order_by(DailyHabit.date).all()
     
     return jsonify({
-        'current_streak': current_streak,
-        'longest_streak': max([current_streak, 0]),
-        'brushing_consistency': round(brushing_consistency, 1),
-        'flossing_consistency': round(flossing_consistency, 1),
-        'avg_brushing_time': round(avg_brushing_time, 1),
-        'total_tracked_days': len(habits)
+        'received': len(entries),
+        'applied': applied,
+        'skipped': len(entries) - applied,
+        'habits': [{
+            'date': habit.date.isoformat(),
+            'brushed': habit.brushed,
+            'flossed': habit.flossed,
+            'brushing_time': habit.brushing_time,
+            'updated_at': habit.updated_at.isoformat() if habit.updated_at else None
+        } for habit in habits]
     }), 200
 
+@app.route('/api/habits/streak', methods=['GET'])
+@login_required
+def get_streak():
+    user_id = current_user_id()
+    return jsonify(streak_stats(user_id)), 200
+
+@app.route('/api/dashboard', methods=['GET'])
+@login_required
+def get_dashboard_summary():
+    """
+    Today's habit, streak stats, the last week of history, today's open
+    reminders and the latest checkup summary in one response
+    """
+    user_id = current_user_id()
+    return jsonify(get_dashboard(user_id)), 200
+
 @app.route('/api/habits/history', methods=['GET'])
 @login_required
 def get_habits_history():
-    user_id = session['user_id']
+    user_id = current_user_id()
     days = request.args.get('days', default=7, type=int)
     
     start_date = date.today() - timedelta(days=days)
@@ -246,40 +357,66 @@ def get_habits_history():
     
     return jsonify({'history': history}), 200
 
+@app.route('/api/habits/calendar', methods=['GET'])
+@login_required
+def get_habits_calendar():
+    """
+    Brushed/flossed days as base64 bitmaps and brushing times run-length
+    encoded, for heatmaps and year views. Defaults to the last 365 days.
+    """
+    user_id = current_user_id()
+    
+    try:
+        end_date = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if 'end' in request.args else date.today()
+        start_date = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if 'start' in request.args \
+            else end_date - timedelta(days=364)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+    
+    if start_date > end_date:
+        return jsonify({'error': 'start must be on or before end'}), 400
+    if (end_date - start_date).days + 1 > MAX_CALENDAR_DAYS:
+        return jsonify({'error': f'Range is limited to {MAX_CALENDAR_DAYS} days'}), 400
+    
+    # Plain column rows, no ORM objects
+    rows = db.session.query(
+        DailyHabit.date, DailyHabit.brushed, DailyHabit.flossed, DailyHabit.brushing_time
+    ).filter(
+        DailyHabit.user_id == user_id,
+        DailyHabit.date >= start_date,
+        DailyHabit.date <= end_date
+    ).all()
+    
+    return jsonify(encode_habit_calendar(rows, start_date, end_date)), 200
+
 @app.route('/api/ai-checkup', methods=['POST'])
 @login_required
 def ai_checkup():
-    user_id = session['user_id']
+    user_id = current_user_id()
     
     if 'image' not in request.files and 'image' not in request.json:
         return jsonify({'error': 'No image provided'}), 400
     
     try:
         # Handle image upload
-        if 'image' in request.files:
-            image_file = request.files['image']
-            filename = f"checkup_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-            filepath = os.path.join(UPLOAD_FOLDER, filename)
-            image_file.save(filepath)
-            
-            with open(filepath, 'rb') as f:
-                image_data = f.read()
-        else:
-            image_data = base64.b64decode(request.json['image'].split(',')[1])
-            filename = f"checkup_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-            filepath = os.path.join(UPLOAD_FOLDER, filename)
+        with span('upload'):
+            if 'image' in request.files:
+                image_data = request.files['image'].read()
+            else:
+                image_data = base64.b64decode(request.json['image'].split(',')[1])
             
-            with open(filepath, 'wb') as f:
-                f.write(image_data)
+            # Stored by content hash; identical uploads share one file
+            image_sha256, filepath = get_upload_store().put(image_data)
         
         # Analyze image with the model
-        print("Analyzing image with AI model...")
+        logger.debug("Analyzing image with AI model...")
         model_results = ai_service.analyze_dental_image(image_data)
         
         # Get user's habits
-        habits = DailyHabit.query.filter_by(user_id=user_id)\
-            .order_by(DailyHabit.date.desc())\
-            .limit(30).all()
+        with span('habits_query'):
+            habits = DailyHabit.query.filter_by(user_id=user_id)\
+                .order_by(DailyHabit.date.desc())\
+                .limit(30).all()
         
         # Calculate habits data
         habits_data = {
@@ -300,6 +437,7 @@ def ai_checkup():
         analysis_response = {
             'model_loaded': model_results.get('model_loaded', False),
             'detected_conditions': model_results.get('detected_conditions', []),
+            'class_probabilities': class_probabilities(model_results),
             'overall_health_score': model_results.get('analysis', {}).get('overall_health_score', 8.0),
             'plaque_detected': model_results.get('analysis', {}).get('plaque_detected', False),
             'gingivitis_risk': model_results.get('analysis', {}).get('gingivitis_risk', 'low'),
@@ -311,40 +449,51 @@ def ai_checkup():
             'requires_dentist_visit': model_results.get('analysis', {}).get('requires_dentist_visit', False),
             'urgency': model_results.get('analysis', {}).get('urgency', 'none'),
             'analysis_timestamp': model_results.get('analysis_timestamp', datetime.now().isoformat()),
-            'model_used': model_results.get('model_used', 'Unknown')
+            'model_used': model_results.get('model_used', 'Unknown'),
+            'model_version': model_results.get('model_version')
         }
         
-        # Save to database
-        checkup = AICheckup(
-            user_id=user_id,
-            image_path=filepath,
-            analysis_result=json.dumps(analysis_response),
-            ai_recommendations=ai_recommendations
-        )
+        # Save to database, with the score and conditions typed for trend queries
+        health_score, conditions = typed_columns(analysis_response)
         
-        db.session.add(checkup)
-        db.session.commit()
+        def save_checkup(db_session):
+            checkup = AICheckup(
+                user_id=user_id,
+                image_path=filepath,
+                image_sha256=image_sha256,
+                analysis_result=json.dumps(analysis_response),
+                ai_recommendations=ai_recommendations,
+                health_score=health_score,
+                model_version=analysis_response['model_version']
+            )
+            db_session.add(checkup)
+            db_session.flush()
+            db_session.add_all(condition_rows(checkup, conditions))
+            return checkup.id, checkup.created_at
+        
+        with span('db_commit'):
+            checkup_id, created_at = run_write(save_checkup)
+        invalidate_dashboard(user_id)
         
         response_data = {
             'analysis': analysis_response,
             'recommendations': ai_recommendations,
-            'checkup_id': checkup.id,
-            'timestamp': checkup.created_at.isoformat()
+            'checkup_id': checkup_id,
+            'timestamp': created_at.isoformat()
         }
         
-        print(f"Analysis complete. Conditions detected: {len(analysis_response['detected_conditions'])}")
+        logger.info("Analysis complete. Conditions detected: %d", len(analysis_response['detected_conditions']))
         
         return jsonify(response_data), 200
         
     except Exception as e:
-        print(f"Error in AI checkup: {str(e)}")
-        traceback.print_exc()
+        logger.error("Error in AI checkup: %s", e, exc_info=True)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/ai-checkup/history', methods=['GET'])
 @login_required
 def get_checkup_history():
-    user_id = session['user_id']
+    user_id = current_user_id()
     
     checkups = AICheckup.query.filter_by(user_id=user_id)\
         .order_by(AICheckup.created_at.desc())\
@@ -371,10 +520,41 @@ def get_checkup_history():
     
     return jsonify({'history': history}), 200
 
+@app.route('/api/ai-checkup/trend', methods=['GET'])
+@login_required
+def get_checkup_trend():
+    """
+    Health score and per-condition confidence as min/avg/max per day, week or
+    month. Query: bucket=day|week|month, start, end (default: the last year),
+    conditions=Caries,Gingivitis to limit the condition series.
+    """
+    user_id = current_user_id()
+    bucket = request.args.get('bucket', 'week')
+    
+    if bucket not in BUCKETS:
+        return jsonify({'error': f"Invalid bucket. Must be one of {', '.join(BUCKETS)}"}), 400
+    
+    try:
+        end_date = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if 'end' in request.args else date.today()
+        start_date = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if 'start' in request.args \
+            else end_date - timedelta(days=364)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+    
+    if start_date > end_date:
+        return jsonify({'error': 'start must be on or before end'}), 400
+    if ((end_date - start_date).days + 1) / BUCKET_DAYS[bucket] > MAX_TREND_POINTS:
+        return jsonify({'error': f'Range is limited to {MAX_TREND_POINTS} {bucket} buckets'}), 400
+    
+    conditions = [name for name in request.args['conditions'].split(',') if name] \
+        if request.args.get('conditions') else None
+    
+    return jsonify(build_trend(user_id, bucket, start_date, end_date, conditions)), 200
+
 @app.route('/api/ai-checkup/<int:checkup_id>', methods=['GET'])
 @login_required
 def get_checkup_details(checkup_id):
-    user_id = session['user_id']
+    user_id = current_user_id()
     
     checkup = AICheckup.query.filter_by(id=checkup_id, user_id=user_id).first()
     
@@ -397,14 +577,16 @@ def get_checkup_details(checkup_id):
 def model_health():
     """Check the health and status of the AI model"""
     try:
-        from model_integration import get_dental_model
-        
-        model = get_dental_model()
+        handle = registry.active()
+        model = handle.model
         
         health_status = {
             'model_loaded': model.model_loaded,
+            'model_version': handle.version,
+            'loaded_at': handle.loaded_at.isoformat(),
             'class_names': model.class_names,
-            'display_names': model.display_names,
+            'backend': model.backend_name,
+            'thread_config': model.thread_config,
             'timestamp': datetime.now().isoformat(),
             'status': 'healthy' if model.model_loaded else 'using_mock_data',
             'message': 'Model is ready for predictions' if model.model_loaded else 'Using mock data - model file not found'
@@ -415,96 +597,11 @@ def model_health():
     except Exception as e:
         return jsonify({'error': str(e), 'status': 'error'}), 500
 
-@app.route('/api/test-model', methods=['GET'])
-def test_model():
-    """Test endpoint to check if the model is working"""
-    try:
-        import numpy as np
-        from PIL import Image
-        from model_integration import get_dental_model
-        
-        print("\n🔍 TESTING MODEL ENDPOINT")
-        print("=" * 50)
-        
-        model = get_dental_model()
-        
-        # Create a dummy image for testing
-        dummy_image = np.random.randint(0, 255, (224, 224, 3), dtype=np.uint8)
-        pil_image = Image.fromarray(dummy_image)
-        
-        print(f"\nModel loaded: {model.model_loaded}")
-        print(f"Class names: {model.class_names}")
-        print(f"Display names: {model.display_names}")
-        
-        # Test prediction with different thresholds
-        print("\nTesting with 70% confidence threshold:")
-        result_70 = model.predict(pil_image, confidence_threshold=0.7)
-        
-        print("\nTesting with 50% confidence threshold:")
-        result_50 = model.predict(pil_image, confidence_threshold=0.5)
-        
-        response_data = {
-            'model_info': {
-                'loaded': model.model_loaded,
-                'class_names': model.class_names,
-                'display_names': model.display_names
-            },
-            'test_predictions_70_threshold': {
-                'detected_conditions': result_70.get('detected_conditions', []),
-                'model_confidence': result_70.get('model_confidence', 0),
-                'overall_health_score': result_70.get('overall_health_score', 0),
-                'confidence_scores': result_70.get('confidence_scores', {})
-            },
-            'test_predictions_50_threshold': {
-                'detected_conditions': result_50.get('detected_conditions', []),
-                'model_confidence': result_50.get('model_confidence', 0),
-                'overall_health_score': result_50.get('overall_health_score', 0),
-                'confidence_scores': result_50.get('confidence_scores', {})
-            },
-            'notes': 'This is a test with a random image. Real predictions will vary.'
-        }
-        
-        print(f"\nResult with 70% threshold:")
-        print(f"  Confidence: {result_70.get('model_confidence', 0):.2%}")
-        print(f"  Detected conditions: {result_70.get('detected_conditions', [])}")
-        print(f"  Health score: {result_70.get('overall_health_score', 0)}/10")
-        
-        print(f"\nResult with 50% threshold:")
-        print(f"  Confidence: {result_50.get('model_confidence', 0):.2%}")
-        print(f"  Detected conditions: {result_50.get('detected_conditions', [])}")
-        print(f"  Health score: {result_50.get('overall_health_score', 0)}/10")
-        
-        print("\n✅ Test completed successfully")
-        print("=" * 50)
-        
-        return jsonify(response_data), 200
-        
-    except Exception as e:
-        print(f"\n❌ ERROR in test model: {str(e)}")
-        traceback.print_exc()
-        return jsonify({'error': str(e), 'details': 'Check server logs'}), 500
-
-@app.route('/api/check-auth', methods=['GET'])
-def check_auth():
-    if 'user_id' in session:
-        user = User.query.get(session['user_id'])
-        if user:
-            return jsonify({
-                'authenticated': True,
-                'user': {
-                    'id': user.id,
-                    'username': user.username,
-                    'email': user.email
-                }
-            }), 200
-    
-    return jsonify({'authenticated': False}), 200
-
 # Reminder API endpoints
 @app.route('/api/reminders', methods=['GET', 'POST', 'DELETE'])
 @login_required
 def handle_reminders():
-    user_id = session['user_id']
+    user_id = current_user_id()
     
     if request.method == 'GET':
         reminders = Reminder.query.filter_by(user_id=user_id)\
@@ -548,21 +645,18 @@ def handle_reminders():
             except ValueError:
                 return jsonify({'error': 'Invalid time format. Use HH:MM'}), 400
         
-        reminder = Reminder(
-            user_id=user_id,
-            type=data['type'],
-            title=data['title'],
-            description=data.get('description', ''),
-            date=reminder_date,
-            time=reminder_time,
-            frequency_days=data.get('frequency_days'),
-            pill_count=data.get('pill_count')
-        )
-        
-        db.session.add(reminder)
+        fields = {
+            'user_id': user_id,
+            'type': data['type'],
+            'title': data['title'],
+            'description': data.get('description', ''),
+            'time': reminder_time,
+            'frequency_days': data.get('frequency_days'),
+            'pill_count': data.get('pill_count')
+        }
         
         # If this is a recurring medication, create additional reminder instances
-        created_reminders = [reminder]
+        dates = [reminder_date]
         if data['type'] == 'medication' and data.get('frequency_days') and data.get('pill_count'):
             try:
                 frequency_days = int(data['frequency_days'])
@@ -572,27 +666,16 @@ def handle_reminders():
                     current_date = reminder_date
                     for i in range(pill_count - 1):  # Create pill_count total reminders
                         current_date = current_date + timedelta(days=frequency_days)
-                        recurring_reminder = Reminder(
-                            user_id=user_id,
-                            type=data['type'],
-                            title=data['title'],
-                            description=data.get('description', ''),
-                            date=current_date,
-                            time=reminder_time,
-                            frequency_days=data.get('frequency_days'),
-                            pill_count=data.get('pill_count')
-                        )
-                        db.session.add(recurring_reminder)
-                        created_reminders.append(recurring_reminder)
+                        dates.append(current_date)
             except (ValueError, TypeError):
                 pass  # If values are invalid, just create the single reminder
         
-        db.session.commit()
-        
-        return jsonify({
-            'message': f'Reminder{"s" if len(created_reminders) > 1 else ""} created successfully',
-            'count': len(created_reminders),
-            'reminder': {
+        def create_reminders(db_session):
+            created_reminders = [Reminder(date=day, **fields) for day in dates]
+            db_session.add_all(created_reminders)
+            db_session.flush()
+            reminder = created_reminders[0]
+            return {
                 'id': reminder.id,
                 'type': reminder.type,
                 'title': reminder.title,
@@ -603,40 +686,49 @@ def handle_reminders():
                 'frequency_days': reminder.frequency_days,
                 'pill_count': reminder.pill_count
             }
+        
+        reminder = run_write(create_reminders)
+        invalidate_dashboard(user_id)
+        
+        return jsonify({
+            'message': f'Reminder{"s" if len(dates) > 1 else ""} created successfully',
+            'count': len(dates),
+            'reminder': reminder
         }), 201
     
     elif request.method == 'DELETE':
         # Clear all reminders for the user
         try:
-            deleted_count = Reminder.query.filter_by(user_id=user_id).delete()
-            db.session.commit()
+            deleted_count = run_write(lambda db_session: db_session.query(Reminder)
+                                      .filter_by(user_id=user_id).delete())
+            invalidate_dashboard(user_id)
             return jsonify({
                 'message': f'{deleted_count} reminders deleted successfully',
                 'count': deleted_count
             }), 200
         except Exception as e:
-            db.session.rollback()
             return jsonify({'error': str(e)}), 500
 
 # Clear all reminders - using separate path to avoid route conflicts
 @app.route('/api/clear-reminders', methods=['POST', 'DELETE'])
 @login_required
-def clear_all_reminders(user_id):
+def clear_all_reminders():
+    user_id = current_user_id()
     try:
-        deleted_count = Reminder.query.filter_by(user_id=user_id).delete()
-        db.session.commit()
+        deleted_count = run_write(lambda db_session: db_session.query(Reminder)
+                                  .filter_by(user_id=user_id).delete())
+        invalidate_dashboard(user_id)
         return jsonify({
             'message': f'{deleted_count} reminders deleted successfully',
             'count': deleted_count
         }), 200
     except Exception as e:
-        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/reminders/<int:reminder_id>', methods=['GET', 'PUT', 'DELETE'])
 @login_required
 def handle_reminder(reminder_id):
-    user_id = session['user_id']
+    user_id = current_user_id()
     reminder = Reminder.query.filter_by(id=reminder_id, user_id=user_id).first()
     
     if not reminder:
@@ -662,37 +754,41 @@ def handle_reminder(reminder_id):
         if data.get('type') and data['type'] not in ['appointment', 'medication']:
             return jsonify({'error': 'Invalid type. Must be "appointment" or "medication"'}), 400
         
+        changes = {}
         if data.get('type'):
-            reminder.type = data['type']
+            changes['type'] = data['type']
         if data.get('title'):
-            reminder.title = data['title']
+            changes['title'] = data['title']
         if 'description' in data:
-            reminder.description = data['description']
+            changes['description'] = data['description']
         if data.get('date'):
             try:
-                reminder.date = datetime.strptime(data['date'], '%Y-%m-%d').date()
+                changes['date'] = datetime.strptime(data['date'], '%Y-%m-%d').date()
             except ValueError:
                 return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
         if 'time' in data:
             if data['time']:
                 try:
-                    reminder.time = datetime.strptime(data['time'], '%H:%M').time()
+                    changes['time'] = datetime.strptime(data['time'], '%H:%M').time()
                 except ValueError:
                     return jsonify({'error': 'Invalid time format. Use HH:MM'}), 400
             else:
-                reminder.time = None
+                changes['time'] = None
         if 'completed' in data:
-            reminder.completed = bool(data['completed'])
+            changes['completed'] = bool(data['completed'])
         if 'frequency_days' in data:
-            reminder.frequency_days = data['frequency_days']
+            changes['frequency_days'] = data['frequency_days']
         if 'pill_count' in data:
-            reminder.pill_count = data['pill_count']
-        
-        db.session.commit()
+            changes['pill_count'] = data['pill_count']
         
-        return jsonify({
-            'message': 'Reminder updated successfully',
-            'reminder': {
+        def update_reminder(db_session):
+            reminder = db_session.query(Reminder).filter_by(id=reminder_id, user_id=user_id).first()
+            if not reminder:
+                return None
+            for field, value in changes.items():
+                setattr(reminder, field, value)
+            db_session.flush()
+            return {
                 'id': reminder.id,
                 'type': reminder.type,
                 'title': reminder.title,
@@ -703,17 +799,80 @@ def handle_reminder(reminder_id):
                 'frequency_days': reminder.frequency_days,
                 'pill_count': reminder.pill_count
             }
+        
+        updated = run_write(update_reminder)
+        if not updated:
+            return jsonify({'error': 'Reminder not found'}), 404
+        invalidate_dashboard(user_id)
+        
+        return jsonify({
+            'message': 'Reminder updated successfully',
+            'reminder': updated
         }), 200
     
     elif request.method == 'DELETE':
-        db.session.delete(reminder)
-        db.session.commit()
+        run_write(lambda db_session: db_session.query(Reminder)
+                  .filter_by(id=reminder_id, user_id=user_id).delete())
+        invalidate_dashboard(user_id)
         return jsonify({'message': 'Reminder deleted successfully'}), 200
 
+@app.route('/api/reminders/bulk', methods=['POST'])
+@login_required
+def bulk_reminders():
+    """
+    Apply complete, snooze, update or delete to reminders selected by
+    {"ids": [...]} or {"filter": {type, title, date_from, date_to, completed}}
+    as one set-based statement.
+    """
+    user_id = current_user_id()
+    data = request.get_json() or {}
+    
+    try:
+        statement = bulk_statement(db.engine.dialect.name, user_id, data)
+    except BulkRequestError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    affected = run_write(lambda db_session: db_session.execute(statement).rowcount)
+    invalidate_dashboard(user_id)
+    
+    response = {'action': data['action'], 'affected': affected}
+    if 'ids' in data:
+        # Ids owned by other users count as not found
+        response['not_found'] = len(set(data['ids'])) - affected
+    return jsonify(response), 200
+
+@app.route('/api/calendar', methods=['GET'])
+@login_required
+def get_calendar_window():
+    """
+    Per-day reminders, habit status and checkup markers for a date window,
+    given as ?start=&end= or ?month=YYYY-MM (defaults to the current month)
+    """
+    user_id = current_user_id()
+    
+    try:
+        if 'start' in request.args or 'end' in request.args:
+            start_date = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+            end_date = datetime.strptime(request.args.get('end', ''), '%Y-%m-%d').date()
+        else:
+            month = datetime.strptime(request.args['month'], '%Y-%m').date() if 'month' in request.args \
+                else date.today().replace(day=1)
+            start_date = month.replace(day=1)
+            end_date = (start_date + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    except ValueError:
+        return jsonify({'error': 'Use start=YYYY-MM-DD&end=YYYY-MM-DD or month=YYYY-MM'}), 400
+    
+    if start_date > end_date:
+        return jsonify({'error': 'start must be on or before end'}), 400
+    if (end_date - start_date).days + 1 > MAX_WINDOW_DAYS:
+        return jsonify({'error': f'Window is limited to {MAX_WINDOW_DAYS} days'}), 400
+    
+    return jsonify(build_calendar_window(user_id, start_date, end_date)), 200
+
 @app.route('/api/reminders/upcoming', methods=['GET'])
 @login_required
 def get_upcoming_reminders():
-    user_id = session['user_id']
+    user_id = current_user_id()
     days = request.args.get('days', default=7, type=int)
     
     end_date = date.today() + timedelta(days=days)
@@ -741,6 +900,93 @@ def get_upcoming_reminders():
     
     return jsonify({'reminders': result}), 200
 
+@app.route('/api/admin/analytics', methods=['GET'])
+@admin_required
+def get_population_analytics():
+    """
+    Health-score distribution, condition prevalence and brushing/flossing
+    consistency across all users, from the rollup tables. Checkup figures
+    cover start..end (default: the last 30 days); habit figures are always
+    the last 30 days as of the latest refresh.
+    """
+    try:
+        end_date = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if 'end' in request.args else date.today()
+        start_date = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if 'start' in request.args \
+            else end_date - timedelta(days=29)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+    
+    if start_date > end_date:
+        return jsonify({'error': 'start must be on or before end'}), 400
+    
+    return jsonify(population_summary(start_date, end_date)), 200
+
+@app.route('/api/admin/analytics/refresh', methods=['POST'])
+@admin_required
+def refresh_population_analytics():
+    """Bring the analytics rollups up to date now instead of on the next scheduled run"""
+    result = refresh_rollups(settle_seconds=app.config['ANALYTICS_SETTLE_SECONDS'])
+    return jsonify(result), 200
+
+@app.route('/api/admin/email-outbox', methods=['GET'])
+@admin_required
+def get_email_outbox():
+    """Queued, sent and dead-lettered email counts, with the latest dead letters"""
+    return jsonify(outbox_summary()), 200
+
+@app.route('/api/admin/email-outbox/retry', methods=['POST'])
+@admin_required
+def retry_email_outbox():
+    """Give dead-lettered emails (all, or {"ids": [...]}) a fresh set of attempts"""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, int) for i in ids)):
+        return jsonify({'error': 'ids must be a list of integers'}), 400
+    
+    return jsonify({'requeued': retry_dead_letters(ids)}), 200
+
+@app.route('/api/admin/model/reload', methods=['POST'])
+@admin_required
+def reload_model():
+    """
+    Load a model (default: the configured one) next to the active one, warm
+    it with sample uploads, swap it in and drain the old one. Runs in the
+    background unless wait is true; either way the report gives the time
+    spent in each phase.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        model_path = resolve_model_path(data.get('model_path'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    options = {
+        'model_path': model_path,
+        'backend': data.get('backend'),
+        'version': data.get('version'),
+        'warmup_images': app.config['MODEL_WARMUP_IMAGES'],
+        'warmup_dir': UPLOAD_FOLDER,
+        'drain_timeout': app.config['MODEL_DRAIN_TIMEOUT']
+    }
+    try:
+        if data.get('wait'):
+            report = registry.reload(**options)
+            return jsonify(report), 200 if report['status'] == 'done' else 500
+        report = registry.reload_in_background(**options)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    
+    return jsonify(report), 202
+
+@app.route('/api/admin/model/reload', methods=['GET'])
+@admin_required
+def get_model_reload():
+    """Report of the latest model reload"""
+    return jsonify({
+        'active_version': registry.active().version,
+        'last_reload': registry.last_reload
+    }), 200
+
 @app.route('/api/test', methods=['GET'])
 def test():
     return jsonify({'message': 'Backend is working!'}), 200
@@ -768,9 +1014,9 @@ if __name__ == '__main__':
     # Start email reminder scheduler
     try:
         start_scheduler(app)
-        print("✓ Email reminder scheduler initialized")
+        logger.info("✓ Email reminder scheduler initialized")
     except Exception as e:
-        print(f"Warning: Could not start scheduler: {str(e)}")
+        logger.warning("Could not start scheduler: %s", e)
     
     # Get port from environment variable for Railway deployment
     port = int(os.environ.get('PORT', 5000))
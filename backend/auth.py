@@ -1,69 +1,272 @@
+"""
+Stateless authentication with JSON Web Tokens.
+
+Login issues a signed access token carrying the user id and a unique jti.
+Browsers get it in an HttpOnly cookie (with a double-submit CSRF token for
+writes). API clients log in with {"bearer": true} to get the token in the
+response body instead, and send it as "Authorization: Bearer <token>". Every
+request is verified locally against a key loaded once at startup, so any
+instance can serve any user with no session store and no database lookup.
+Tokens are signed with JWT_SECRET_KEY (default SECRET_KEY), or with an
+RSA key pair when JWT_PRIVATE_KEY_FILE / JWT_PUBLIC_KEY_FILE are set, in
+which case instances that only verify need just the public key.
+
+Logout revokes the token's jti. Revocations are written to the
+revoked_token table and kept in memory by each instance as a map of
+16-byte jti to expiry, pruned as tokens expire, so it holds only the
+tokens revoked within one token lifetime. Each instance picks up
+revocations made elsewhere at most every JWT_DENYLIST_SYNC_SECONDS, with
+one indexed query, never per request.
+"""
 from flask import Blueprint, request, jsonify
-from flask_bcrypt import Bcrypt
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from models import db, User
-from datetime import timedelta
+from flask_jwt_extended import (JWTManager, create_access_token, get_jwt, get_jwt_identity, jwt_required,
+                                set_access_cookies, unset_jwt_cookies, verify_jwt_in_request)
+from flask_jwt_extended.exceptions import CSRFError, JWTExtendedException
+from jwt.exceptions import PyJWTError
+from werkzeug.security import generate_password_hash, check_password_hash
+from datetime import datetime, timedelta
+import threading
+import time
+import uuid
+from models import db, User, RevokedToken
+from write_queue import run_write
 
 auth_bp = Blueprint('auth', __name__)
-bcrypt = Bcrypt()
+jwt = JWTManager()
+
+
+# Each sync re-reads revocations this far back, to catch rows whose
+# transaction committed after a concurrent one that was already seen
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class TokenDenylist:
+    """Revoked token ids and their expiries (epoch seconds), synced from revoked_token"""
+
+    def __init__(self, sync_seconds=5):
+        self.sync_seconds = sync_seconds
+        self._expiries = {}
+        self._synced_at = None  # time.time() of the last sync
+        self._synced_since = None  # created_at the next sync reads from
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _compact(jti):
+        try:
+            return uuid.UUID(jti).bytes
+        except (TypeError, ValueError):
+            return jti
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._expiries[self._compact(jti)] = expires_at
+
+    def sync(self, force=False):
+        """Load revocations made since the last sync and drop expired ones"""
+        now = time.time()
+        if not force and self._synced_at is not None and now - self._synced_at < self.sync_seconds:
+            return
+        with self._lock:
+            if not force and self._synced_at is not None and now - self._synced_at < self.sync_seconds:
+                return
+            utcnow = datetime.utcnow()
+            query = db.session.query(RevokedToken.jti, RevokedToken.expires_at).filter(
+                RevokedToken.expires_at > utcnow
+            )
+            if self._synced_since is not None:
+                query = query.filter(RevokedToken.created_at >= self._synced_since)
+            for jti, expires_at in query:
+                self._expiries[self._compact(jti)] = now + (expires_at - utcnow).total_seconds()
+            self._expiries = {key: expiry for key, expiry in self._expiries.items() if expiry > now}
+            self._synced_at = now
+            self._synced_since = utcnow - SYNC_OVERLAP
+
+    def __contains__(self, jti):
+        return self._compact(jti) in self._expiries
+
+    def __len__(self):
+        return len(self._expiries)
+
+
+denylist = TokenDenylist()
+
+
+def _load_key(path):
+    with open(path) as f:
+        return f.read()
+
+
+def init_auth(app):
+    """Configure token signing and verification and register the auth routes"""
+    app.config.setdefault('JWT_ACCESS_TOKEN_EXPIRES', timedelta(days=7))
+    app.config.setdefault('JWT_TOKEN_LOCATION', ['cookies', 'headers'])
+    app.config.setdefault('JWT_COOKIE_CSRF_PROTECT', True)
+    app.config.setdefault('JWT_DENYLIST_SYNC_SECONDS', 5)
+
+    # Read the key pair once; verification then never touches the disk
+    private_key_file = app.config.get('JWT_PRIVATE_KEY_FILE')
+    public_key_file = app.config.get('JWT_PUBLIC_KEY_FILE')
+    if public_key_file:
+        app.config['JWT_ALGORITHM'] = 'RS256'
+        app.config['JWT_PUBLIC_KEY'] = _load_key(public_key_file)
+        if private_key_file:
+            app.config['JWT_PRIVATE_KEY'] = _load_key(private_key_file)
+
+    denylist.sync_seconds = app.config['JWT_DENYLIST_SYNC_SECONDS']
+    jwt.init_app(app)
+
+    # Registered after jwt.init_app so it replaces the extension's handler,
+    # which would report a CSRF failure like a missing login
+    @app.errorhandler(CSRFError)
+    def _csrf_error(e):
+        return jsonify({'error': 'Invalid CSRF token', 'reason': str(e)}), 401
+
+    app.register_blueprint(auth_bp, url_prefix='/api')
+
+
+@jwt.token_in_blocklist_loader
+def _is_revoked(jwt_header, jwt_payload):
+    denylist.sync()
+    return jwt_payload['jti'] in denylist
+
+
+@jwt.unauthorized_loader
+def _missing_token(reason):
+    return jsonify({'error': 'Authentication required', 'reason': reason}), 401
+
+
+@jwt.invalid_token_loader
+def _invalid_token(reason):
+    return jsonify({'error': 'Invalid token', 'reason': reason}), 401
+
+
+@jwt.expired_token_loader
+def _expired_token(jwt_header, jwt_payload):
+    return jsonify({'error': 'Token has expired'}), 401
+
+
+@jwt.revoked_token_loader
+def _revoked_token(jwt_header, jwt_payload):
+    return jsonify({'error': 'Token has been revoked'}), 401
+
+
+def login_required(f):
+    """Require a valid, unrevoked access token"""
+    return jwt_required()(f)
+
+
+def current_user_id():
+    """The id of the user whose token authenticated this request"""
+    return int(get_jwt_identity())
+
+
+def revoke_token(jti, exp):
+    """Deny a token on every instance until it expires (exp in epoch seconds, from the token)"""
+    denylist.add(jti, exp)
+    expires_at = datetime.utcfromtimestamp(exp)
+
+    def save(db_session):
+        db_session.query(RevokedToken).filter(RevokedToken.expires_at < datetime.utcnow())\
+            .delete(synchronize_session=False)
+        db_session.add(RevokedToken(jti=jti, expires_at=expires_at))
+
+    run_write(save)
+
+
+def _user_json(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email
+    }
+
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
-    
+
+    if not data or not data.get('email') or not data.get('password') or not data.get('username'):
+        return jsonify({'error': 'Missing required fields'}), 400
+
     if User.query.filter_by(email=data['email']).first():
         return jsonify({'error': 'Email already exists'}), 400
-    
+
     if User.query.filter_by(username=data['username']).first():
         return jsonify({'error': 'Username already exists'}), 400
-    
-    hashed_password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
-    
+
+    hashed_password = generate_password_hash(data['password'])
+
     user = User(
         username=data['username'],
         email=data['email'],
         password=hashed_password
     )
-    
+
     db.session.add(user)
     db.session.commit()
-    
+
     return jsonify({'message': 'User created successfully'}), 201
 
+
 @auth_bp.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
+
+    if not data or not data.get('email') or not data.get('password'):
+        return jsonify({'error': 'Missing email or password'}), 400
+
     user = User.query.filter_by(email=data['email']).first()
-    
-    if not user or not bcrypt.check_password_hash(user.password, data['password']):
+
+    if not user or not check_password_hash(user.password, data['password']):
         return jsonify({'error': 'Invalid credentials'}), 401
-    
-    access_token = create_access_token(
-        identity=user.id,
-        expires_delta=timedelta(days=7)
-    )
-    
-    return jsonify({
-        'access_token': access_token,
-        'user': {
-            'id': user.id,
-            'username': user.username,
-            'email': user.email
-        }
-    }), 200
-
-@auth_bp.route('/profile', methods=['GET'])
-@jwt_required()
-def get_profile():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
-    
-    return jsonify({
-        'id': user.id,
-        'username': user.username,
-        'email': user.email,
-        'created_at': user.created_at.isoformat()
-    }), 200
\ No newline at end of file
+
+    access_token = create_access_token(identity=str(user.id))
+
+    # Browsers keep the token in an HttpOnly cookie that page scripts cannot
+    # read; only clients that ask for bearer mode get it in the body
+    if data.get('bearer'):
+        return jsonify({
+            'message': 'Login successful',
+            'access_token': access_token,
+            'token_type': 'Bearer',
+            'user': _user_json(user)
+        }), 200
+
+    response = jsonify({
+        'message': 'Login successful',
+        'user': _user_json(user)
+    })
+    set_access_cookies(response, access_token)
+    return response, 200
+
+
+@auth_bp.route('/logout', methods=['POST'])
+def logout():
+    try:
+        if verify_jwt_in_request(optional=True):
+            claims = get_jwt()
+            revoke_token(claims['jti'], claims['exp'])
+    except (JWTExtendedException, PyJWTError):
+        pass  # Already expired, revoked or invalid; just clear the cookies
+
+    response = jsonify({'message': 'Logout successful'})
+    unset_jwt_cookies(response)
+    return response, 200
+
+
+@auth_bp.route('/check-auth', methods=['GET'])
+def check_auth():
+    try:
+        authenticated = verify_jwt_in_request(optional=True) is not None
+    except (JWTExtendedException, PyJWTError):
+        authenticated = False
+
+    if authenticated:
+        user = db.session.get(User, current_user_id())
+        if user:
+            return jsonify({
+                'authenticated': True,
+                'user': _user_json(user)
+            }), 200
+
+    return jsonify({'authenticated': False}), 200
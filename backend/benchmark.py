@@ -0,0 +1,306 @@
+"""
+Offline inference benchmark suite.
+
+Replays the JPEGs in uploads/ (or synthetic images) through each backend and
+reports decode, preprocess and inference latency at p50/p95/p99, throughput
+across batch sizes and peak RSS. Each backend runs in its own subprocess so
+peak RSS reflects only that backend.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --backend keras --backend tflite:model/model_vi_int8.tflite
+    python benchmark.py --synthetic 50 --synthetic-size 1920x1080 --batch-sizes 1,8,32
+    python benchmark.py --output results.json
+    python benchmark.py --baseline results.json --max-regression 0.1
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+import numpy as np
+from PIL import Image
+from inference_backends import BACKENDS, get_model_path, load_backend, model_available
+from model_integration import decode_image, resize_and_normalize
+
+UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
+
+STAGES = ('decode', 'preprocess', 'inference', 'total')
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (Linux reports KB)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_jpegs(directory=UPLOAD_FOLDER, limit=None):
+    """Raw JPEG bytes from the upload store (or any directory tree of JPEGs)"""
+    paths = sorted(glob.glob(os.path.join(directory, '**', '*.jpg'), recursive=True))[:limit]
+    images = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            images.append(f.read())
+    return images
+
+
+def synthetic_jpegs(count, width, height, seed=0, quality=90):
+    """Random-noise JPEGs of the given size, encoded in memory"""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        pixels = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='JPEG', quality=quality)
+        images.append(buffer.getvalue())
+    return images
+
+
+def summarize(values):
+    """Percentile summary of a list of millisecond timings"""
+    return {
+        'p50': round(float(np.percentile(values, 50)), 3),
+        'p95': round(float(np.percentile(values, 95)), 3),
+        'p99': round(float(np.percentile(values, 99)), 3),
+        'mean': round(float(np.mean(values)), 3),
+    }
+
+
+def measure_stages(backend, images, iterations):
+    """Time decode, preprocess and single-image inference separately"""
+    timings = {stage: [] for stage in STAGES}
+
+    for i in range(iterations):
+        image_data = images[i % len(images)]
+
+        start = time.perf_counter()
+        image = decode_image(image_data)
+        decoded = time.perf_counter()
+        batch = resize_and_normalize(image)
+        preprocessed = time.perf_counter()
+        backend.predict(batch)
+        finished = time.perf_counter()
+
+        timings['decode'].append((decoded - start) * 1000)
+        timings['preprocess'].append((preprocessed - decoded) * 1000)
+        timings['inference'].append((finished - preprocessed) * 1000)
+        timings['total'].append((finished - start) * 1000)
+
+    return {stage: summarize(values) for stage, values in timings.items()}
+
+
+def measure_throughput(backend, arrays, batch_sizes, iterations):
+    """Inference throughput on preprocessed arrays for each batch size"""
+    results = []
+
+    for batch_size in batch_sizes:
+        batch = np.concatenate([arrays[i % len(arrays)] for i in range(batch_size)])
+        rounds = max(iterations // batch_size, 3)
+
+        # One untimed call so a new batch shape does not count its setup
+        backend.predict(batch)
+
+        latencies = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            backend.predict(batch)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        results.append({
+            'batch_size': batch_size,
+            'images_per_second': round(batch_size * rounds / (sum(latencies) / 1000), 2),
+            'batch_latency_ms': summarize(latencies),
+        })
+
+    return results
+
+
+def run_backend(backend_name, model_path, images, iterations, batch_sizes, warmup):
+    """Load one backend and run the full suite against it"""
+    rss_before = peak_rss_mb()
+
+    start = time.perf_counter()
+    backend = load_backend(backend_name, model_path or None)
+    load_seconds = time.perf_counter() - start
+
+    arrays = [resize_and_normalize(decode_image(image)) for image in images[:max(batch_sizes)]]
+    for i in range(warmup):
+        backend.predict(arrays[i % len(arrays)])
+
+    return {
+        'backend': backend_name,
+        'model_path': model_path,
+        'load_seconds': round(load_seconds, 3),
+        'stages_ms': measure_stages(backend, images, iterations),
+        'throughput': measure_throughput(backend, arrays, batch_sizes, iterations),
+        'rss_mb_before_load': round(rss_before, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def parse_backend_spec(spec):
+    """Parse 'backend' or 'backend:model_path'"""
+    name, _, path = spec.partition(':')
+    return name, path or get_model_path(name) or ''
+
+
+def parse_size(value):
+    """Parse WIDTHxHEIGHT"""
+    width, _, height = value.lower().partition('x')
+    return int(width), int(height)
+
+
+def load_images(args):
+    """Benchmark images from the configured source"""
+    if args.synthetic:
+        width, height = parse_size(args.synthetic_size)
+        return synthetic_jpegs(args.synthetic, width, height)
+    return load_jpegs(args.images_dir, args.limit)
+
+
+def find_regressions(results, baseline, max_regression):
+    """
+    Compare results with a previous run.
+    Latencies may grow and throughput may drop by at most max_regression.
+    """
+    regressions = []
+    previous = {(r['backend'], r['model_path']): r for r in baseline['results']}
+
+    for result in results:
+        old = previous.get((result['backend'], result['model_path']))
+        if not old:
+            continue
+
+        for stage in STAGES:
+            new_p50 = result['stages_ms'][stage]['p50']
+            old_p50 = old['stages_ms'][stage]['p50']
+            if new_p50 > old_p50 * (1 + max_regression):
+                regressions.append(
+                    f"{result['backend']} {stage} p50 {old_p50}ms -> {new_p50}ms"
+                )
+
+        old_throughput = {t['batch_size']: t['images_per_second'] for t in old['throughput']}
+        for entry in result['throughput']:
+            old_ips = old_throughput.get(entry['batch_size'])
+            if old_ips and entry['images_per_second'] < old_ips * (1 - max_regression):
+                regressions.append(
+                    f"{result['backend']} batch {entry['batch_size']} "
+                    f"{old_ips} -> {entry['images_per_second']} img/s"
+                )
+
+    return regressions
+
+
+def print_report(results):
+    for r in results:
+        print(f"\n{r['backend']} ({r['model_path']})")
+        print(f"  load {r['load_seconds']}s, peak RSS {r['peak_rss_mb']} MB")
+        print(f"  {'stage':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for stage in STAGES:
+            s = r['stages_ms'][stage]
+            print(f"  {stage:<12}{s['p50']:>10}{s['p95']:>10}{s['p99']:>10}")
+        print(f"  {'batch':<12}{'img/s':>10}{'p50 ms':>10}")
+        for t in r['throughput']:
+            print(f"  {t['batch_size']:<12}{t['images_per_second']:>10}{t['batch_latency_ms']['p50']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dental model inference')
+    parser.add_argument('--backend', action='append', dest='backends',
+                        help="Backend to run, as 'name' or 'name:model_path' (repeatable)")
+    parser.add_argument('--images-dir', default=UPLOAD_FOLDER)
+    parser.add_argument('--limit', type=int, help='Maximum number of images to replay')
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='Use this many synthetic images instead of uploads')
+    parser.add_argument('--synthetic-size', default='1280x960', help='WIDTHxHEIGHT')
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--batch-sizes', default='1,4,8,16')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--baseline', help='Previous --output file to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.1)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    backends = args.backends or list(BACKENDS)
+    batch_sizes = [int(b) for b in args.batch_sizes.split(',')]
+
+    if args.worker:
+        images = load_images(args)
+        name, path = parse_backend_spec(backends[0])
+        result = run_backend(name, path, images, args.iterations, batch_sizes, args.warmup)
+        print(json.dumps(result))
+        return
+
+    if not load_images(args):
+        print(f"No images found in {args.images_dir}, use --synthetic", file=sys.stderr)
+        sys.exit(2)
+
+    # Workers re-read the image source from the same arguments
+    worker_args = [
+        '--images-dir', args.images_dir,
+        '--synthetic', str(args.synthetic),
+        '--synthetic-size', args.synthetic_size,
+        '--iterations', str(args.iterations),
+        '--batch-sizes', args.batch_sizes,
+        '--warmup', str(args.warmup),
+    ]
+    if args.limit:
+        worker_args += ['--limit', str(args.limit)]
+
+    results = []
+    for spec in backends:
+        name, path = parse_backend_spec(spec)
+        if not model_available(name, path):
+            print(f"Skipping {name}: model file not found at {path}", file=sys.stderr)
+            continue
+
+        output = subprocess.run(
+            [sys.executable, __file__, '--worker', '--backend', f"{name}:{path}"] + worker_args,
+            capture_output=True, text=True
+        )
+        if output.returncode != 0:
+            print(f"Backend {name} failed:\n{output.stderr}", file=sys.stderr)
+            continue
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'source': f"synthetic {args.synthetic_size}" if args.synthetic else args.images_dir,
+            'iterations': args.iterations,
+            'batch_sizes': batch_sizes,
+        },
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(results)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.max_regression)
+        for regression in regressions:
+            print(f"✗ Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
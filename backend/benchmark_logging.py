@@ -0,0 +1,155 @@
+"""
+Measure /api/ai-checkup request latency with logging off, synchronous and queued.
+
+Each mode runs in its own subprocess against a throwaway SQLite database with
+the fake inference backend, so only the logging configuration differs.
+
+Usage:
+    python benchmark_logging.py --requests 300 --threads 4
+    python benchmark_logging.py --drain-delay-ms 5   # simulate a slow log collector
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODES = {
+    'off': {'LOG_LEVEL': 'CRITICAL'},
+    'sync': {'LOG_LEVEL': 'DEBUG', 'LOG_QUEUE': 'False'},
+    'queued': {'LOG_LEVEL': 'DEBUG', 'LOG_QUEUE': 'True'},
+    'queued-sampled': {'LOG_LEVEL': 'DEBUG', 'LOG_QUEUE': 'True', 'LOG_SAMPLE_RATE': '0.1'},
+}
+
+
+def run_worker(requests, threads, result_path):
+    """Drive the app through the Flask test client and record latencies"""
+    import numpy as np
+    sys.path.insert(0, BACKEND_DIR)
+    from app import app, db
+
+    with app.app_context():
+        db.create_all()
+
+    image_path = sorted(glob.glob(os.path.join(BACKEND_DIR, 'uploads', '**', '*.jpg'), recursive=True))[0]
+    with open(image_path, 'rb') as f:
+        image = f.read()
+
+    latencies = []
+    lock = threading.Lock()
+
+    def client_loop(index, count):
+        client = app.test_client()
+        email = f"bench{index}@example.com"
+        client.post('/api/register', json={'email': email, 'password': 'pw', 'username': f"bench{index}"})
+        client.post('/api/login', json={'email': email, 'password': 'pw'})
+        # Cookie-authenticated writes must echo the CSRF cookie in a header
+        client.environ_base['HTTP_X_CSRF_TOKEN'] = client.get_cookie('csrf_access_token').value
+
+        for _ in range(count):
+            start = time.perf_counter()
+            client.post(
+                '/api/ai-checkup',
+                data={'image': (io.BytesIO(image), 'bench.jpg')},
+                content_type='multipart/form-data'
+            )
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+
+    workers = [
+        threading.Thread(target=client_loop, args=(i, requests // threads))
+        for i in range(threads)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    wall = time.perf_counter() - start
+
+    with open(result_path, 'w') as f:
+        json.dump({
+            'requests': len(latencies),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+            'p95_ms': round(float(np.percentile(latencies, 95)), 2),
+            'p99_ms': round(float(np.percentile(latencies, 99)), 2),
+            'requests_per_second': round(len(latencies) / wall, 1),
+        }, f)
+
+
+def drain(pipe, delay):
+    """Read a pipe to EOF in 4 KB chunks, pausing after each one"""
+    total = 0
+    while True:
+        chunk = pipe.read1(4096)
+        if not chunk:
+            return total
+        total += len(chunk)
+        if delay:
+            time.sleep(delay)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark request latency with logging on vs off')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--drain-delay-ms', type=float, default=0,
+                        help='Pause after reading each 4 KB of log output')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.requests, args.threads, args.worker)
+        return
+
+    results = {}
+    for mode in args.modes.split(','):
+        with tempfile.TemporaryDirectory() as workdir:
+            result_path = os.path.join(workdir, 'result.json')
+            env = dict(
+                os.environ,
+                DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+                SECRET_KEY='benchmark',
+                MODEL_BACKEND='fake',
+                MODEL_FAKE_LATENCY_MS='0',
+                **MODES[mode]
+            )
+            # Log output goes through a real pipe, as it would under a process manager
+            stderr_path = os.path.join(workdir, 'stderr.log')
+            with open(stderr_path, 'wb') as stderr:
+                process = subprocess.Popen(
+                    [sys.executable, os.path.abspath(__file__), '--worker', result_path,
+                     '--requests', str(args.requests), '--threads', str(args.threads)],
+                    cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=stderr
+                )
+                log_bytes = drain(process.stdout, args.drain_delay_ms / 1000)
+            if process.wait() != 0:
+                with open(stderr_path) as f:
+                    print(f"Mode {mode} failed:\n{f.read()[-2000:]}", file=sys.stderr)
+                continue
+            with open(result_path) as f:
+                results[mode] = json.load(f)
+            results[mode]['log_bytes'] = log_bytes
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':<16}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'log KB':>9}")
+    for mode, r in results.items():
+        print(f"{mode:<16}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}"
+              f"{r['requests_per_second']:>9}{r['log_bytes'] // 1024:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Date-window calendar aggregation.
+
+Each table is read with one query bounded by user and date range, served by
+the (user_id, date) and (user_id, created_at) indexes, so the cost depends on
+the visible window rather than the account's whole history. Only days with
+something on them appear in the result.
+"""
+from datetime import datetime, time, timedelta
+from models import db, DailyHabit, AICheckup, Reminder
+
+# Six-week month grids need 42 days; allow a quarter
+MAX_WINDOW_DAYS = 93
+
+
+def _day(buckets, day):
+    return buckets.setdefault(day.isoformat(), {'reminders': [], 'habit': None, 'checkups': []})
+
+
+def build_calendar_window(user_id, start, end):
+    """Per-day reminders, habit status and checkup markers for start..end inclusive"""
+    buckets = {}
+
+    reminders = db.session.query(
+        Reminder.id, Reminder.type, Reminder.title, Reminder.description, Reminder.date, Reminder.time,
+        Reminder.completed, Reminder.frequency_days, Reminder.pill_count
+    ).filter(
+        Reminder.user_id == user_id,
+        Reminder.date >= start,
+        Reminder.date <= end
+    ).order_by(Reminder.date, Reminder.time).all()
+
+    for reminder in reminders:
+        _day(buckets, reminder.date)['reminders'].append({
+            'id': reminder.id,
+            'type': reminder.type,
+            'title': reminder.title,
+            'description': reminder.description,
+            'time': reminder.time.isoformat() if reminder.time else None,
+            'completed': reminder.completed,
+            'frequency_days': reminder.frequency_days,
+            'pill_count': reminder.pill_count
+        })
+
+    habits = db.session.query(
+        DailyHabit.date, DailyHabit.brushed, DailyHabit.flossed, DailyHabit.brushing_time
+    ).filter(
+        DailyHabit.user_id == user_id,
+        DailyHabit.date >= start,
+        DailyHabit.date <= end
+    ).all()
+
+    for habit in habits:
+        _day(buckets, habit.date)['habit'] = {
+            'brushed': habit.brushed,
+            'flossed': habit.flossed,
+            'brushing_time': habit.brushing_time
+        }
+
+    # Checkups are timestamped (UTC), so bound them by datetimes
+    checkups = db.session.query(AICheckup.id, AICheckup.created_at).filter(
+        AICheckup.user_id == user_id,
+        AICheckup.created_at >= datetime.combine(start, time.min),
+        AICheckup.created_at < datetime.combine(end + timedelta(days=1), time.min)
+    ).order_by(AICheckup.created_at).all()
+
+    for checkup in checkups:
+        _day(buckets, checkup.created_at.date())['checkups'].append({
+            'id': checkup.id,
+            'created_at': checkup.created_at.isoformat()
+        })
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'days': dict(sorted(buckets.items()))
+    }
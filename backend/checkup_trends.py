@@ -0,0 +1,153 @@
+"""
+Checkup health-score and condition trends.
+
+Each checkup's overall_health_score is stored in the typed
+AICheckup.health_score column and the model's probability for every class
+as a CheckupCondition row, flagged `detected` when it passed the detection
+cutoff, so trends are a GROUP BY over indexed columns instead of parsing
+every analysis_result in Python. Because undetected probabilities are kept,
+a condition that falls below the cutoff shows up as a decline rather than
+vanishing from its series. Buckets start on the day, the Monday of the week
+or the first of the month.
+"""
+from datetime import datetime, time, timedelta
+from sqlalchemy import case, func
+from models import db, AICheckup, CheckupCondition
+
+BUCKETS = ('day', 'week', 'month')
+
+# Approximate bucket length, used to bound the number of points per response
+BUCKET_DAYS = {'day': 1, 'week': 7, 'month': 30}
+MAX_TREND_POINTS = 1000
+
+
+def class_probabilities(model_results):
+    """{class name: probability} for every class the model scored"""
+    return {
+        str(name): float(probability)
+        for name, probability in zip(model_results.get('class_names') or [], model_results.get('predictions') or [])
+    }
+
+
+def typed_columns(analysis):
+    """(health_score, [(name, confidence, detected), ...]) from an analysis response"""
+    try:
+        health_score = float(analysis.get('overall_health_score'))
+    except (TypeError, ValueError):
+        health_score = None
+
+    detected = {}
+    for condition in analysis.get('detected_conditions') or []:
+        try:
+            detected[str(condition['name'])] = float(condition['confidence'])
+        except (KeyError, TypeError, ValueError):
+            continue
+
+    probabilities = analysis.get('class_probabilities')
+    if not isinstance(probabilities, dict):
+        # Checkups saved before class probabilities were stored only kept detections
+        return health_score, [(name, confidence, True) for name, confidence in detected.items()]
+
+    conditions = []
+    for name, probability in probabilities.items():
+        try:
+            conditions.append((str(name), float(probability), str(name) in detected))
+        except (TypeError, ValueError):
+            continue
+    return health_score, conditions
+
+
+def condition_rows(checkup, conditions):
+    return [
+        CheckupCondition(
+            checkup_id=checkup.id,
+            user_id=checkup.user_id,
+            name=name,
+            confidence=confidence,
+            detected=detected,
+            created_at=checkup.created_at
+        )
+        for name, confidence, detected in conditions
+    ]
+
+
+def bucket_expression(dialect_name, bucket, column):
+    """SQL expression for the first day of the bucket containing `column`"""
+    if bucket not in BUCKETS:
+        raise ValueError(f"Invalid bucket. Must be one of {', '.join(BUCKETS)}")
+    if dialect_name == 'sqlite':
+        if bucket == 'day':
+            return func.date(column)
+        if bucket == 'week':
+            # Next Sunday (or today), back to its Monday
+            return func.date(column, 'weekday 0', '-6 days')
+        return func.date(column, 'start of month')
+    return func.date(func.date_trunc(bucket, column))
+
+
+def _point(row):
+    bucket = row.bucket
+    return {
+        'bucket': bucket if isinstance(bucket, str) else bucket.isoformat(),
+        'count': row.count,
+        'min': round(row.min, 3),
+        'avg': round(float(row.avg), 3),
+        'max': round(row.max, 3)
+    }
+
+
+def build_trend(user_id, bucket, start, end, conditions=None):
+    """
+    Downsampled health-score and per-condition confidence series for
+    start..end inclusive, over every class probability (not only detections). `conditions` limits which condition names are
+    returned; None returns all of them.
+    """
+    dialect_name = db.engine.dialect.name
+    start_at = datetime.combine(start, time.min)
+    end_at = datetime.combine(end + timedelta(days=1), time.min)
+
+    score_bucket = bucket_expression(dialect_name, bucket, AICheckup.created_at).label('bucket')
+    scores = db.session.query(
+        score_bucket,
+        func.count(AICheckup.health_score).label('count'),
+        func.min(AICheckup.health_score).label('min'),
+        func.avg(AICheckup.health_score).label('avg'),
+        func.max(AICheckup.health_score).label('max')
+    ).filter(
+        AICheckup.user_id == user_id,
+        AICheckup.created_at >= start_at,
+        AICheckup.created_at < end_at,
+        AICheckup.health_score.isnot(None)
+    ).group_by(score_bucket).order_by(score_bucket).all()
+
+    condition_bucket = bucket_expression(dialect_name, bucket, CheckupCondition.created_at).label('bucket')
+    query = db.session.query(
+        CheckupCondition.name,
+        condition_bucket,
+        func.count(CheckupCondition.id).label('count'),
+        func.sum(case((CheckupCondition.detected, 1), else_=0)).label('detected'),
+        func.min(CheckupCondition.confidence).label('min'),
+        func.avg(CheckupCondition.confidence).label('avg'),
+        func.max(CheckupCondition.confidence).label('max')
+    ).filter(
+        CheckupCondition.user_id == user_id,
+        CheckupCondition.created_at >= start_at,
+        CheckupCondition.created_at < end_at
+    )
+    if conditions is not None:
+        query = query.filter(CheckupCondition.name.in_(conditions))
+    rows = query.group_by(CheckupCondition.name, condition_bucket)\
+        .order_by(CheckupCondition.name, condition_bucket).all()
+
+    condition_series = {}
+    for row in rows:
+        # count: checkups scored for the condition; detected: how many passed the cutoff
+        condition_series.setdefault(row.name, []).append(dict(_point(row), detected=int(row.detected or 0)))
+
+    return {
+        'bucket': bucket,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'health_score': [_point(row) for row in scores],
+        'conditions': condition_series
+    }
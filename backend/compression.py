@@ -0,0 +1,104 @@
+import gzip
+import time
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Content types that are already compressed and gain nothing from another pass
+SKIP_MIMETYPE_PREFIXES = ('image/', 'video/', 'audio/')
+SKIP_MIMETYPES = {'application/zip', 'application/gzip', 'application/x-gzip'}
+
+
+def init_compression(app):
+    """Register negotiated gzip/brotli compression for API responses"""
+    app.config.setdefault('COMPRESS_ENABLED', True)
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BR_LEVEL', 4)
+
+    @app.after_request
+    def compress_response(response):
+        return compress(app, response)
+
+
+def choose_encoding(accept_encodings):
+    """
+    Pick the best encoding the client accepts.
+    Brotli wins over gzip when both are offered with the same quality.
+    """
+    br_quality = accept_encodings.quality('br') if brotli else 0
+    gzip_quality = accept_encodings.quality('gzip')
+
+    if br_quality and br_quality >= gzip_quality:
+        return 'br'
+    if gzip_quality:
+        return 'gzip'
+    return None
+
+
+def should_compress(app, response):
+    """Check whether a response is worth compressing"""
+    if not app.config['COMPRESS_ENABLED']:
+        return False
+
+    # Streamed or file responses are passed through untouched
+    if response.direct_passthrough or response.is_streamed:
+        return False
+
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+
+    if 'Content-Encoding' in response.headers:
+        return False
+
+    mimetype = response.mimetype or ''
+    if mimetype.startswith(SKIP_MIMETYPE_PREFIXES) or mimetype in SKIP_MIMETYPES:
+        return False
+
+    return response.content_length is not None and \
+        response.content_length >= app.config['COMPRESS_MIN_SIZE']
+
+
+def compress(app, response):
+    """
+    Compress the response body in place if the client accepts it.
+    Logs the bytes saved and CPU time spent at debug level.
+    """
+    if not should_compress(app, response):
+        return response
+
+    # Compressible responses vary on Accept-Encoding
+    # even when this particular client did not ask for it
+    response.vary.add('Accept-Encoding')
+
+    encoding = choose_encoding(request.accept_encodings)
+    if not encoding:
+        return response
+
+    data = response.get_data()
+    start = time.perf_counter()
+
+    if encoding == 'br':
+        compressed = brotli.compress(data, quality=app.config['COMPRESS_BR_LEVEL'])
+    else:
+        compressed = gzip.compress(data, compresslevel=app.config['COMPRESS_LEVEL'])
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    # Never send a body that grew
+    if len(compressed) >= len(data):
+        return response
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Content-Length'] = len(compressed)
+
+    app.logger.debug(
+        "Compressed %s with %s: %d -> %d bytes in %.2fms",
+        request.path, encoding, len(data), len(compressed), elapsed_ms
+    )
+
+    return response
@@ -0,0 +1,180 @@
+"""
+Export model/model_vi.h5 to the lighter inference backends and check parity.
+
+Usage:
+    python convert_model.py export --format tflite-float16
+    python convert_model.py export --format tflite-int8 --calibration-dir uploads
+    python convert_model.py export --format onnx
+    python convert_model.py parity --backend tflite --model-path model/model_vi_int8.tflite
+
+Select the exported model at runtime with MODEL_BACKEND (and MODEL_PATH).
+ONNX export needs tf2onnx and the onnx backend needs onnxruntime installed.
+"""
+import argparse
+import glob
+import os
+import sys
+import numpy as np
+from inference_backends import BACKENDS, MODEL_DIR, DEFAULT_MODEL_FILES, load_backend
+from model_integration import preprocess_image
+
+KERAS_MODEL_PATH = os.path.join(MODEL_DIR, DEFAULT_MODEL_FILES['keras'])
+UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
+
+EXPORT_FORMATS = {
+    'tflite-float16': 'model_vi_float16.tflite',
+    'tflite-int8': 'model_vi_int8.tflite',
+    'onnx': 'model_vi.onnx',
+}
+
+
+def load_sample_images(directory=UPLOAD_FOLDER, limit=50, seed=0):
+    """
+    Preprocessed sample images for calibration and parity checks.
+    Uses real uploads when available and random images otherwise.
+    """
+    # Uploads are sharded into subdirectories by content hash
+    paths = sorted(glob.glob(os.path.join(directory, '**', '*.jpg'), recursive=True))[:limit]
+    if paths:
+        images = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                images.append(preprocess_image(f.read()))
+        return images
+
+    rng = np.random.default_rng(seed)
+    return [rng.random((1, 224, 224, 3), dtype=np.float32) for _ in range(limit)]
+
+
+def export_tflite(output_path, quantization='float16', keras_path=KERAS_MODEL_PATH,
+                  calibration_images=None):
+    """
+    Export the Keras model to TFLite.
+    float16 halves the weights, int8 fully quantizes weights and activations
+    using calibration_images as the representative dataset.
+    """
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(keras_path, compile=False)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        if not calibration_images:
+            calibration_images = load_sample_images()
+
+        def representative_dataset():
+            for image in calibration_images:
+                yield [image]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    else:
+        raise ValueError(f"Unknown quantization: {quantization}")
+
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+
+    return output_path
+
+
+def export_onnx(output_path, keras_path=KERAS_MODEL_PATH, opset=13):
+    """Export the Keras model to ONNX with a dynamic batch dimension"""
+    import tensorflow as tf
+    import tf2onnx
+
+    model = tf.keras.models.load_model(keras_path, compile=False)
+    input_signature = (tf.TensorSpec((None, 224, 224, 3), tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(
+        model,
+        input_signature=input_signature,
+        opset=opset,
+        output_path=output_path
+    )
+
+    return output_path
+
+
+def check_parity(candidate, reference, images, tolerance):
+    """
+    Compare class probabilities of two backends on the same images.
+    Returns a report with the max absolute difference and top-1 agreement.
+    """
+    max_diff = 0.0
+    top1_matches = 0
+
+    for image in images:
+        expected = reference.predict(image)[0]
+        actual = candidate.predict(image)[0]
+        max_diff = max(max_diff, float(np.max(np.abs(expected - actual))))
+        top1_matches += int(np.argmax(expected) == np.argmax(actual))
+
+    return {
+        'images': len(images),
+        'max_abs_diff': max_diff,
+        'top1_agreement': top1_matches / max(len(images), 1),
+        'tolerance': tolerance,
+        'passed': max_diff <= tolerance,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export and verify dental model backends')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Export the Keras model')
+    export_parser.add_argument('--format', choices=EXPORT_FORMATS, required=True)
+    export_parser.add_argument('--keras-path', default=KERAS_MODEL_PATH)
+    export_parser.add_argument('--output')
+    export_parser.add_argument('--calibration-dir', default=UPLOAD_FOLDER)
+    export_parser.add_argument('--calibration-images', type=int, default=100)
+    export_parser.add_argument('--opset', type=int, default=13)
+
+    parity_parser = subparsers.add_parser('parity', help='Check an export against the Keras model')
+    parity_parser.add_argument('--backend', choices=BACKENDS, required=True)
+    parity_parser.add_argument('--model-path', required=True)
+    parity_parser.add_argument('--keras-path', default=KERAS_MODEL_PATH)
+    parity_parser.add_argument('--images-dir', default=UPLOAD_FOLDER)
+    parity_parser.add_argument('--images', type=int, default=50)
+    parity_parser.add_argument('--tolerance', type=float, default=0.05)
+
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        output = args.output or os.path.join(MODEL_DIR, EXPORT_FORMATS[args.format])
+        print(f"Exporting {args.keras_path} as {args.format}...")
+
+        if args.format == 'onnx':
+            export_onnx(output, keras_path=args.keras_path, opset=args.opset)
+        else:
+            images = load_sample_images(args.calibration_dir, args.calibration_images)
+            export_tflite(
+                output,
+                quantization=args.format.split('-')[1],
+                keras_path=args.keras_path,
+                calibration_images=images
+            )
+
+        size_mb = os.path.getsize(output) / (1024 * 1024)
+        print(f"✓ Wrote {output} ({size_mb:.1f} MB)")
+
+    elif args.command == 'parity':
+        reference = load_backend('keras', args.keras_path)
+        candidate = load_backend(args.backend, args.model_path)
+        images = load_sample_images(args.images_dir, args.images)
+
+        report = check_parity(candidate, reference, images, args.tolerance)
+        print(f"Images compared:     {report['images']}")
+        print(f"Max abs difference:  {report['max_abs_diff']:.5f} (tolerance {report['tolerance']})")
+        print(f"Top-1 agreement:     {report['top1_agreement']:.1%}")
+
+        if not report['passed']:
+            print("✗ Parity check failed")
+            sys.exit(1)
+        print("✓ Parity check passed")
+
+
+if __name__ == '__main__':
+    main()
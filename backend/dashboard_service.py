@@ -0,0 +1,217 @@
+"""
+Dashboard aggregate with a per-user in-process cache.
+
+build_dashboard() gathers everything the dashboard shows (today's habit,
+streak stats, the last week of history, today's open reminders and the latest
+checkup) with bounded, column-only queries. get_dashboard() serves it from a
+per-user cache for DASHBOARD_CACHE_TTL seconds; the habit, reminder and
+checkup write paths call invalidate_dashboard() after they commit.
+
+The cache lives in each worker process, so with several workers a write only
+clears the entry in the worker that handled it and the others can be stale
+for up to the TTL.
+"""
+from collections import OrderedDict
+from datetime import date, timedelta
+from flask import current_app
+from sqlalchemy import and_, case, func
+import json
+import threading
+import time
+import metrics
+from models import db, DailyHabit, AICheckup, Reminder
+
+HISTORY_DAYS = 7
+
+# Rows fetched per round trip while walking back through the current streak
+STREAK_PAGE_SIZE = 64
+
+
+class DashboardCache:
+    """
+    TTL cache keyed by user. Each user has a generation counter that
+    invalidate() bumps, and a value computed before an invalidation is not
+    stored, so a slow read cannot put back data a concurrent write replaced.
+    """
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, day):
+        """(value or None, generation to pass to set)"""
+        with self._lock:
+            generation = self._generations.get(user_id, 0)
+            entry = self._entries.get(user_id)
+            if entry and entry[0] == day and entry[1] > time.monotonic():
+                return entry[2], generation
+            return None, generation
+
+    def set(self, user_id, day, value, generation):
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation:
+                return
+            self._entries.pop(user_id, None)
+            self._entries[user_id] = (day, time.monotonic() + self.ttl, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+
+def init_dashboard_cache(app):
+    """Create the dashboard cache; DASHBOARD_CACHE_TTL=0 disables it"""
+    app.config.setdefault('DASHBOARD_CACHE_TTL', 30)
+    app.config.setdefault('DASHBOARD_CACHE_MAX_ENTRIES', 10000)
+
+    if app.config['DASHBOARD_CACHE_TTL'] > 0:
+        app.extensions['dashboard_cache'] = DashboardCache(
+            app.config['DASHBOARD_CACHE_TTL'],
+            max_entries=app.config['DASHBOARD_CACHE_MAX_ENTRIES']
+        )
+
+
+def invalidate_dashboard(user_id):
+    """Drop a user's cached dashboard after a committed write"""
+    cache = current_app.extensions.get('dashboard_cache')
+    if cache:
+        cache.invalidate(user_id)
+
+
+def streak_stats(user_id, today=None):
+    """
+    Streak and consistency numbers, as returned by /api/habits/streak.
+    Totals come from one aggregate query and the streak walk stops at the
+    first gap, so neither loads the full history.
+    """
+    today = today or date.today()
+    thirty_days_ago = today - timedelta(days=30)
+
+    totals = db.session.query(
+        func.count(DailyHabit.id),
+        func.sum(case((and_(DailyHabit.date >= thirty_days_ago, DailyHabit.brushed), 1), else_=0)),
+        func.sum(case((and_(DailyHabit.date >= thirty_days_ago, DailyHabit.flossed), 1), else_=0)),
+        func.avg(case((DailyHabit.brushing_time > 0, DailyHabit.brushing_time)))
+    ).filter(DailyHabit.user_id == user_id).one()
+    total_tracked_days, brushed_days, flossed_days, avg_brushing_time = totals
+
+    current_streak = 0
+    expected = today
+    rows = db.session.query(DailyHabit.date, DailyHabit.brushed).filter(
+        DailyHabit.user_id == user_id,
+        DailyHabit.date <= today
+    ).order_by(DailyHabit.date.desc()).yield_per(STREAK_PAGE_SIZE)
+    for day, brushed in rows:
+        if not brushed or day != expected:
+            break
+        current_streak += 1
+        expected = day - timedelta(days=1)
+
+    return {
+        'current_streak': current_streak,
+        'longest_streak': max([current_streak, 0]),
+        # Percentages are of 30 days, not of the tracked days
+        'brushing_consistency': round((brushed_days or 0) / 30 * 100, 1),
+        'flossing_consistency': round((flossed_days or 0) / 30 * 100, 1),
+        'avg_brushing_time': round(float(avg_brushing_time or 0), 1),
+        'total_tracked_days': total_tracked_days
+    }
+
+
+def _latest_checkup(user_id):
+    checkup = db.session.query(AICheckup.id, AICheckup.created_at, AICheckup.analysis_result).filter(
+        AICheckup.user_id == user_id
+    ).order_by(AICheckup.created_at.desc(), AICheckup.id.desc()).first()
+
+    if not checkup:
+        return None
+
+    try:
+        analysis = json.loads(checkup.analysis_result) if checkup.analysis_result else {}
+    except ValueError:
+        analysis = {}
+
+    return {
+        'id': checkup.id,
+        'created_at': checkup.created_at.isoformat(),
+        'overall_health_score': analysis.get('overall_health_score', 0),
+        'detected_conditions': analysis.get('detected_conditions', []),
+        'requires_dentist_visit': analysis.get('requires_dentist_visit', False),
+        'urgency': analysis.get('urgency', 'none')
+    }
+
+
+def build_dashboard(user_id, today=None):
+    """Everything the dashboard shows, in one dict"""
+    today = today or date.today()
+
+    history_rows = db.session.query(
+        DailyHabit.date, DailyHabit.brushed, DailyHabit.flossed, DailyHabit.brushing_time
+    ).filter(
+        DailyHabit.user_id == user_id,
+        DailyHabit.date >= today - timedelta(days=HISTORY_DAYS)
+    ).order_by(DailyHabit.date.desc()).all()
+
+    history = [{
+        'date': row.date.isoformat(),
+        'brushed': row.brushed,
+        'flossed': row.flossed,
+        'brushing_time': row.brushing_time
+    } for row in history_rows]
+
+    today_habit = next(
+        (entry for entry in history if entry['date'] == today.isoformat()),
+        {'brushed': False, 'flossed': False, 'brushing_time': None, 'date': today.isoformat()}
+    )
+
+    reminders = db.session.query(
+        Reminder.id, Reminder.type, Reminder.title, Reminder.description, Reminder.date,
+        Reminder.time, Reminder.completed, Reminder.frequency_days, Reminder.pill_count
+    ).filter(
+        Reminder.user_id == user_id,
+        Reminder.completed == False,
+        Reminder.date == today
+    ).order_by(Reminder.time.asc()).all()
+
+    return {
+        'date': today.isoformat(),
+        'today': today_habit,
+        'streak': streak_stats(user_id, today),
+        'history': history,
+        'reminders': [{
+            'id': reminder.id,
+            'type': reminder.type,
+            'title': reminder.title,
+            'description': reminder.description,
+            'date': reminder.date.isoformat(),
+            'time': reminder.time.isoformat() if reminder.time else None,
+            'completed': reminder.completed,
+            'frequency_days': reminder.frequency_days,
+            'pill_count': reminder.pill_count
+        } for reminder in reminders],
+        'latest_checkup': _latest_checkup(user_id)
+    }
+
+
+def get_dashboard(user_id):
+    """The user's dashboard, from the cache when it is fresh"""
+    today = date.today()
+    cache = current_app.extensions.get('dashboard_cache')
+    if not cache:
+        return build_dashboard(user_id, today)
+
+    dashboard, generation = cache.get(user_id, today)
+    if dashboard is not None:
+        metrics.DASHBOARD_CACHE_REQUESTS.labels(outcome='hit').inc()
+        return dashboard
+
+    metrics.DASHBOARD_CACHE_REQUESTS.labels(outcome='miss').inc()
+    dashboard = build_dashboard(user_id, today)
+    cache.set(user_id, today, dashboard, generation)
+    return dashboard
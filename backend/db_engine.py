@@ -0,0 +1,186 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+from models import db
+from thread_tuning import worker_count
+import metrics
+
+DEFAULTS = {
+    # SQLite
+    'SQLITE_WAL': True,
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_BUSY_TIMEOUT_MS': 5000,
+    'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,
+    'SQLITE_CACHE_SIZE_KB': 20000,
+    'SQLITE_POOL_SIZE': 5,
+    'SQLITE_MAX_OVERFLOW': 10,
+    # Postgres
+    'WEB_THREADS': 8,
+    'SCHEDULER_THREADS': 5,
+    'DB_POOL_SIZE': None,
+    'DB_BACKGROUND_CONNECTIONS': None,
+    'DB_MAX_OVERFLOW': 0,
+    'DB_MAX_CONNECTIONS': None,
+    'DB_POOL_TIMEOUT': 30,
+    'DB_POOL_RECYCLE': 1800,
+    'DB_POOL_PRE_PING': True,
+    'DB_CONNECT_TIMEOUT': 10,
+    'DB_STATEMENT_TIMEOUT_MS': 0,
+    'DB_PGBOUNCER': False,
+}
+
+# Threads besides request handlers and scheduler jobs that hold a connection (the writer queue)
+BACKGROUND_THREADS = 1
+
+
+def is_sqlite(database_url):
+    return bool(database_url) and database_url.startswith('sqlite')
+
+
+def is_sqlite_memory(database_url):
+    return database_url in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in database_url
+
+
+def is_postgres(database_url):
+    return bool(database_url) and database_url.startswith(('postgresql', 'postgres://'))
+
+
+def normalize_database_url(database_url):
+    """Heroku/Railway style postgres:// URLs are not accepted by SQLAlchemy 2"""
+    if database_url and database_url.startswith('postgres://'):
+        return 'postgresql://' + database_url[len('postgres://'):]
+    return database_url
+
+
+def background_connections(config):
+    """
+    Connections held outside requests: one per scheduler thread, since every
+    job that can run at once (reminders, catch-up, outbox, analytics, upload
+    GC) may hold one, plus the writer queue
+    """
+    if config['DB_BACKGROUND_CONNECTIONS'] is not None:
+        return config['DB_BACKGROUND_CONNECTIONS']
+    return config['SCHEDULER_THREADS'] + BACKGROUND_THREADS
+
+
+def postgres_pool_size(config):
+    """
+    One connection per request thread plus the background connections, capped
+    so every worker process together stays under DB_MAX_CONNECTIONS.
+    """
+    if config['DB_POOL_SIZE']:
+        return config['DB_POOL_SIZE']
+
+    size = config['WEB_THREADS'] + background_connections(config)
+    if config['DB_MAX_CONNECTIONS']:
+        per_worker = config['DB_MAX_CONNECTIONS'] // worker_count() - config['DB_MAX_OVERFLOW']
+        size = min(size, max(1, per_worker))
+    return size
+
+
+def postgres_engine_options(config):
+    driver = make_url(config['SQLALCHEMY_DATABASE_URI']).get_driver_name()
+    connect_args = {
+        'connect_timeout': config['DB_CONNECT_TIMEOUT'],
+        'application_name': 'dental-tracker',
+    }
+    options = {'connect_args': connect_args}
+
+    if config['DB_PGBOUNCER']:
+        # pgbouncer does the pooling. Transaction pooling hands each
+        # transaction a different server connection, so session state such
+        # as prepared statements and startup options cannot be relied on.
+        options['poolclass'] = NullPool
+        if driver == 'psycopg':
+            connect_args['prepare_threshold'] = None
+        return options
+
+    options.update({
+        'pool_size': postgres_pool_size(config),
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        # Reuse the most recently returned connection so idle ones can age out
+        'pool_use_lifo': True,
+    })
+    if config['DB_STATEMENT_TIMEOUT_MS']:
+        connect_args['options'] = f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"
+    return options
+
+
+def sqlite_engine_options(config):
+    database_url = config['SQLALCHEMY_DATABASE_URI']
+    busy_timeout_s = config['SQLITE_BUSY_TIMEOUT_MS'] / 1000
+    options = {
+        # Threads share pooled connections, and pysqlite waits on locks
+        # for `timeout` seconds before raising "database is locked"
+        'connect_args': {'timeout': busy_timeout_s, 'check_same_thread': False},
+    }
+    # In-memory databases use a single static connection, no pool tuning
+    if not is_sqlite_memory(database_url):
+        options['pool_size'] = config['SQLITE_POOL_SIZE']
+        options['max_overflow'] = config['SQLITE_MAX_OVERFLOW']
+    return options
+
+
+def engine_options(config):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for the configured database.
+    Must be applied before db.init_app() creates the engine.
+    """
+    database_url = config.get('SQLALCHEMY_DATABASE_URI') or ''
+
+    if is_sqlite(database_url):
+        return sqlite_engine_options(config)
+    if is_postgres(database_url):
+        return postgres_engine_options(config)
+    return {}
+
+
+def sqlite_pragma_listener(config):
+    journal_mode = 'WAL' if config['SQLITE_WAL'] else 'DELETE'
+    pragmas = [
+        f"PRAGMA journal_mode={journal_mode}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={config['SQLITE_BUSY_TIMEOUT_MS']}",
+        f"PRAGMA mmap_size={config['SQLITE_MMAP_SIZE']}",
+        f"PRAGMA cache_size=-{config['SQLITE_CACHE_SIZE_KB']}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return set_sqlite_pragmas
+
+
+def _count_connection(dbapi_connection, connection_record):
+    metrics.DB_CONNECTIONS_OPENED.inc()
+
+
+def init_engine(app):
+    """
+    Apply the engine profile for the configured database and initialize db.
+    SQLite gets WAL, synchronous=NORMAL, mmap, a busy timeout and a sized pool
+    so web threads and the scheduler thread can write concurrently.
+    Postgres gets a fixed pool sized to the worker model with pre-ping,
+    or no pool at all behind pgbouncer (DB_PGBOUNCER).
+    """
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    app.config['SQLALCHEMY_DATABASE_URI'] = normalize_database_url(app.config.get('SQLALCHEMY_DATABASE_URI'))
+
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    options.update(engine_options(app.config))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    db.init_app(app)
+
+    with app.app_context():
+        event.listen(db.engine, 'connect', _count_connection)
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', sqlite_pragma_listener(app.config))
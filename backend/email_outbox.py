@@ -0,0 +1,239 @@
+"""
+Transactional outbox for outgoing email.
+
+Jobs that send email call enqueue_email() with the db_session of the same
+write that records the state the email reports (a reminder's email_sent,
+for instance), so either both commit or neither does. deliver_outbox(),
+run by the scheduler, drains the queue separately from those transactions:
+
+- claim_outbox() takes a batch of due messages (SELECT ... FOR UPDATE SKIP
+  LOCKED on Postgres, so several instances can drain the queue at once)
+  and marks them 'sending' until a lease deadline; a sender that dies
+  leaves them to be taken over when it passes.
+- EMAIL_OUTBOX_CONCURRENCY threads send the batch, each over one SMTP
+  connection.
+- A failed send is retried with exponential backoff and jitter; after
+  EMAIL_OUTBOX_MAX_ATTEMPTS it is dead-lettered ('dead') and kept for
+  inspection and retry_dead_letters().
+
+Every message has an idempotency key, unique in the table, so enqueueing
+the same email twice stores it once. The key also becomes its Message-ID,
+so a message resent after a sender died between sending and recording it
+can be recognised as a duplicate by the recipient's mail client.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import hashlib
+import logging
+import random
+from sqlalchemy import bindparam, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+import metrics
+from email_service import build_message, mail
+from models import db, EmailOutbox
+from write_queue import run_write
+
+logger = logging.getLogger(__name__)
+
+_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+# Columns a sender needs, returned when a batch is claimed; attempts and
+# locked_until together identify the claim when its result is recorded
+_CLAIM_COLUMNS = (EmailOutbox.id, EmailOutbox.idempotency_key, EmailOutbox.recipient, EmailOutbox.subject,
+                  EmailOutbox.body, EmailOutbox.html, EmailOutbox.attempts, EmailOutbox.locked_until)
+
+# Records a failure only if the message is still under the sender's claim, so a
+# sender whose lease expired cannot reset a message another one has taken over
+_RECORD_FAILURE = update(EmailOutbox.__table__).where(
+    EmailOutbox.__table__.c.id == bindparam('message_id'),
+    EmailOutbox.__table__.c.status == 'sending',
+    EmailOutbox.__table__.c.attempts == bindparam('claimed_attempts'),
+    EmailOutbox.__table__.c.locked_until == bindparam('claimed_until')
+).values(
+    status=bindparam('new_status'),
+    next_attempt_at=bindparam('retry_at'),
+    locked_until=None,
+    last_error=bindparam('error')
+)
+
+
+def message_id(idempotency_key):
+    """Stable Message-ID header for a queued email"""
+    return f"<{hashlib.sha256(idempotency_key.encode()).hexdigest()[:32]}@dental-tracker>"
+
+
+def enqueue_email(db_session, idempotency_key, recipient, subject, body, html=None, now=None):
+    """Queue an email in the caller's transaction; returns False if the key was already queued"""
+    insert = _INSERTS[db_session.get_bind().dialect.name]
+    return db_session.execute(insert(EmailOutbox.__table__).values(
+        idempotency_key=idempotency_key, recipient=recipient, subject=subject, body=body, html=html,
+        status='pending', attempts=0, next_attempt_at=now or datetime.utcnow(), created_at=now or datetime.utcnow()
+    ).on_conflict_do_nothing(index_elements=['idempotency_key'])).rowcount == 1
+
+
+def claim_outbox(db_session, batch_size, lease_seconds, now=None):
+    """Mark up to batch_size due messages as being sent by the caller and return them"""
+    now = now or datetime.utcnow()
+    due = select(EmailOutbox.id).where(or_(
+        (EmailOutbox.status == 'pending') & (EmailOutbox.next_attempt_at <= now),
+        (EmailOutbox.status == 'sending') & (EmailOutbox.locked_until < now)
+    )).order_by(EmailOutbox.next_attempt_at).limit(batch_size)
+    if db_session.get_bind().dialect.name == 'postgresql':
+        due = due.with_for_update(skip_locked=True)
+
+    # Counting the attempt up front dead-letters a message that keeps killing its sender
+    return db_session.execute(
+        update(EmailOutbox).where(EmailOutbox.id.in_(due)).values(
+            status='sending', attempts=EmailOutbox.attempts + 1,
+            locked_until=now + timedelta(seconds=lease_seconds)
+        ).returning(*_CLAIM_COLUMNS).execution_options(synchronize_session=False)
+    ).all()
+
+
+def retry_delay(attempts, base_seconds, max_seconds):
+    """Exponential backoff with jitter: about base * 2^(attempts - 1), capped"""
+    delay = min(max_seconds, base_seconds * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def record_results(db_session, results, max_attempts, base_seconds, max_seconds, now=None):
+    """
+    Store the outcome of a batch: results is [(message row, error or None)].
+    Failures only update messages still under this batch's claim.
+    """
+    now = now or datetime.utcnow()
+    sent_ids = [message.id for message, error in results if error is None]
+    if sent_ids:
+        db_session.execute(
+            update(EmailOutbox).where(EmailOutbox.id.in_(sent_ids), EmailOutbox.status == 'sending')
+            .values(status='sent', sent_at=now, locked_until=None, last_error=None)
+            .execution_options(synchronize_session=False)
+        )
+
+    failures = []
+    for message, error in results:
+        if error is None:
+            continue
+        dead = message.attempts >= max_attempts
+        failures.append({
+            'message_id': message.id,
+            'claimed_attempts': message.attempts,
+            'claimed_until': message.locked_until,
+            'new_status': 'dead' if dead else 'pending',
+            'retry_at': now if dead else
+            now + timedelta(seconds=retry_delay(message.attempts, base_seconds, max_seconds)),
+            'error': error[:1000],
+        })
+    if failures:
+        db_session.execute(_RECORD_FAILURE, failures)
+    return len(sent_ids), sum(1 for failure in failures if failure['new_status'] == 'dead')
+
+
+def _send_share(app, messages):
+    """Send messages over one SMTP connection; returns [(message, error or None)]"""
+    results = []
+    with app.app_context():
+        try:
+            with mail.connect() as connection:
+                for message in messages:
+                    try:
+                        connection.send(build_message(message.recipient, message.subject, message.body,
+                                                      message.html, message_id(message.idempotency_key)))
+                        results.append((message, None))
+                    except Exception as e:
+                        results.append((message, f"{type(e).__name__}: {e}"))
+        except Exception as e:
+            # Could not connect (or the connection dropped); everything not sent yet failed
+            done = {message.id for message, _ in results}
+            results.extend((message, f"{type(e).__name__}: {e}") for message in messages if message.id not in done)
+    return results
+
+
+def deliver_outbox(app):
+    """Send due messages until none are left; returns counts of what happened"""
+    config = app.config
+    concurrency = max(1, config.get('EMAIL_OUTBOX_CONCURRENCY', 4))
+    result = {'batches': 0, 'sent': 0, 'retrying': 0, 'dead': 0}
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='email-outbox') as pool:
+        while True:
+            batch = run_write(lambda db_session: claim_outbox(
+                db_session, config.get('EMAIL_OUTBOX_BATCH_SIZE', 50), config.get('EMAIL_OUTBOX_LEASE_SECONDS', 300)
+            ))
+            if not batch:
+                break
+
+            shares = [batch[i::concurrency] for i in range(min(concurrency, len(batch)))]
+            results = [outcome for share in pool.map(lambda share: _send_share(app, share), shares)
+                       for outcome in share]
+
+            sent, dead = run_write(lambda db_session: record_results(
+                db_session, results, config.get('EMAIL_OUTBOX_MAX_ATTEMPTS', 8),
+                config.get('EMAIL_OUTBOX_BACKOFF_SECONDS', 30), config.get('EMAIL_OUTBOX_BACKOFF_MAX_SECONDS', 3600)
+            ))
+            failed = len(results) - sent
+            metrics.EMAILS_SENT.inc(sent)
+            metrics.EMAILS_FAILED.inc(failed)
+            metrics.EMAILS_DEAD_LETTERED.inc(dead)
+            for message, error in results:
+                if error is not None:
+                    logger.warning("Email %s to %s failed (attempt %d): %s",
+                                   message.idempotency_key, message.recipient, message.attempts, error)
+
+            result['batches'] += 1
+            result['sent'] += sent
+            result['retrying'] += failed - dead
+            result['dead'] += dead
+
+    metrics.EMAIL_OUTBOX_PENDING.set(
+        db.session.query(func.count(EmailOutbox.id)).filter(EmailOutbox.status.in_(('pending', 'sending'))).scalar()
+    )
+    db.session.rollback()
+    if result['batches']:
+        logger.info("Email outbox: %s", result)
+    return result
+
+
+def purge_sent(retention_days, now=None):
+    """Delete sent messages older than retention_days"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+    return run_write(lambda db_session: db_session.query(EmailOutbox).filter(
+        EmailOutbox.status == 'sent', EmailOutbox.sent_at < cutoff
+    ).delete(synchronize_session=False))
+
+
+def outbox_summary(dead_limit=50):
+    """Message counts by status and the most recent dead letters"""
+    counts = dict(db.session.query(EmailOutbox.status, func.count(EmailOutbox.id)).group_by(EmailOutbox.status).all())
+    oldest_pending = db.session.query(func.min(EmailOutbox.created_at)).filter(
+        EmailOutbox.status.in_(('pending', 'sending'))
+    ).scalar()
+    dead = EmailOutbox.query.filter_by(status='dead').order_by(EmailOutbox.id.desc()).limit(dead_limit).all()
+    return {
+        'counts': {status: counts.get(status, 0) for status in ('pending', 'sending', 'sent', 'dead')},
+        'oldest_pending': oldest_pending.isoformat() if oldest_pending else None,
+        'dead_letters': [{
+            'id': message.id,
+            'idempotency_key': message.idempotency_key,
+            'recipient': message.recipient,
+            'subject': message.subject,
+            'attempts': message.attempts,
+            'last_error': message.last_error,
+            'created_at': message.created_at.isoformat() if message.created_at else None
+        } for message in dead]
+    }
+
+
+def retry_dead_letters(ids=None, now=None):
+    """Queue dead-lettered messages (all, or the given ids) for a fresh set of attempts"""
+    now = now or datetime.utcnow()
+    criteria = [EmailOutbox.status == 'dead']
+    if ids is not None:
+        criteria.append(EmailOutbox.id.in_(ids))
+    return run_write(lambda db_session: db_session.execute(
+        update(EmailOutbox).where(*criteria).values(status='pending', attempts=0, next_attempt_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount)
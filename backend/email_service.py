@@ -1,35 +1,76 @@
 from flask_mail import Mail, Message
-from flask import current_app
+from jinja2 import Environment
 from datetime import datetime
 
 mail = Mail()
 
+# Digest templates are compiled once at import; sending only renders them
+_text_templates = Environment(trim_blocks=True, lstrip_blocks=True)
+_html_templates = Environment(trim_blocks=True, lstrip_blocks=True, autoescape=True)
+
+DIGEST_TEXT_TEMPLATE = _text_templates.from_string("""Hello,
+
+You have {{ reminders|length }} reminders:
+{% for reminder in reminders %}
+
+- {{ reminder.title }}
+  Date: {{ reminder.date }}{{ reminder.time }}
+{% if reminder.description %}
+  Details: {{ reminder.description }}
+{% endif %}
+{% if reminder.pill_count %}
+  Pill Count: {{ reminder.pill_count }}
+{% endif %}
+{% endfor %}
+
+Best regards,
+Dental Tracker
+""")
+
+DIGEST_HTML_TEMPLATE = _html_templates.from_string("""<!DOCTYPE html>
+<html>
+<body style="font-family: Arial, sans-serif; color: #333;">
+  <p>Hello,</p>
+  <p>You have {{ reminders|length }} reminders:</p>
+  <ul>
+  {% for reminder in reminders %}
+    <li style="margin-bottom: 12px;">
+      <strong>{{ reminder.title }}</strong><br>
+      {{ reminder.date }}{{ reminder.time }}
+      {% if reminder.description %}<br>{{ reminder.description }}{% endif %}
+      {% if reminder.pill_count %}<br>Pill Count: {{ reminder.pill_count }}{% endif %}
+    </li>
+  {% endfor %}
+  </ul>
+  <p>Best regards,<br>Dental Tracker</p>
+</body>
+</html>
+""")
+
 def init_mail(app):
     """Initialize Flask-Mail with app configuration"""
     mail.init_app(app)
 
-def send_reminder_email(user_email, reminder):
+def render_reminder_email(reminder):
     """
-    Send a reminder email to the user
+    Subject and plain text body for a reminder email
     
     Args:
-        user_email: User's email address
         reminder: Reminder object with title, date, time, description, type
     """
-    try:
-        # Format the date
-        reminder_date = reminder.date.strftime('%B %d, %Y')  # e.g., "February 02, 2026"
-        
-        # Format time if available
-        time_str = ""
-        if reminder.time:
-            time_str = f" at {reminder.time.strftime('%I:%M %p')}"  # e.g., "at 02:30 PM"
-        
-        # Email subject
-        subject = f"Reminder: {reminder.title}"
-        
-        # Email body (plain text)
-        body = f"""Hello,
+    # Format the date
+    reminder_date = reminder.date.strftime('%B %d, %Y')  # e.g., "February 02, 2026"
+    
+    # Format time if available
+    time_str = ""
+    if reminder.time:
+        time_str = f" at {reminder.time.strftime('%I:%M %p')}"  # e.g., "at 02:30 PM"
+    
+    # Email subject
+    subject = f"Reminder: {reminder.title}"
+    
+    # Email body (plain text)
+    body = f"""Hello,
 
 This is a reminder about:
 
@@ -37,28 +78,40 @@ This is a reminder about:
 
 Date: {reminder_date}{time_str}
 """
-        
-        # Add description if available
-        if reminder.description:
-            body += f"\nDetails: {reminder.description}"
-        
-        # Add medication-specific info
-        if reminder.type == 'medication' and reminder.pill_count:
-            body += f"\n\nPill Count: {reminder.pill_count}"
-        
-        body += "\n\nBest regards,\nDental Tracker"
-        
-        # Create and send message
-        msg = Message(
-            subject=subject,
-            recipients=[user_email],
-            body=body
-        )
-        
-        mail.send(msg)
-        current_app.logger.info(f"Email sent successfully to {user_email} for reminder: {reminder.title}")
-        return True
-        
-    except Exception as e:
-        current_app.logger.error(f"Failed to send email to {user_email}: {str(e)}")
-        return False
+    
+    # Add description if available
+    if reminder.description:
+        body += f"\nDetails: {reminder.description}"
+    
+    # Add medication-specific info
+    if reminder.type == 'medication' and reminder.pill_count:
+        body += f"\n\nPill Count: {reminder.pill_count}"
+    
+    body += "\n\nBest regards,\nDental Tracker"
+    return subject, body
+
+def _digest_entry(reminder):
+    """Template fields for one reminder, formatted like render_reminder_email"""
+    return {
+        'title': reminder.title,
+        'date': reminder.date.strftime('%B %d, %Y'),
+        'time': f" at {reminder.time.strftime('%I:%M %p')}" if reminder.time else '',
+        'description': reminder.description,
+        'pill_count': reminder.pill_count if reminder.type == 'medication' else None
+    }
+
+def render_reminder_digest(reminders):
+    """Subject, plain text and HTML for one email covering several reminders"""
+    entries = [_digest_entry(reminder) for reminder in reminders]
+    subject = f"Reminders: {entries[0]['title']} and {len(entries) - 1} more"
+    return subject, DIGEST_TEXT_TEMPLATE.render(reminders=entries), DIGEST_HTML_TEMPLATE.render(reminders=entries)
+
+def build_message(recipient, subject, body, html=None, message_id=None):
+    """
+    A Message for the outbox sender. A stable message_id lets mail clients
+    drop a duplicate if a retry resends an email that did go out.
+    """
+    msg = Message(subject=subject, recipients=[recipient], body=body, html=html)
+    if message_id:
+        msg.msgId = message_id
+    return msg
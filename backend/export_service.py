@@ -0,0 +1,145 @@
+"""
+Streaming full-account export.
+
+generate_account_export() yields a zip archive piece by piece:
+
+    manifest.json        account details and row counts
+    habits.ndjson        one DailyHabit per line
+    reminders.ndjson     one Reminder per line
+    checkups.ndjson      one AICheckup per line, analysis parsed, image path in the archive
+    images/<file>        the uploaded checkup images
+
+Rows are paged from the database with yield_per and images are read in
+fixed-size chunks, so memory stays flat however large the account is.
+"""
+from datetime import date, datetime, time
+import json
+import os
+import zipfile
+from sqlalchemy import select
+from models import db, User, DailyHabit, AICheckup, Reminder
+
+
+class _ZipStream:
+    """
+    Write-only file object for ZipFile that hands out what was written.
+    ZipFile detects that it cannot seek and writes data descriptors instead.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _json_value(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return value
+
+
+def _row_dict(row, exclude=()):
+    return {key: _json_value(value) for key, value in row._mapping.items() if key not in exclude}
+
+
+def _stream_rows(model, user_id, batch_size, order_by='id'):
+    """Yield one user's rows of a table, fetched batch_size at a time"""
+    table = model.__table__
+    statement = select(table).where(table.c.user_id == user_id).order_by(table.c[order_by], table.c.id)
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    try:
+        for row in result:
+            yield row
+    finally:
+        result.close()
+
+
+def _archive_image_name(image_path, upload_folder):
+    """Name of an upload inside the archive, or None if it is not a readable upload"""
+    if not image_path:
+        return None
+    real_path = os.path.realpath(image_path)
+    upload_root = os.path.realpath(upload_folder)
+    if os.path.commonpath([real_path, upload_root]) != upload_root or not os.path.isfile(real_path):
+        return None
+    return f"images/{os.path.basename(real_path)}"
+
+
+def _checkup_dict(row, upload_folder):
+    checkup = _row_dict(row, exclude=('user_id', 'image_path', 'analysis_result'))
+    try:
+        checkup['analysis'] = json.loads(row.analysis_result) if row.analysis_result else None
+    except ValueError:
+        checkup['analysis'] = row.analysis_result
+    checkup['image'] = _archive_image_name(row.image_path, upload_folder)
+    return checkup
+
+
+def generate_account_export(user_id, upload_folder, batch_size=500, chunk_size=64 * 1024):
+    """Yield the bytes of a zip archive with everything stored for a user"""
+    stream = _ZipStream()
+    counts = {}
+
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        sections = [
+            ('habits.ndjson', DailyHabit, lambda row: _row_dict(row, exclude=('user_id',))),
+            ('reminders.ndjson', Reminder, lambda row: _row_dict(row, exclude=('user_id',))),
+            ('checkups.ndjson', AICheckup, lambda row: _checkup_dict(row, upload_folder)),
+        ]
+        for name, model, serialize in sections:
+            count = 0
+            with archive.open(name, 'w', force_zip64=True) as entry:
+                for row in _stream_rows(model, user_id, batch_size):
+                    entry.write(json.dumps(serialize(row), ensure_ascii=False).encode('utf-8') + b'\n')
+                    count += 1
+                    if count % batch_size == 0:
+                        yield stream.drain()
+            counts[name.split('.')[0]] = count
+            yield stream.drain()
+
+        # Second pass for images, so no list of paths is held in memory
+        counts['images'] = 0
+        previous_name = None
+        for row in _stream_rows(AICheckup, user_id, batch_size, order_by='image_path'):
+            image_name = _archive_image_name(row.image_path, upload_folder)
+            # Identical uploads share one stored file; ordering by path makes them adjacent
+            if not image_name or image_name == previous_name:
+                continue
+            previous_name = image_name
+            # Images are already compressed; storing them saves CPU
+            info = zipfile.ZipInfo(image_name, date_time=datetime.now().timetuple()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            with open(row.image_path, 'rb') as source, archive.open(info, 'w', force_zip64=True) as entry:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    entry.write(chunk)
+                    yield stream.drain()
+            counts['images'] += 1
+            yield stream.drain()
+
+        user = db.session.get(User, user_id)
+        manifest = {
+            'exported_at': datetime.utcnow().isoformat(),
+            'user': {
+                'id': user.id,
+                'username': user.username,
+                'email': user.email,
+                'created_at': _json_value(user.created_at),
+            },
+            'counts': counts,
+        }
+        archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+
+    yield stream.drain()
@@ -0,0 +1,36 @@
+"""
+Gunicorn settings, picked up by `gunicorn app:app` run from backend/.
+
+With PROMETHEUS_MULTIPROC_DIR set, each worker writes its metrics to files
+in that directory and /metrics aggregates them. The files of a previous run
+are removed at startup, and a worker's live gauges are dropped when it exits.
+
+Each worker also gets a MODEL_WORKER_INDEX, the lowest index no live worker
+holds, so MODEL_CPU_AFFINITY gives a replacement worker its predecessor's CPUs.
+"""
+import glob
+import itertools
+import os
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, '*.db')):
+            os.remove(path)
+
+
+def pre_fork(server, worker):
+    taken = {getattr(live, 'model_worker_index', None) for live in server.WORKERS.values()}
+    worker.model_worker_index = next(index for index in itertools.count() if index not in taken)
+
+
+def post_fork(server, worker):
+    os.environ['MODEL_WORKER_INDEX'] = str(worker.model_worker_index)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,75 @@
+"""
+Compact encodings for habit calendars.
+
+Day i of a range is bit i of a bitmap, least significant bit first within
+each byte, sent as base64. Brushing times of the tracked days, in date order,
+are run-length encoded as a flat [value, run, value, run, ...] list, with 0
+for tracked days without a time. Gaps in tracking therefore don't break runs.
+"""
+import base64
+
+# About ten years; keeps a single response bounded
+MAX_CALENDAR_DAYS = 3660
+
+
+def pack_bits(offsets, length):
+    """Base64 bitmap of `length` bits with the given offsets set"""
+    bitmap = bytearray((length + 7) // 8)
+    for offset in offsets:
+        bitmap[offset >> 3] |= 1 << (offset & 7)
+    return base64.b64encode(bytes(bitmap)).decode('ascii')
+
+
+def unpack_bits(encoded, length):
+    """Offsets set in a bitmap produced by pack_bits"""
+    bitmap = base64.b64decode(encoded)
+    return [i for i in range(length) if bitmap[i >> 3] >> (i & 7) & 1]
+
+
+def run_length_encode(values):
+    """[5, 5, 5, 0, 0] -> [5, 3, 0, 2]"""
+    encoded = []
+    for value in values:
+        if encoded and encoded[-2] == value:
+            encoded[-1] += 1
+        else:
+            encoded.extend([value, 1])
+    return encoded
+
+
+def run_length_decode(encoded):
+    values = []
+    for i in range(0, len(encoded), 2):
+        values.extend([encoded[i]] * encoded[i + 1])
+    return values
+
+
+def encode_habit_calendar(rows, start, end):
+    """
+    Encode (date, brushed, flossed, brushing_time) rows for start..end inclusive.
+    Rows outside the range are ignored.
+    """
+    length = (end - start).days + 1
+    tracked, brushed, flossed = [], [], []
+    brushing_times = {}
+
+    for day, day_brushed, day_flossed, brushing_time in rows:
+        offset = (day - start).days
+        if not 0 <= offset < length:
+            continue
+        tracked.append(offset)
+        if day_brushed:
+            brushed.append(offset)
+        if day_flossed:
+            flossed.append(offset)
+        brushing_times[offset] = brushing_time or 0
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'days': length,
+        'tracked': pack_bits(tracked, length),
+        'brushed': pack_bits(brushed, length),
+        'flossed': pack_bits(flossed, length),
+        'brushing_time_rle': run_length_encode(brushing_times[offset] for offset in sorted(brushing_times)),
+    }
@@ -0,0 +1,164 @@
+"""
+Habit upserts for offline sync.
+
+Writes go through one dialect-native INSERT ... ON CONFLICT (user_id, date)
+DO UPDATE statement, so there is no SELECT-then-write race against the
+unique_daily_habit constraint. Other dialects fall back to a locking
+SELECT-then-write per row; a concurrent insert of the same day there fails
+the write with an IntegrityError instead of being merged. Each row carries
+an updated_at timestamp and an existing row is only overwritten by a write
+that is at least as new (last write wins).
+"""
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import or_
+from sqlalchemy.dialects import postgresql, sqlite
+from models import DailyHabit
+
+HABIT_FIELDS = ('brushed', 'flossed', 'brushing_time')
+
+# Rows per statement; 8 parameters each stays well under SQLite's variable limit
+UPSERT_CHUNK_SIZE = 500
+
+MAX_SYNC_ENTRIES = 1000
+
+_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def parse_habit_fields(data):
+    """
+    Validate the brushed/flossed/brushing_time fields present in `data`.
+    Returns (fields, error).
+    """
+    fields = {}
+    for field in ('brushed', 'flossed'):
+        if field in data:
+            if not isinstance(data[field], bool):
+                return None, f"{field} must be true or false"
+            fields[field] = data[field]
+    if 'brushing_time' in data:
+        brushing_time = data['brushing_time']
+        if brushing_time is not None and (isinstance(brushing_time, bool) or not isinstance(brushing_time, int)
+                                          or brushing_time < 0):
+            return None, 'brushing_time must be a non-negative integer or null'
+        fields['brushing_time'] = brushing_time
+    return fields, None
+
+
+def parse_sync_entry(entry, now=None):
+    """
+    Validate one {date, brushed?, flossed?, brushing_time?, updated_at?} entry.
+    Returns (row, error). Client timestamps in the future are clamped to now
+    so a device with a fast clock cannot pin a row forever.
+    """
+    now = now or datetime.utcnow()
+
+    if not isinstance(entry, dict) or 'date' not in entry:
+        return None, 'Each entry needs a date'
+    try:
+        day = datetime.strptime(entry['date'], '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None, f"Invalid date: {entry.get('date')!r}. Use YYYY-MM-DD"
+    # Allow one day of slack for clients ahead of the server's timezone
+    if day > now.date() + timedelta(days=1):
+        return None, f"Date {entry['date']} is in the future"
+
+    fields, error = parse_habit_fields(entry)
+    if error:
+        return None, error
+    row = {'date': day, **fields}
+
+    if entry.get('updated_at'):
+        try:
+            updated_at = datetime.fromisoformat(entry['updated_at'].replace('Z', '+00:00'))
+        except (AttributeError, ValueError):
+            return None, f"Invalid updated_at: {entry['updated_at']!r}. Use ISO 8601"
+        # Stored timestamps are naive UTC, like created_at
+        if updated_at.tzinfo:
+            updated_at = updated_at.astimezone(timezone.utc).replace(tzinfo=None)
+        row['updated_at'] = min(updated_at, now)
+    else:
+        row['updated_at'] = now
+
+    return row, None
+
+
+def upsert_statement(dialect_name, rows, fields):
+    """INSERT ... ON CONFLICT DO UPDATE of `fields` where the incoming row is newer"""
+    insert = _INSERTS.get(dialect_name)
+    if insert is None:
+        raise NotImplementedError(f"Habit upserts are not supported on {dialect_name}")
+
+    table = DailyHabit.__table__
+    statement = insert(table).values(rows)
+    excluded = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.date],
+        set_={**{field: excluded[field] for field in fields}, 'updated_at': excluded.updated_at},
+        where=or_(table.c.updated_at.is_(None), table.c.updated_at <= excluded.updated_at)
+    )
+
+
+def upsert_rows_portable(db_session, user_id, values, fields):
+    """SELECT-then-write fallback for dialects without ON CONFLICT; returns rows applied"""
+    applied = 0
+    for value in values:
+        habit = db_session.query(DailyHabit).filter_by(
+            user_id=user_id, date=value['date']
+        ).with_for_update().first()
+        if habit is None:
+            db_session.add(DailyHabit(**value))
+        elif habit.updated_at is None or habit.updated_at <= value['updated_at']:
+            for field in fields:
+                setattr(habit, field, value[field])
+            habit.updated_at = value['updated_at']
+        else:
+            continue
+        applied += 1
+    db_session.flush()
+    return applied
+
+
+def upsert_habits(db_session, user_id, rows):
+    """
+    Upsert parsed rows for a user and return how many were applied.
+    Rows that set the same fields share one statement per chunk; a row only
+    overwrites the fields it carries.
+    """
+    dialect_name = db_session.get_bind().dialect.name
+    created_at = datetime.utcnow()
+
+    # One statement may not touch the same row twice; keep the newest entry per date
+    latest = {}
+    for row in rows:
+        if row['date'] not in latest or latest[row['date']]['updated_at'] <= row['updated_at']:
+            latest[row['date']] = row
+
+    groups = {}
+    for row in latest.values():
+        fields = tuple(field for field in HABIT_FIELDS if field in row)
+        groups.setdefault(fields, []).append(row)
+
+    applied = 0
+    for fields, group in groups.items():
+        values = [
+            {
+                'user_id': user_id,
+                'date': row['date'],
+                'brushed': row.get('brushed', False),
+                'flossed': row.get('flossed', False),
+                'brushing_time': row.get('brushing_time'),
+                'created_at': created_at,
+                'updated_at': row['updated_at'],
+            }
+            for row in group
+        ]
+        if dialect_name not in _INSERTS:
+            applied += upsert_rows_portable(db_session, user_id, values, fields)
+            continue
+        for start in range(0, len(values), UPSERT_CHUNK_SIZE):
+            result = db_session.execute(upsert_statement(dialect_name, values[start:start + UPSERT_CHUNK_SIZE], fields))
+            applied += result.rowcount
+    return applied
@@ -0,0 +1,319 @@
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+import warnings
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), 'model')
+
+# Default model file for each backend, relative to MODEL_DIR
+DEFAULT_MODEL_FILES = {
+    'keras': 'model_vi.h5',
+    'tflite': 'model_vi_float16.tflite',
+    'onnx': 'model_vi.onnx',
+}
+
+
+class InferenceBackend:
+    """
+    Base class for inference backends.
+    A backend takes a preprocessed float32 batch of shape (N, 224, 224, 3)
+    and returns class probabilities of shape (N, num_classes).
+    """
+    name = None
+    requires_model_file = True
+
+    def __init__(self, model_path, intra_op_threads=None, inter_op_threads=None):
+        self.model_path = model_path
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+
+    def predict(self, batch):
+        raise NotImplementedError
+
+
+class KerasBackend(InferenceBackend):
+    """
+    Full TensorFlow/Keras backend loading the original .h5 model.
+
+    By default the model is called directly through a traced tf.function
+    (optionally XLA-compiled) instead of Model.predict, which builds a data
+    adapter and runs a full predict loop on every call. Batches are padded
+    up to a few bucketed sizes so the function is only traced once per bucket.
+    """
+    name = 'keras'
+
+    def __init__(self, model_path, intra_op_threads=None, inter_op_threads=None,
+                 direct_call=None, jit_compile=None, batch_buckets=None):
+        super().__init__(model_path, intra_op_threads, inter_op_threads)
+        import tensorflow as tf
+        from tensorflow.keras.models import load_model
+
+        # Suppress TensorFlow logging
+        tf.get_logger().setLevel('ERROR')
+
+        # Thread pools can only be sized before TensorFlow initializes them
+        try:
+            if intra_op_threads:
+                tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+            if inter_op_threads:
+                tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+        except RuntimeError as e:
+            # Already initialized (a model was loaded earlier in this process),
+            # so the pools keep their first size
+            logger.warning("Could not set TensorFlow thread pools to %s/%s: %s", intra_op_threads, inter_op_threads, e)
+
+        # Suppress warnings during model loading
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            self.model = load_model(model_path, compile=False)
+
+        if direct_call is None:
+            direct_call = os.environ.get('MODEL_DIRECT_CALL', 'True') == 'True'
+        if jit_compile is None:
+            jit_compile = os.environ.get('MODEL_XLA', 'False') == 'True'
+        if batch_buckets is None:
+            batch_buckets = os.environ.get('MODEL_BATCH_BUCKETS', '1,4,8,16,32')
+            batch_buckets = [int(b) for b in batch_buckets.split(',')]
+
+        self.direct_call = direct_call
+        self.jit_compile = jit_compile
+        self.batch_buckets = sorted(batch_buckets)
+
+        if self.direct_call:
+            input_shape = tuple(self.model.input_shape[1:])
+            self._infer = tf.function(
+                lambda batch: self.model(batch, training=False),
+                input_signature=[tf.TensorSpec((None,) + input_shape, tf.float32)],
+                jit_compile=jit_compile
+            )
+            # Trace (and compile) the batch-of-one bucket up front
+            self._infer(np.zeros((self.batch_buckets[0],) + input_shape, dtype=np.float32))
+
+    def _bucket_for(self, size):
+        for bucket in self.batch_buckets:
+            if bucket >= size:
+                return bucket
+        return self.batch_buckets[-1]
+
+    def predict(self, batch):
+        if not self.direct_call:
+            return self.model.predict(batch, verbose=0)
+
+        batch = np.asarray(batch, dtype=np.float32)
+        max_bucket = self.batch_buckets[-1]
+        outputs = []
+
+        for start in range(0, len(batch), max_bucket):
+            chunk = batch[start:start + max_bucket]
+            bucket = self._bucket_for(len(chunk))
+            if bucket > len(chunk):
+                padding = np.zeros((bucket - len(chunk),) + chunk.shape[1:], dtype=np.float32)
+                chunk = np.concatenate([chunk, padding])
+            outputs.append(self._infer(chunk).numpy()[:min(max_bucket, len(batch) - start)])
+
+        return np.concatenate(outputs)
+
+
+class TFLiteBackend(InferenceBackend):
+    """
+    TFLite backend for float16 or int8-quantized exports.
+    Uses the small tflite_runtime package when installed and
+    falls back to the interpreter bundled with TensorFlow.
+    """
+    name = 'tflite'
+
+    def __init__(self, model_path, intra_op_threads=None, inter_op_threads=None):
+        super().__init__(model_path, intra_op_threads, inter_op_threads)
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_path=model_path, num_threads=intra_op_threads)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        # The interpreter holds mutable tensor buffers and is not thread-safe
+        self._lock = threading.Lock()
+
+    def _resize_input(self, shape):
+        if tuple(self.input_details['shape']) != tuple(shape):
+            self.interpreter.resize_tensor_input(self.input_details['index'], shape)
+            self.interpreter.allocate_tensors()
+            self.input_details = self.interpreter.get_input_details()[0]
+            self.output_details = self.interpreter.get_output_details()[0]
+
+    def predict(self, batch):
+        with self._lock:
+            self._resize_input(batch.shape)
+
+            input_dtype = self.input_details['dtype']
+            if input_dtype in (np.int8, np.uint8):
+                # Fully quantized model with integer input
+                scale, zero_point = self.input_details['quantization']
+                batch = np.round(batch / scale + zero_point)
+                info = np.iinfo(input_dtype)
+                batch = np.clip(batch, info.min, info.max)
+            batch = batch.astype(input_dtype)
+
+            self.interpreter.set_tensor(self.input_details['index'], batch)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self.output_details['index'])
+
+            if self.output_details['dtype'] in (np.int8, np.uint8):
+                scale, zero_point = self.output_details['quantization']
+                output = (output.astype(np.float32) - zero_point) * scale
+
+            return output.astype(np.float32)
+
+
+class OnnxBackend(InferenceBackend):
+    """ONNX Runtime backend on the CPU execution provider"""
+    name = 'onnx'
+
+    def __init__(self, model_path, intra_op_threads=None, inter_op_threads=None):
+        super().__init__(model_path, intra_op_threads, inter_op_threads)
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=['CPUExecutionProvider']
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        return self.session.run(None, {self.input_name: batch.astype(np.float32)})[0]
+
+
+class FakeBackend(InferenceBackend):
+    """
+    Deterministic stand-in for load testing without TensorFlow or a model file.
+
+    Each image gets class probabilities derived from a hash of its pixels, so
+    the same upload always gives the same result. Every call takes a sampled
+    latency, part of which is spent busy-looping to simulate inference CPU load.
+
+    Environment:
+        MODEL_FAKE_LATENCY_MS         mean latency per image (default 50)
+        MODEL_FAKE_LATENCY_JITTER_MS  spread of the latency (default 10)
+        MODEL_FAKE_LATENCY_DIST       constant, normal or lognormal (default normal)
+        MODEL_FAKE_CPU_BURN           fraction of the latency spent on CPU (default 0.5)
+    """
+    name = 'fake'
+    requires_model_file = False
+
+    def __init__(self, model_path=None, intra_op_threads=None, inter_op_threads=None,
+                 num_classes=6, latency_ms=None, jitter_ms=None, distribution=None,
+                 cpu_burn=None, seed=None):
+        super().__init__(model_path, intra_op_threads, inter_op_threads)
+        self.num_classes = num_classes
+        self.latency_ms = float(os.environ.get('MODEL_FAKE_LATENCY_MS', 50)) \
+            if latency_ms is None else latency_ms
+        self.jitter_ms = float(os.environ.get('MODEL_FAKE_LATENCY_JITTER_MS', 10)) \
+            if jitter_ms is None else jitter_ms
+        self.distribution = os.environ.get('MODEL_FAKE_LATENCY_DIST', 'normal') \
+            if distribution is None else distribution
+        self.cpu_burn = float(os.environ.get('MODEL_FAKE_CPU_BURN', 0.5)) \
+            if cpu_burn is None else cpu_burn
+
+        if self.distribution not in ('constant', 'normal', 'lognormal'):
+            raise ValueError(f"Unknown fake latency distribution: {self.distribution}")
+
+        # random.Random methods are safe to call from several threads,
+        # unlike the global NumPy RNG
+        self._latency_rng = random.Random(seed)
+
+    def sample_latency(self):
+        """Latency in seconds for one image"""
+        if self.distribution == 'constant' or self.latency_ms <= 0:
+            latency_ms = self.latency_ms
+        elif self.distribution == 'normal':
+            latency_ms = self._latency_rng.gauss(self.latency_ms, self.jitter_ms)
+        else:
+            # Parameterise the lognormal so its mean and stddev match the settings
+            variance = np.log(1 + (self.jitter_ms / self.latency_ms) ** 2)
+            mu = np.log(self.latency_ms) - variance / 2
+            latency_ms = self._latency_rng.lognormvariate(mu, np.sqrt(variance))
+        return max(latency_ms, 0.0) / 1000
+
+    def probabilities(self, image):
+        """Softmax over logits seeded from the image's SHA-256"""
+        digest = hashlib.sha256(np.ascontiguousarray(image).tobytes()).digest()
+        rng = np.random.default_rng(int.from_bytes(digest[:8], 'little'))
+        logits = rng.normal(0.0, 2.5, self.num_classes)
+        exp = np.exp(logits - logits.max())
+        return (exp / exp.sum()).astype(np.float32)
+
+    def predict(self, batch):
+        latency = sum(self.sample_latency() for _ in range(len(batch)))
+        burn = latency * self.cpu_burn
+
+        start = time.perf_counter()
+        outputs = np.stack([self.probabilities(image) for image in batch])
+
+        # Busy-loop for the CPU share, then sleep for the rest
+        while time.perf_counter() - start < burn:
+            pass
+        remaining = latency - (time.perf_counter() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+
+        return outputs
+
+
+BACKENDS = {
+    KerasBackend.name: KerasBackend,
+    TFLiteBackend.name: TFLiteBackend,
+    OnnxBackend.name: OnnxBackend,
+    FakeBackend.name: FakeBackend,
+}
+
+
+def get_backend_name():
+    """Backend selected through the MODEL_BACKEND environment variable"""
+    return os.environ.get('MODEL_BACKEND', 'keras').lower()
+
+
+def get_model_path(backend_name):
+    """
+    Model path from MODEL_PATH, or the default file for the backend.
+    None for backends that do not need a model file.
+    """
+    if os.environ.get('MODEL_PATH'):
+        return os.environ['MODEL_PATH']
+    if backend_name not in DEFAULT_MODEL_FILES:
+        return None
+    return os.path.join(MODEL_DIR, DEFAULT_MODEL_FILES[backend_name])
+
+
+def model_available(backend_name, model_path):
+    """Whether the backend can be loaded: its model file exists, or it needs none"""
+    if not BACKENDS[backend_name].requires_model_file:
+        return True
+    return bool(model_path) and os.path.exists(model_path)
+
+
+def load_backend(backend_name, model_path, **options):
+    """
+    Instantiate the named backend for the given model file.
+    Options such as intra_op_threads are passed to the backend constructor.
+    """
+    if backend_name not in BACKENDS:
+        raise ValueError(
+            f"Unknown model backend '{backend_name}'. "
+            f"Choose one of: {', '.join(BACKENDS)}"
+        )
+    return BACKENDS[backend_name](model_path, **options)
@@ -0,0 +1,142 @@
+"""
+Centralized, non-blocking logging setup.
+
+Request threads only push records onto an in-memory queue. A background
+listener thread formats them and writes to stdout, so slow or blocked stdout
+never stalls a request. Messages are formatted lazily on the listener thread,
+which is why hot-path call sites pass %-style arguments instead of f-strings.
+
+Environment:
+    LOG_LEVEL          root log level (default INFO)
+    LOG_FORMAT         json or text (default json)
+    LOG_QUEUE          write through the background queue (default True)
+    LOG_SAMPLE_RATE    fraction of repetitive low-level lines to keep (default 1.0)
+    LOG_SAMPLE_LEVEL   records at or below this level are sampled (default DEBUG)
+"""
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any `extra` fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep one in every N records at or below `level` for each message template.
+    Records above the level (warnings and errors) always pass.
+    """
+
+    def __init__(self, rate, level=logging.DEBUG):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else None
+        self.level = level
+        self._counters = {}
+
+    def filter(self, record):
+        if record.levelno > self.level:
+            return True
+        if self.every is None:
+            return False
+
+        key = (record.name, record.msg)
+        counter = self._counters.get(key)
+        if counter is None:
+            # f-string messages make every line a new template; bound the table
+            if len(self._counters) > 10000:
+                self._counters.clear()
+            counter = self._counters.setdefault(key, itertools.count())
+        return next(counter) % self.every == 0
+
+
+# Args that cannot change between the log call and the listener formatting them
+_IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+    The stock handler formats every record in the calling thread before
+    enqueueing it, which is exactly the work we want off the request path.
+    Records whose args are anything but immutable primitives (dicts, ORM
+    objects, exceptions...) are still formatted here, since the caller
+    could change them before the listener gets to them.
+    """
+
+    def prepare(self, record):
+        args = record.args if isinstance(record.args, tuple) else (record.args,)
+        if not isinstance(record.msg, str) or not all(isinstance(arg, _IMMUTABLE_ARGS) for arg in args):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def setup_logging():
+    """Configure the root logger once; safe to call repeatedly"""
+    global _listener
+
+    root = logging.getLogger()
+    if getattr(root, '_dental_logging_configured', False):
+        return root
+
+    level = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    log_format = os.environ.get('LOG_FORMAT', 'json')
+    use_queue = os.environ.get('LOG_QUEUE', 'True') == 'True'
+    sample_rate = float(os.environ.get('LOG_SAMPLE_RATE', 1.0))
+    sample_level = logging.getLevelName(os.environ.get('LOG_SAMPLE_LEVEL', 'DEBUG').upper())
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if log_format == 'json':
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    if use_queue:
+        handler = LazyQueueHandler(queue.SimpleQueue())
+        _listener = logging.handlers.QueueListener(handler.queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+    else:
+        handler = stream_handler
+
+    if sample_rate < 1.0:
+        handler.addFilter(SamplingFilter(sample_rate, sample_level))
+
+    root.addHandler(handler)
+    root.setLevel(level)
+    root._dental_logging_configured = True
+
+    return root
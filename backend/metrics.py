@@ -0,0 +1,223 @@
+"""
+Prometheus metrics for requests, queries, the model and background jobs.
+
+Under gunicorn each worker process has its own counters. Set
+PROMETHEUS_MULTIPROC_DIR (an empty directory, cleared at startup by
+gunicorn.conf.py) before the app starts and the workers write their metrics
+there; /metrics then aggregates every live worker instead of reporting
+whichever one happened to answer the scrape.
+"""
+import ipaddress
+import os
+from flask import Response, g, jsonify, request
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest,
+                               CONTENT_TYPE_LATEST, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import time
+from request_timing import is_admin_request
+
+# HTTP
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Request latency by route',
+    ['method', 'route', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight',
+    'Requests currently being handled',
+    multiprocess_mode='livesum'
+)
+
+# Database
+DB_QUERIES_PER_REQUEST = Histogram(
+    'db_queries_per_request',
+    'Number of SQL statements executed per request',
+    ['route'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+DB_TIME_PER_REQUEST = Histogram(
+    'db_query_seconds_per_request',
+    'Total SQL execution time per request',
+    ['route'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+)
+DB_QUERIES = Counter('db_queries_total', 'SQL statements executed')
+DB_CONNECTIONS_OPENED = Counter(
+    'db_connections_opened_total',
+    'New database connections opened by this process (pool churn)'
+)
+DB_WRITE_QUEUE_DEPTH = Gauge(
+    'db_write_queue_depth',
+    'Writes waiting for the single-writer thread',
+    multiprocess_mode='livesum'
+)
+DB_WRITE_BATCH_SIZE = Histogram(
+    'db_write_batch_size',
+    'Writes committed together by the single-writer thread',
+    buckets=(1, 2, 5, 10, 20, 50, 100)
+)
+
+# Caches
+DASHBOARD_CACHE_REQUESTS = Counter(
+    'dashboard_cache_requests_total',
+    'Dashboard requests by cache outcome',
+    ['outcome']
+)
+
+# Uploads
+UPLOADS_STORED = Counter(
+    'uploads_stored_total',
+    'Uploaded images stored, by whether the content was new or a duplicate',
+    ['outcome']
+)
+UPLOAD_BLOBS_COLLECTED = Counter(
+    'upload_blobs_collected_total',
+    'Unreferenced upload blobs deleted by garbage collection'
+)
+
+# Model
+MODEL_PREPROCESS_LATENCY = Histogram(
+    'model_preprocess_seconds',
+    'Image decode and preprocessing time',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+)
+MODEL_INFERENCE_LATENCY = Histogram(
+    'model_inference_seconds',
+    'Model inference time',
+    ['backend'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+MODEL_PREDICTIONS = Counter(
+    'model_predictions_total',
+    'Predictions served',
+    ['backend', 'outcome']
+)
+MODEL_INFO = Gauge(
+    'model_info',
+    'Active model version (value is always 1)',
+    ['version', 'backend'],
+    multiprocess_mode='liveall'  # Per worker: each one reloads its own model
+)
+MODEL_RELOADS = Counter(
+    'model_reloads_total',
+    'Model hot reloads',
+    ['outcome']
+)
+INFERENCE_QUEUE_DEPTH = Gauge(
+    'model_inference_queue_depth',
+    'Predictions waiting for or running on the model',
+    multiprocess_mode='livesum'
+)
+
+# Scheduler
+SCHEDULER_JOB_LATENCY = Histogram(
+    'scheduler_job_duration_seconds',
+    'Scheduler job run time',
+    ['job'],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300)
+)
+SCHEDULER_SLICES = Counter(
+    'scheduler_slices_total',
+    'Scheduler time slices by how this instance took part (owned, helped, skipped)',
+    ['job', 'role']
+)
+EMAILS_SENT = Counter('reminder_emails_sent_total', 'Reminder emails sent')
+REMINDERS_EMAILED = Counter('reminders_emailed_total', 'Reminders covered by queued emails (digests cover several)')
+EMAILS_FAILED = Counter('reminder_emails_failed_total', 'Email send attempts that failed (retried or dead-lettered)')
+EMAILS_DEAD_LETTERED = Counter('email_outbox_dead_lettered_total', 'Emails given up on after EMAIL_OUTBOX_MAX_ATTEMPTS')
+EMAIL_OUTBOX_PENDING = Gauge('email_outbox_pending', 'Emails queued or being sent', multiprocess_mode='livemax')
+
+
+def _scrape_registry():
+    """The default registry, or every worker's metrics when running multiprocess"""
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def init_metrics(app):
+    """Register request instrumentation and the /metrics endpoint"""
+    app.config.setdefault('METRICS_ALLOWED_NETWORKS', '127.0.0.1/32,::1/128')
+    allowed_networks = [
+        ipaddress.ip_network(network.strip())
+        for network in app.config['METRICS_ALLOWED_NETWORKS'].split(',') if network.strip()
+    ]
+
+    def scrape_allowed():
+        # Scrapers on an allowed network, or anyone with the admin token
+        if is_admin_request():
+            return True
+        try:
+            address = ipaddress.ip_address(request.remote_addr or '')
+        except ValueError:
+            return False
+        return any(address in network for network in allowed_networks)
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_start = time.perf_counter()
+        g.db_query_count = 0
+        g.db_query_time = 0.0
+        REQUESTS_IN_FLIGHT.inc()
+
+    @app.teardown_request
+    def record_request_metrics(exception=None):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return
+
+        REQUESTS_IN_FLIGHT.dec()
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        status = g.pop('metrics_status', 500 if exception else 200)
+
+        REQUEST_LATENCY.labels(request.method, route, status).observe(time.perf_counter() - start)
+        DB_QUERIES_PER_REQUEST.labels(route).observe(g.pop('db_query_count', 0))
+        DB_TIME_PER_REQUEST.labels(route).observe(g.pop('db_query_time', 0.0))
+
+    @app.after_request
+    def capture_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        if not scrape_allowed():
+            return jsonify({'error': 'Admin access required'}), 403
+        return Response(generate_latest(_scrape_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+    if context is not None:
+        context.metrics_timed = True
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    DB_QUERIES.inc()
+
+    # Statements run outside a request (scheduler, scripts) only hit the counter
+    if g and 'db_query_count' in g:
+        g.db_query_count += 1
+        g.db_query_time += elapsed
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute; drop its start
+    # time so the connection's stack does not grow with every error
+    if getattr(context.execution_context, 'metrics_timed', False):
+        starts = context.connection.info.get('query_start')
+        if starts:
+            starts.pop()
+
+
+def observe_scheduler_job(job):
+    """Context manager timing one scheduler job run"""
+    return SCHEDULER_JOB_LATENCY.labels(job).time()
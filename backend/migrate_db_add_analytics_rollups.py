@@ -0,0 +1,34 @@
+"""
+Database migration script to add the population analytics rollup tables and
+the covering daily_habit index their refresh uses, then build the rollups.
+Run migrate_db_add_checkup_trends.py first.
+"""
+from app import app, db
+from models import AnalyticsCheckupRollup, AnalyticsConditionRollup, AnalyticsHabitDistribution, AnalyticsState
+from population_analytics import refresh_rollups
+
+def migrate():
+    with app.app_context():
+        try:
+            for model in (AnalyticsCheckupRollup, AnalyticsConditionRollup, AnalyticsHabitDistribution, AnalyticsState):
+                model.__table__.create(db.engine, checkfirst=True)
+                print(f"✓ {model.__tablename__} table ready")
+
+            # IF NOT EXISTS works on both SQLite and Postgres
+            with db.engine.begin() as conn:
+                conn.execute(db.text(
+                    "CREATE INDEX IF NOT EXISTS ix_daily_habit_date ON daily_habit (date, user_id, brushed, flossed)"
+                ))
+            print("✓ ix_daily_habit_date on daily_habit (date, user_id, brushed, flossed)")
+
+            print("Building rollups from existing data...")
+            print(f"✓ {refresh_rollups(settle_seconds=0)}")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            raise
+
+if __name__ == '__main__':
+    print("Starting database migration...")
+    migrate()
+    print("Migration complete!")
@@ -0,0 +1,28 @@
+"""
+Database migration script to add the (user_id, date) reminder index and the
+(user_id, created_at) checkup index used by date-window queries
+"""
+from app import app, db
+
+INDEXES = [
+    ('ix_reminder_user_date', 'reminder', 'user_id, date'),
+    ('ix_ai_checkup_user_created', 'ai_checkup', 'user_id, created_at'),
+]
+
+def migrate():
+    with app.app_context():
+        try:
+            # IF NOT EXISTS works on both SQLite and Postgres
+            with db.engine.begin() as conn:
+                for name, table, columns in INDEXES:
+                    conn.execute(db.text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+                    print(f"✓ {name} on {table} ({columns})")
+                    
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            raise
+
+if __name__ == '__main__':
+    print("Starting database migration...")
+    migrate()
+    print("Migration complete!")
@@ -0,0 +1,70 @@
+"""
+Database migration script to add the typed columns behind checkup trends:
+AICheckup.health_score and the checkup_condition table, backfilled from
+the stored analysis_result JSON
+"""
+from app import app, db
+from sqlalchemy import inspect
+from models import AICheckup, CheckupCondition
+from checkup_trends import condition_rows, typed_columns
+import json
+
+BATCH_SIZE = 1000
+
+def backfill():
+    """Fill health_score and conditions for checkups that don't have them yet"""
+    filled = 0
+    last_id = 0
+    while True:
+        checkups = AICheckup.query.filter(
+            AICheckup.id > last_id,
+            AICheckup.health_score.is_(None)
+        ).order_by(AICheckup.id).limit(BATCH_SIZE).all()
+        if not checkups:
+            break
+
+        ids = [checkup.id for checkup in checkups]
+        # Re-running must not duplicate conditions
+        CheckupCondition.query.filter(CheckupCondition.checkup_id.in_(ids)).delete(synchronize_session=False)
+        for checkup in checkups:
+            try:
+                analysis = json.loads(checkup.analysis_result) if checkup.analysis_result else {}
+            except ValueError:
+                analysis = {}
+            health_score, conditions = typed_columns(analysis)
+            checkup.health_score = health_score
+            db.session.add_all(condition_rows(checkup, conditions))
+        db.session.commit()
+
+        filled += len(checkups)
+        last_id = ids[-1]
+    return filled
+
+def migrate():
+    with app.app_context():
+        try:
+            # Works on both SQLite and Postgres
+            columns = [column['name'] for column in inspect(db.engine).get_columns('ai_checkup')]
+
+            if 'health_score' not in columns:
+                print("Adding health_score column to ai_checkup table...")
+                with db.engine.begin() as conn:
+                    conn.execute(db.text("ALTER TABLE ai_checkup ADD COLUMN health_score FLOAT"))
+                print("✓ health_score column added successfully!")
+            else:
+                print("health_score column already exists.")
+
+            CheckupCondition.__table__.create(db.engine, checkfirst=True)
+            print("✓ checkup_condition table ready")
+
+            print("Backfilling from analysis_result...")
+            print(f"✓ {backfill()} checkups backfilled")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            raise
+
+if __name__ == '__main__':
+    print("Starting database migration...")
+    migrate()
+    print("Migration complete!")
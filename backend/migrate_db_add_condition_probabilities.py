@@ -0,0 +1,33 @@
+"""
+Database migration script to add checkup_condition.detected. Conditions are
+now stored for every class the model scores, with detected marking the ones
+that passed the detection cutoff. Rows saved before this only held
+detections, so they are marked detected.
+"""
+from app import app, db
+from sqlalchemy import inspect
+
+def migrate():
+    with app.app_context():
+        try:
+            # Works on both SQLite and Postgres
+            columns = [column['name'] for column in inspect(db.engine).get_columns('checkup_condition')]
+
+            if 'detected' not in columns:
+                print("Adding detected column to checkup_condition table...")
+                with db.engine.begin() as conn:
+                    conn.execute(db.text(
+                        "ALTER TABLE checkup_condition ADD COLUMN detected BOOLEAN NOT NULL DEFAULT TRUE"
+                    ))
+                print("✓ detected column added successfully!")
+            else:
+                print("detected column already exists.")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            raise
+
+if __name__ == '__main__':
+    print("Starting database migration...")
+    migrate()
+    print("Migration complete!")
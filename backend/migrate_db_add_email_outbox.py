@@ -0,0 +1,22 @@
+"""
+Database migration script to add the email_outbox table that reminder
+emails are queued in and sent from (see email_outbox.py).
+"""
+from app import app, db
+from models import EmailOutbox
+
+def migrate():
+    with app.app_context():
+        try:
+            # Creates the table and its status/next_attempt_at index
+            EmailOutbox.__table__.create(db.engine, checkfirst=True)
+            print("✓ email_outbox table ready")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            raise
+
+if __name__ == '__main__':
+    print("Starting database migration...")
+    migrate()
+    print("Migration complete!")
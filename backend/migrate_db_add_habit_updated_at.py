@@ -0,0 +1,30 @@
+"""
+Database migration script to add updated_at column to DailyHabit table
+Run this script after updating models.py; habit sync uses it for last-write-wins
+"""
+from app import app, db
+from sqlalchemy import inspect
+
+def migrate():
+    with app.app_context():
+        try:
+            # Works on both SQLite and Postgres
+            columns = [column['name'] for column in inspect(db.engine).get_columns('daily_habit')]
+            
+            if 'updated_at' not in columns:
+                print("Adding updated_at column to daily_habit table...")
+                with db.engine.begin() as conn:
+                    conn.execute(db.text("ALTER TABLE daily_habit ADD COLUMN updated_at TIMESTAMP"))
+                    conn.execute(db.text("UPDATE daily_habit SET updated_at = created_at"))
+                print("✓ updated_at column added successfully!")
+            else:
+                print("updated_at column already exists.")
+                
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            raise
+
+if __name__ == '__main__':
+    print("Starting database migration...")
+    migrate()
+    print("Migration complete!")
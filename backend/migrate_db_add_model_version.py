@@ -0,0 +1,31 @@
+"""
+Database migration script to add the model_version column to AICheckup.
+Checkups saved before it stay NULL; new ones record the version of the model
+that analysed them (see model_registry.py).
+"""
+from app import app, db
+from sqlalchemy import inspect
+
+def migrate():
+    with app.app_context():
+        try:
+            # Works on both SQLite and Postgres
+            inspector = inspect(db.engine)
+            columns = [column['name'] for column in inspector.get_columns('ai_checkup')]
+
+            if 'model_version' not in columns:
+                print("Adding model_version column to ai_checkup table...")
+                with db.engine.begin() as conn:
+                    conn.execute(db.text("ALTER TABLE ai_checkup ADD COLUMN model_version VARCHAR(100)"))
+                print("✓ model_version column added successfully!")
+            else:
+                print("model_version column already exists.")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            raise
+
+if __name__ == '__main__':
+    print("Starting database migration...")
+    migrate()
+    print("Migration complete!")
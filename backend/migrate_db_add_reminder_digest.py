@@ -0,0 +1,31 @@
+"""
+Database migration script to add the reminder_digest preference to User.
+Existing users keep one email per reminder and can opt in to digests (one
+email per day for all their due reminders) on their profile.
+"""
+from app import app, db
+from sqlalchemy import inspect
+
+def migrate():
+    with app.app_context():
+        try:
+            # Works on both SQLite and Postgres ("user" is reserved in Postgres)
+            inspector = inspect(db.engine)
+            columns = [column['name'] for column in inspector.get_columns('user')]
+
+            if 'reminder_digest' not in columns:
+                print("Adding reminder_digest column to user table...")
+                with db.engine.begin() as conn:
+                    conn.execute(db.text('ALTER TABLE "user" ADD COLUMN reminder_digest BOOLEAN NOT NULL DEFAULT FALSE'))
+                print("✓ reminder_digest column added successfully!")
+            else:
+                print("reminder_digest column already exists.")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            raise
+
+if __name__ == '__main__':
+    print("Starting database migration...")
+    migrate()
+    print("Migration complete!")
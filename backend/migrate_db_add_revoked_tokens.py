@@ -0,0 +1,22 @@
+"""
+Database migration script to add the revoked_token table that backs the
+stateless JWT auth denylist (see auth.py). Server-side sessions are gone,
+so the backend/flask_session directory can be deleted afterwards.
+"""
+from app import app, db
+from models import RevokedToken
+
+def migrate():
+    with app.app_context():
+        try:
+            RevokedToken.__table__.create(db.engine, checkfirst=True)
+            print("✓ revoked_token table ready")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            raise
+
+if __name__ == '__main__':
+    print("Starting database migration...")
+    migrate()
+    print("Migration complete!")
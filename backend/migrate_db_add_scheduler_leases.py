@@ -0,0 +1,39 @@
+"""
+Database migration script to add the scheduler_lease table and the reminder
+email claim columns that let several instances share the reminder job
+(see scheduler_leases.py).
+"""
+from app import app, db
+from sqlalchemy import inspect
+from models import SchedulerLease
+
+def migrate():
+    with app.app_context():
+        try:
+            SchedulerLease.__table__.create(db.engine, checkfirst=True)
+            print("✓ scheduler_lease table ready")
+
+            # Works on both SQLite and Postgres
+            inspector = inspect(db.engine)
+            columns = [column['name'] for column in inspector.get_columns('reminder')]
+
+            with db.engine.begin() as conn:
+                if 'email_claimed_by' not in columns:
+                    conn.execute(db.text("ALTER TABLE reminder ADD COLUMN email_claimed_by VARCHAR(100)"))
+                    print("✓ email_claimed_by column added")
+                if 'email_claimed_until' not in columns:
+                    conn.execute(db.text("ALTER TABLE reminder ADD COLUMN email_claimed_until TIMESTAMP"))
+                    print("✓ email_claimed_until column added")
+                conn.execute(db.text(
+                    "CREATE INDEX IF NOT EXISTS ix_reminder_email_due ON reminder (email_sent, date)"
+                ))
+            print("✓ ix_reminder_email_due on reminder (email_sent, date)")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            raise
+
+if __name__ == '__main__':
+    print("Starting database migration...")
+    migrate()
+    print("Migration complete!")
@@ -0,0 +1,69 @@
+"""
+Database migration script to add the image_sha256 column to AICheckup and
+move flat uploads (uploads/checkup_<user>_<timestamp>.jpg) into the
+content-addressed upload store. Each legacy file is hashed, stored once,
+every checkup pointing at it is updated, and the old file is removed.
+"""
+from app import app, db
+from sqlalchemy import inspect
+from models import AICheckup
+from upload_store import get_upload_store
+import os
+
+def move_legacy_uploads():
+    store = get_upload_store()
+    upload_root = os.path.realpath(store.root)
+    moved = missing = 0
+
+    legacy_paths = [path for (path,) in db.session.query(AICheckup.image_path).filter(
+        AICheckup.image_path.isnot(None),
+        AICheckup.image_sha256.is_(None)
+    ).distinct()]
+
+    for legacy_path in legacy_paths:
+        real_path = os.path.realpath(legacy_path)
+        if os.path.dirname(real_path) != upload_root or not os.path.isfile(real_path):
+            missing += 1
+            continue
+
+        with open(real_path, 'rb') as f:
+            digest, path = store.put(f.read())
+        AICheckup.query.filter_by(image_path=legacy_path).update(
+            {'image_path': path, 'image_sha256': digest}, synchronize_session=False
+        )
+        db.session.commit()
+        os.remove(real_path)
+        moved += 1
+
+    return moved, missing
+
+def migrate():
+    with app.app_context():
+        try:
+            # Works on both SQLite and Postgres
+            inspector = inspect(db.engine)
+            columns = [column['name'] for column in inspector.get_columns('ai_checkup')]
+
+            if 'image_sha256' not in columns:
+                print("Adding image_sha256 column to ai_checkup table...")
+                with db.engine.begin() as conn:
+                    conn.execute(db.text("ALTER TABLE ai_checkup ADD COLUMN image_sha256 VARCHAR(64)"))
+                    conn.execute(db.text(
+                        "CREATE INDEX IF NOT EXISTS ix_ai_checkup_image_sha256 ON ai_checkup (image_sha256)"
+                    ))
+                print("✓ image_sha256 column added successfully!")
+            else:
+                print("image_sha256 column already exists.")
+
+            print("Moving flat uploads into the content-addressed store...")
+            moved, missing = move_legacy_uploads()
+            print(f"✓ {moved} files moved, {missing} checkup images not found")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            raise
+
+if __name__ == '__main__':
+    print("Starting database migration...")
+    migrate()
+    print("Migration complete!")
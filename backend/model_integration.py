@@ -9,59 +9,100 @@ warnings.filterwarnings('ignore', category=FutureWarning)
 import numpy as np
 from PIL import Image
 import io
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing.image import img_to_array
+from inference_backends import BACKENDS, get_backend_name, get_model_path, load_backend, model_available
+from thread_tuning import configure_threads
+import metrics
+from request_timing import span
 import logging
 
-# Suppress TensorFlow logging
-tf.get_logger().setLevel('ERROR')
-
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def decode_image(image_data):
+    """
+    Decode image bytes (or take a PIL Image) into a fully loaded RGB image.
+    """
+    if isinstance(image_data, bytes):
+        image = Image.open(io.BytesIO(image_data))
+    elif isinstance(image_data, Image.Image):
+        image = image_data
+    else:
+        raise ValueError("image_data must be bytes or PIL Image")
+
+    # Convert to RGB if needed
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    # PIL decodes lazily, force it here so decode time is not hidden in resize
+    image.load()
+
+    return image
+
+def resize_and_normalize(image):
+    """
+    Resize a decoded RGB image and normalize it into a (1, 224, 224, 3) float32 batch.
+    """
+    # Resize to expected input size (224x224 for MobileNet)
+    image = image.resize((224, 224))
+
+    # Convert to array and normalize
+    image_array = np.asarray(image, dtype=np.float32)
+    image_array = np.expand_dims(image_array, axis=0)
+
+    # Normalize to [0, 1] range
+    image_array = image_array / 255.0
+
+    return image_array
+
+def preprocess_image(image_data):
+    """
+    Decode, resize and normalize an image into a (1, 224, 224, 3) float32 batch.
+    Shared by every inference backend and the conversion/benchmark scripts.
+    """
+    return resize_and_normalize(decode_image(image_data))
+
 class DentalModel:
-    def __init__(self, model_path=os.path.join(os.path.dirname(__file__), 'model', 'model_vi.h5')):
+    def __init__(self, model_path=None, backend=None):
         """
         Initialize the dental disease prediction model.
+        The inference backend (keras, tflite, onnx, or fake for load tests
+        without a model file) comes from MODEL_BACKEND and the model file
+        from MODEL_PATH unless given explicitly.
         """
         self.model_loaded = False
+        self.backend = None
+        self.model_path = None
+        self.thread_config = None
+        self.backend_name = (backend or get_backend_name()).lower()
         # Model output classes - now includes Healthy as 6th class
         self.class_names = ['Calculus', 'Caries', 'Gingivitis', 'Mouth Ulcers', 'Tooth Discoloration', 'Healthy']
         
+        if self.backend_name not in BACKENDS:
+            logger.error("Unknown model backend: %s", self.backend_name)
+            logger.warning("Using fallback mock predictions")
+            return
+        
         if model_path is None:
-            # Try multiple possible paths
-            possible_paths = [
-                os.path.join(os.path.dirname(__file__), 'model', 'model_vi.hs'),
-                os.path.join(os.path.dirname(__file__), 'model', 'model_vi.keras'),
-                os.path.join(os.path.dirname(__file__), 'model_vi.hs'),
-                os.path.join(os.path.dirname(__file__), 'model_vi.keras'),
-            ]
-            
-            for path in possible_paths:
-                if os.path.exists(path):
-                    model_path = path
-                    logger.info(f"Found model at: {path}")
-                    break
+            model_path = get_model_path(self.backend_name)
+        self.model_path = model_path
         
-        if model_path and os.path.exists(model_path):
+        if model_available(self.backend_name, model_path):
             try:
-                logger.info(f"Loading model from: {model_path}")
-                # Suppress warnings during model loading
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    self.model = load_model(model_path, compile=False)
+                logger.info("Loading %s model from: %s", self.backend_name, model_path)
+                self.thread_config = configure_threads(self.backend_name, model_path)
+                self.backend = load_backend(
+                    self.backend_name,
+                    model_path,
+                    intra_op_threads=self.thread_config['intra_op_threads'],
+                    inter_op_threads=self.thread_config['inter_op_threads']
+                )
                 self.model_loaded = True
                 logger.info("✅ Model loaded successfully!")
                 
             except Exception as e:
-                logger.error(f"❌ Error loading model: {type(e).__name__}: {e}")
-                import traceback
-                traceback.print_exc()
+                logger.error("❌ Error loading model: %s: %s", type(e).__name__, e, exc_info=True)
                 self.model_loaded = False
         else:
-            logger.warning(f"Model file not found at: {model_path}")
+            logger.warning("Model file not found at: %s", model_path)
             logger.warning("Using fallback mock predictions")
             self.model_loaded = False
     
@@ -70,31 +111,9 @@ class DentalModel:
         Preprocess the image for the model.
         """
         try:
-            if isinstance(image_data, bytes):
-                image = Image.open(io.BytesIO(image_data))
-            elif isinstance(image_data, Image.Image):
-                image = image_data
-            else:
-                raise ValueError("image_data must be bytes or PIL Image")
-            
-            # Convert to RGB if needed
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Resize to expected input size (224x224 for MobileNet)
-            image = image.resize((224, 224))
-            
-            # Convert to array and normalize
-            image_array = img_to_array(image)
-            image_array = np.expand_dims(image_array, axis=0)
-            
-            # Normalize to [0, 1] range
-            image_array = image_array / 255.0
-            
-            return image_array
-            
+            return preprocess_image(image_data)
         except Exception as e:
-            logger.error(f"Error preprocessing image: {e}")
+            logger.error("Error preprocessing image: %s", e)
             raise
     
     def predict(self, image_data):
@@ -102,28 +121,36 @@ class DentalModel:
         Make predictions on the dental image.
         Return raw model outputs.
         """
-        logger.info("Starting prediction...")
+        logger.debug("Starting prediction...")
         
         # If model isn't loaded, return mock data
         if not self.model_loaded:
             logger.warning("Model not loaded, using mock predictions")
+            metrics.MODEL_PREDICTIONS.labels('mock', 'success').inc()
             return self.get_mock_predictions()
         
         try:
             # Preprocess image
-            processed_image = self.preprocess_image(image_data)
+            with metrics.MODEL_PREPROCESS_LATENCY.time():
+                with span('decode'):
+                    image = decode_image(image_data)
+                with span('preprocess'):
+                    processed_image = self.preprocess_image(image)
             
             # Make prediction
-            predictions = self.model.predict(processed_image, verbose=0)[0]
+            with span('inference'), metrics.INFERENCE_QUEUE_DEPTH.track_inprogress(), \
+                    metrics.MODEL_INFERENCE_LATENCY.labels(self.backend_name).time():
+                predictions = self.backend.predict(processed_image)[0]
             
             # Convert to list for JSON serialization
             predictions = predictions.astype('float32').tolist()
             
-            logger.info(f"Raw predictions: {predictions}")
+            logger.debug("Raw predictions: %s", predictions)
             
             # Create result with raw predictions
             result = {
                 'model_loaded': True,
+                'backend': self.backend_name,
                 'predictions': predictions,
                 'class_names': self.class_names,
                 'detected_conditions': [],
@@ -134,7 +161,7 @@ class DentalModel:
             max_index = np.argmax(predictions)
             max_value = predictions[max_index]
             
-            logger.info(f"Highest prediction: {self.class_names[max_index]} at {max_value:.3f}")
+            logger.debug("Highest prediction: %s at %.3f", self.class_names[max_index], max_value)
             
             # Detect conditions (excluding "Healthy" class)
             # "Healthy" is index 5, so we only check indices 0-4
@@ -144,7 +171,7 @@ class DentalModel:
                         'name': self.class_names[i],
                         'confidence': float(pred)
                     })
-                    logger.info(f"  ✓ Detected: {self.class_names[i]} ({pred:.1%} confidence)")
+                    logger.debug("Detected: %s (%.1f%% confidence)", self.class_names[i], pred * 100)
             
             # Check if "Healthy" class has high confidence
             healthy_score = predictions[5] if len(predictions) > 5 else 0
@@ -161,10 +188,12 @@ class DentalModel:
             result['analysis']['model_confidence'] = float(max_value)
             result['analysis']['healthy_score'] = float(healthy_score)
             
+            metrics.MODEL_PREDICTIONS.labels(self.backend_name, 'success').inc()
             return result
             
         except Exception as e:
-            logger.error(f"Error during prediction: {e}", exc_info=True)
+            logger.error("Error during prediction: %s", e, exc_info=True)
+            metrics.MODEL_PREDICTIONS.labels(self.backend_name, 'error').inc()
             return self.get_mock_predictions(error=str(e))
     
     def _create_analysis_summary(self, detected_conditions):
@@ -227,8 +256,8 @@ class DentalModel:
         Generate mock predictions for testing.
         """
         # Create some random predictions for testing (6 classes now)
-        np.random.seed(42)
-        mock_predictions = np.random.rand(6).tolist()
+        # Use a local generator so the global NumPy RNG shared by other threads is untouched
+        mock_predictions = np.random.RandomState(42).rand(6).tolist()
         
         # Normalize to make them look like probabilities
         total = sum(mock_predictions)
@@ -258,12 +287,7 @@ class DentalModel:
         
         return result
 
-# Global model instance
-_dental_model = None
-
 def get_dental_model():
-    """Singleton pattern to load model once"""
-    global _dental_model
-    if _dental_model is None:
-        _dental_model = DentalModel()
-    return _dental_model
\ No newline at end of file
+    """The active model; model_registry loads it once and handles reloads"""
+    from model_registry import registry  # model_registry imports this module
+    return registry.active().model
\ No newline at end of file
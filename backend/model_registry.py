@@ -0,0 +1,238 @@
+"""
+Registry of the active dental model, with zero-downtime reloads.
+
+Predictions borrow the active model through registry.use(), which counts
+them in flight. reload() builds the new DentalModel next to the old one,
+warms it with sample images so the first real request does not pay for
+graph tracing, swaps it in under a lock, then waits for the old model's
+in-flight predictions to finish before dropping it. If the new model fails
+to load or warm up, the old one stays active.
+
+Each model carries a version, given by the caller or derived from the
+backend, file name and a hash of the model file; it is stored on every
+AICheckup as model_version.
+
+The registry is per process: with several workers, each one reloads on its
+own.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+import glob
+import hashlib
+import logging
+import os
+import threading
+import time
+import numpy as np
+import metrics
+from inference_backends import MODEL_DIR, get_backend_name, get_model_path
+from model_integration import DentalModel, preprocess_image
+
+logger = logging.getLogger(__name__)
+
+def model_version(model):
+    """backend:file:hash for a loaded model, backend:mock otherwise"""
+    if not model.model_loaded:
+        return f"{model.backend_name}:mock"
+    if not model.model_path or not os.path.isfile(model.model_path):
+        return model.backend_name
+
+    digest = hashlib.sha256()
+    with open(model.model_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return f"{model.backend_name}:{os.path.basename(model.model_path)}:{digest.hexdigest()[:12]}"
+
+
+def warmup_batches(count, directory=None):
+    """Preprocessed sample uploads from directory, or random images when there are none"""
+    paths = sorted(glob.glob(os.path.join(directory, '**', '*.jpg'), recursive=True))[:count] if directory else []
+    batches = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                batches.append(preprocess_image(f.read()))
+        except Exception as e:
+            logger.debug("Skipping warm-up image %s: %s", path, e)
+    if batches:
+        return batches
+    rng = np.random.default_rng(0)
+    return [rng.random((1, 224, 224, 3), dtype=np.float32) for _ in range(count)]
+
+
+class ModelHandle:
+    """A model plus the number of predictions currently using it"""
+
+    def __init__(self, model, version):
+        self.model = model
+        self.version = version
+        self.loaded_at = datetime.utcnow()
+        self._in_flight = 0
+        self._idle = threading.Condition()
+
+    def acquire(self):
+        with self._idle:
+            self._in_flight += 1
+
+    def release(self):
+        with self._idle:
+            self._in_flight -= 1
+            if not self._in_flight:
+                self._idle.notify_all()
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def wait_idle(self, timeout):
+        with self._idle:
+            return self._idle.wait_for(lambda: self._in_flight == 0, timeout=timeout)
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._active = None
+        self._lock = threading.Lock()  # Guards swapping and borrowing the active handle
+        self._load_lock = threading.Lock()  # One first-use load at a time
+        self._reload_lock = threading.Lock()
+        self.last_reload = None
+
+    def _activate(self, handle):
+        previous = self._active
+        self._active = handle
+        if previous:
+            # Zeroed first: with PROMETHEUS_MULTIPROC_DIR the stored value outlives remove()
+            metrics.MODEL_INFO.labels(previous.version, previous.model.backend_name).set(0)
+            metrics.MODEL_INFO.remove(previous.version, previous.model.backend_name)
+        metrics.MODEL_INFO.labels(handle.version, handle.model.backend_name).set(1)
+        return previous
+
+    def _ensure_active(self):
+        # Loads the configured model on first use. The load (TensorFlow import,
+        # hashing the model file) happens outside self._lock, so callers only
+        # wait for it when there is no model yet
+        if self._active is None:
+            with self._load_lock:
+                if self._active is None:
+                    model = DentalModel()
+                    handle = ModelHandle(model, model_version(model))
+                    with self._lock:
+                        if self._active is None:  # Unless a reload got there first
+                            self._activate(handle)
+        return self._active
+
+    def active(self):
+        """The active model handle"""
+        return self._ensure_active()
+
+    @contextmanager
+    def use(self):
+        """Borrow the active model for one prediction"""
+        self._ensure_active()
+        with self._lock:
+            handle = self._active
+            handle.acquire()
+        try:
+            yield handle
+        finally:
+            handle.release()
+
+    def _claim_reload(self, model_path, backend):
+        # Take the reload lock and publish a fresh report in last_reload
+        if not self._reload_lock.acquire(blocking=False):
+            raise RuntimeError('A model reload is already running')
+        backend = (backend or get_backend_name()).lower()
+        self.last_reload = {
+            'status': 'loading',
+            'backend': backend,
+            'model_path': model_path or get_model_path(backend),
+            'started_at': datetime.utcnow().isoformat(),
+            'previous_version': self._active.version if self._active else None,
+            'version': None,
+            'phases_ms': {},
+        }
+        return self.last_reload
+
+    def reload(self, model_path=None, backend=None, **options):
+        """
+        Load, warm, swap and drain. Returns a report with the time spent in
+        each phase; only one reload runs at a time.
+        """
+        report = self._claim_reload(model_path, backend)
+        return self._reload(report, model_path, **options)
+
+    def reload_in_background(self, model_path=None, backend=None, **options):
+        """Start a reload on a thread and return its report, which fills in as it runs"""
+        report = self._claim_reload(model_path, backend)
+        try:
+            threading.Thread(target=self._reload, args=(report, model_path), kwargs=options,
+                             name='model-reload', daemon=True).start()
+        except Exception:
+            self._reload_lock.release()
+            raise
+        return report
+
+    def _reload(self, report, model_path, version=None, warmup_images=8, warmup_dir=None, drain_timeout=30):
+        # Runs with self._reload_lock claimed and releases it when done
+        def phase(name, started):
+            report['phases_ms'][name] = round((time.perf_counter() - started) * 1000, 2)
+
+        try:
+            started = time.perf_counter()
+            model = DentalModel(model_path=model_path, backend=report['backend'])
+            if not model.model_loaded:
+                raise RuntimeError(f"Model did not load from {report['model_path']}")
+            report['version'] = version or model_version(model)
+            phase('load', started)
+
+            report['status'] = 'warming'
+            started = time.perf_counter()
+            batches = warmup_batches(warmup_images, warmup_dir)
+            for batch in batches:
+                model.backend.predict(batch)
+            if len(batches) > 1:
+                # Also trace the larger batch shapes
+                model.backend.predict(np.concatenate(batches))
+            report['warmup_images'] = len(batches)
+            phase('warmup', started)
+
+            started = time.perf_counter()
+            with self._lock:
+                previous = self._activate(ModelHandle(model, report['version']))
+            phase('swap', started)
+
+            report['status'] = 'draining'
+            started = time.perf_counter()
+            report['drained'] = previous.wait_idle(drain_timeout) if previous else True
+            if previous and not report['drained']:
+                logger.warning("Model %s still had %d predictions after %ss; they finish on it",
+                               previous.version, previous.in_flight, drain_timeout)
+            phase('drain', started)
+
+            report['status'] = 'done'
+            metrics.MODEL_RELOADS.labels('success').inc()
+            logger.info("Model reloaded: %s -> %s %s", report['previous_version'], report['version'],
+                        report['phases_ms'])
+        except Exception as e:
+            report['status'] = 'failed'
+            report['error'] = str(e)
+            metrics.MODEL_RELOADS.labels('failure').inc()
+            logger.error("Model reload failed, keeping %s: %s", report['previous_version'], e, exc_info=True)
+        finally:
+            report['finished_at'] = datetime.utcnow().isoformat()
+            self._reload_lock.release()
+        return report
+
+
+def resolve_model_path(model_path):
+    """An admin-supplied model path, which must be a file inside the model directory"""
+    if not model_path:
+        return None
+    real_path = os.path.realpath(os.path.join(MODEL_DIR, model_path))
+    model_root = os.path.realpath(MODEL_DIR)
+    if os.path.commonpath([real_path, model_root]) != model_root or not os.path.exists(real_path):
+        raise ValueError(f"Model file not found in {MODEL_DIR}: {model_path}")
+    return real_path
+
+
+registry = ModelRegistry()
@@ -9,6 +9,7 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    reminder_digest = db.Column(db.Boolean, default=False, nullable=False)  # Opt-in: one email per day for all due reminders
     
     # Relationships
     habits = db.relationship('DailyHabit', backref='user', lazy=True)
@@ -22,16 +23,37 @@ class DailyHabit(db.Model):
     flossed = db.Column(db.Boolean, default=False)
     brushing_time = db.Column(db.Integer)  # in seconds
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # Last write wins when syncing
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'date', name='unique_daily_habit'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'date', name='unique_daily_habit'),
+        db.Index('ix_daily_habit_date', 'date', 'user_id', 'brushed', 'flossed'),  # Covers the analytics window
+    )
 
 class AICheckup(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     image_path = db.Column(db.String(500))
+    image_sha256 = db.Column(db.String(64), index=True)  # Upload store blob, for garbage collection
     analysis_result = db.Column(db.Text)
     ai_recommendations = db.Column(db.Text)
+    health_score = db.Column(db.Float)  # overall_health_score from analysis_result, for trends
+    model_version = db.Column(db.String(100))  # Model that produced analysis_result (model_registry)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_ai_checkup_user_created', 'user_id', 'created_at'),)
+
+class CheckupCondition(db.Model):
+    """The model's probability for one class of a checkup, typed for trend queries"""
+    id = db.Column(db.Integer, primary_key=True)
+    checkup_id = db.Column(db.Integer, db.ForeignKey('ai_checkup.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    confidence = db.Column(db.Float, nullable=False)
+    detected = db.Column(db.Boolean, nullable=False, default=True)  # Passed the detection cutoff
+    created_at = db.Column(db.DateTime, nullable=False)  # Copied from the checkup
+    
+    __table_args__ = (db.Index('ix_checkup_condition_user_created', 'user_id', 'created_at', 'name', 'confidence'),)
 
 class Reminder(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -46,4 +68,72 @@ class Reminder(db.Model):
     frequency_days = db.Column(db.Integer)  # For medications: repeat every N days
     pill_count = db.Column(db.Integer)  # For medications: number of pills
     email_sent = db.Column(db.Boolean, default=False)  # Track if email notification was sent
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    # Instance sending the email and until when (scheduler_leases.claim_reminders)
+    email_claimed_by = db.Column(db.String(100))
+    email_claimed_until = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_reminder_user_date', 'user_id', 'date'),
+        db.Index('ix_reminder_email_due', 'email_sent', 'date'),
+    )
+
+class EmailOutbox(db.Model):
+    """Queued email, written in the same transaction as the state it reports (email_outbox.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    idempotency_key = db.Column(db.String(200), unique=True, nullable=False)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(300), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    html = db.Column(db.Text)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # 'pending', 'sending', 'sent' or 'dead'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = db.Column(db.DateTime)  # While 'sending': when another sender may take it over
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    
+    __table_args__ = (db.Index('ix_email_outbox_status_next', 'status', 'next_attempt_at'),)
+
+class RevokedToken(db.Model):
+    """Access token revoked before it expires (auth.py keeps these in memory)"""
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class SchedulerLease(db.Model):
+    """Which instance runs a scheduler job until expires_at (scheduler_leases.py)"""
+    name = db.Column(db.String(100), primary_key=True)
+    owner = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    completed_slice = db.Column(db.String(32))  # Last time slice the job finished, e.g. a date
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Population analytics rollups, maintained by population_analytics.refresh_rollups()
+class AnalyticsCheckupRollup(db.Model):
+    """Checkups per day and health-score bin (half points; -1 for no score)"""
+    day = db.Column(db.Date, primary_key=True)
+    score_bin = db.Column(db.Integer, primary_key=True)
+    checkups = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0)
+
+class AnalyticsConditionRollup(db.Model):
+    """Detections per day and condition"""
+    day = db.Column(db.Date, primary_key=True)
+    name = db.Column(db.String(100), primary_key=True)
+    detections = db.Column(db.Integer, nullable=False, default=0)
+    confidence_sum = db.Column(db.Float, nullable=False, default=0)
+
+class AnalyticsHabitDistribution(db.Model):
+    """Users by brushed and flossed days in the last 30, replaced on each refresh"""
+    brushed_days = db.Column(db.Integer, primary_key=True)
+    flossed_days = db.Column(db.Integer, primary_key=True)
+    users = db.Column(db.Integer, nullable=False)
+
+class AnalyticsState(db.Model):
+    """Rollup watermarks (last aggregated id) and totals, with refresh times"""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime)
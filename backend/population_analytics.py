@@ -0,0 +1,308 @@
+"""
+Population-level analytics across all users.
+
+A background job (refresh_rollups) folds new checkups and detected
+conditions into per-day rollup tables, one set-based GROUP BY over the rows
+added since the last run, and replaces the brushing/flossing distribution
+with a single GROUP BY over the last 30 days of habits. Dashboards read
+only the rollups, whose size depends on the number of days and not on the
+number of users, and NumPy turns the binned counts into averages,
+percentiles and histograms.
+
+Checkups are picked up once they are ANALYTICS_SETTLE_SECONDS old, so a
+transaction that took an id but had not committed yet is not skipped.
+Each watermark only moves forward if it still has the value the refresh
+started from, so refreshes running in several workers at once cannot
+count rows twice.
+"""
+from datetime import date, datetime, timedelta
+from sqlalchemy import Integer, case, cast, func, update
+from sqlalchemy.dialects import postgresql, sqlite
+import numpy as np
+from models import (db, User, DailyHabit, AICheckup, CheckupCondition, AnalyticsCheckupRollup,
+                    AnalyticsConditionRollup, AnalyticsHabitDistribution, AnalyticsState)
+from write_queue import run_write
+
+HABIT_WINDOW_DAYS = 30
+
+# Health scores run 1-10; bins are half a point wide and the last holds 10 only
+SCORE_BINS = 21
+SCORE_BIN_WIDTH = 0.5
+MAX_SCORE = 10.0
+NO_SCORE_BIN = -1
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+# Rows per upsert statement, within SQLite's variable limit
+UPSERT_CHUNK_SIZE = 500
+
+_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+class RollupConflict(Exception):
+    """Another refresh moved the watermark first"""
+
+
+def _as_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _score_bin(dialect_name):
+    scaled = AICheckup.health_score / SCORE_BIN_WIDTH
+    # CAST truncates on SQLite but rounds on Postgres
+    binned = cast(scaled, Integer) if dialect_name == 'sqlite' else cast(func.floor(scaled), Integer)
+    return case((AICheckup.health_score.is_(None), NO_SCORE_BIN), else_=binned)
+
+
+def _state(name):
+    state = db.session.get(AnalyticsState, name)
+    return state.value if state else 0
+
+
+def _settled_max_id(model, cutoff):
+    return db.session.query(func.max(model.id)).filter(model.created_at < cutoff).scalar()
+
+
+def _advance_watermark(db_session, name, last_id, upper, now):
+    """Move a watermark from last_id to upper, or raise if someone else did"""
+    insert = _INSERTS[db_session.get_bind().dialect.name]
+    db_session.execute(insert(AnalyticsState.__table__).values(name=name, value=0).on_conflict_do_nothing())
+    moved = db_session.execute(
+        update(AnalyticsState).where(AnalyticsState.name == name, AnalyticsState.value == last_id)
+        .values(value=upper, refreshed_at=now).execution_options(synchronize_session=False)
+    ).rowcount
+    if not moved:
+        raise RollupConflict(name)
+
+
+def _additive_upsert(db_session, model, keys, sums, rows):
+    """INSERT ... ON CONFLICT DO UPDATE that adds `sums` onto existing rows"""
+    table = model.__table__
+    insert = _INSERTS[db_session.get_bind().dialect.name]
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        statement = insert(table).values(rows[start:start + UPSERT_CHUNK_SIZE])
+        db_session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c[key] for key in keys],
+            set_={column: table.c[column] + statement.excluded[column] for column in sums}
+        ))
+
+
+def refresh_checkup_rollup(now, settle_seconds):
+    """Fold checkups added since the last refresh into the per-day score bins"""
+    dialect_name = db.engine.dialect.name
+    last_id = _state('checkups')
+    upper = _settled_max_id(AICheckup, now - timedelta(seconds=settle_seconds))
+    if not upper or upper <= last_id:
+        return 0
+
+    day = func.date(AICheckup.created_at)
+    score_bin = _score_bin(dialect_name)
+    grouped = db.session.query(
+        day, score_bin, func.count(AICheckup.id), func.coalesce(func.sum(AICheckup.health_score), 0)
+    ).filter(AICheckup.id > last_id, AICheckup.id <= upper).group_by(day, score_bin).all()
+
+    rows = {}
+    for row_day, row_bin, checkups, score_sum in grouped:
+        if row_bin != NO_SCORE_BIN:
+            row_bin = min(max(row_bin, 0), SCORE_BINS - 1)
+        key = (_as_date(row_day), row_bin)
+        previous = rows.get(key, {'checkups': 0, 'score_sum': 0.0})
+        rows[key] = {'checkups': previous['checkups'] + checkups,
+                     'score_sum': previous['score_sum'] + float(score_sum)}
+    values = [{'day': key[0], 'score_bin': key[1], **sums} for key, sums in rows.items()]
+
+    def apply(db_session):
+        _advance_watermark(db_session, 'checkups', last_id, upper, now)
+        _additive_upsert(db_session, AnalyticsCheckupRollup, ('day', 'score_bin'), ('checkups', 'score_sum'), values)
+        return sum(row['checkups'] for row in values)
+
+    db.session.rollback()  # End the read transaction before writing
+    return run_write(apply)
+
+
+def refresh_condition_rollup(now, settle_seconds):
+    """Fold detected conditions added since the last refresh into the per-day counts"""
+    last_id = _state('conditions')
+    upper = _settled_max_id(CheckupCondition, now - timedelta(seconds=settle_seconds))
+    if not upper or upper <= last_id:
+        return 0
+
+    day = func.date(CheckupCondition.created_at)
+    grouped = db.session.query(
+        day, CheckupCondition.name, func.count(CheckupCondition.id), func.sum(CheckupCondition.confidence)
+    ).filter(
+        CheckupCondition.id > last_id, CheckupCondition.id <= upper,
+        CheckupCondition.detected == True
+    ).group_by(day, CheckupCondition.name).all()
+
+    values = [
+        {'day': _as_date(row_day), 'name': name, 'detections': detections, 'confidence_sum': float(confidence_sum)}
+        for row_day, name, detections, confidence_sum in grouped
+    ]
+
+    def apply(db_session):
+        _advance_watermark(db_session, 'conditions', last_id, upper, now)
+        _additive_upsert(db_session, AnalyticsConditionRollup, ('day', 'name'), ('detections', 'confidence_sum'), values)
+        return sum(row['detections'] for row in values)
+
+    db.session.rollback()
+    return run_write(apply)
+
+
+def refresh_habit_distribution(now, today=None):
+    """Replace the users-by-brushed/flossed-days distribution for the last 30 days"""
+    today = today or date.today()
+
+    per_user = db.session.query(
+        func.sum(case((DailyHabit.brushed, 1), else_=0)).label('brushed_days'),
+        func.sum(case((DailyHabit.flossed, 1), else_=0)).label('flossed_days')
+    ).filter(
+        DailyHabit.date > today - timedelta(days=HABIT_WINDOW_DAYS),
+        DailyHabit.date <= today
+    ).group_by(DailyHabit.user_id).subquery()
+
+    grouped = db.session.query(
+        per_user.c.brushed_days, per_user.c.flossed_days, func.count()
+    ).group_by(per_user.c.brushed_days, per_user.c.flossed_days).all()
+    total_users = db.session.query(func.count(User.id)).scalar()
+
+    values = [{'brushed_days': brushed, 'flossed_days': flossed, 'users': users}
+              for brushed, flossed, users in grouped]
+    insert = _INSERTS.get(db.engine.dialect.name)
+
+    def apply(db_session):
+        db_session.query(AnalyticsHabitDistribution).delete(synchronize_session=False)
+        if values:
+            db_session.execute(AnalyticsHabitDistribution.__table__.insert(), values)
+        db_session.execute(insert(AnalyticsState.__table__).values(
+            name='habits', value=total_users, refreshed_at=now
+        ).on_conflict_do_update(
+            index_elements=[AnalyticsState.__table__.c.name],
+            set_={'value': total_users, 'refreshed_at': now}
+        ))
+        return len(values)
+
+    db.session.rollback()
+    return run_write(apply)
+
+
+def refresh_rollups(settle_seconds=60, now=None):
+    """Bring every rollup up to date; returns how much each step added"""
+    now = now or datetime.utcnow()
+    result = {}
+    for name, refresh in (('checkups', refresh_checkup_rollup), ('conditions', refresh_condition_rollup)):
+        try:
+            result[name] = refresh(now, settle_seconds)
+        except RollupConflict:
+            # Another worker got there first; its refresh covers these rows
+            result[name] = 0
+    result['habit_distribution_rows'] = refresh_habit_distribution(now)
+    return result
+
+
+def _histogram_percentiles(counts, edges, percentiles=PERCENTILES):
+    """Percentiles of binned data, interpolating linearly inside each bin"""
+    total = counts.sum()
+    if not total:
+        return {f"p{p}": None for p in percentiles}
+    cdf = np.concatenate(([0.0], np.cumsum(counts))) / total
+    values = np.interp(np.asarray(percentiles) / 100, cdf, edges)
+    return {f"p{p}": round(float(value), 2) for p, value in zip(percentiles, values)}
+
+
+def _discrete_summary(days, counts):
+    """Mean, percentiles and 10-point histogram of a users-by-days distribution"""
+    total = int(counts.sum())
+    percents = days / HABIT_WINDOW_DAYS * 100
+    if not total:
+        return {'mean': None, **{f"p{p}": None for p in PERCENTILES}, 'histogram': [0] * 10}
+    cumulative = np.cumsum(counts)
+    ranks = np.ceil(np.asarray(PERCENTILES) / 100 * total)
+    positions = np.searchsorted(cumulative, ranks)
+    # Ten bands of 10 points; 100% falls in the last one
+    bands = np.minimum((percents // 10).astype(int), 9)
+    return {
+        'mean': round(float(np.average(percents, weights=counts)), 1),
+        **{f"p{p}": round(float(percents[i]), 1) for p, i in zip(PERCENTILES, positions)},
+        'histogram': np.bincount(bands, weights=counts, minlength=10).astype(int).tolist()
+    }
+
+
+def population_summary(start, end):
+    """Health scores, condition prevalence and habit consistency for start..end inclusive"""
+    score_rows = db.session.query(
+        AnalyticsCheckupRollup.score_bin,
+        func.sum(AnalyticsCheckupRollup.checkups),
+        func.sum(AnalyticsCheckupRollup.score_sum)
+    ).filter(
+        AnalyticsCheckupRollup.day >= start, AnalyticsCheckupRollup.day <= end
+    ).group_by(AnalyticsCheckupRollup.score_bin).all()
+
+    bins = np.zeros(SCORE_BINS)
+    score_sum = 0.0
+    unscored = 0
+    for score_bin, checkups, bin_sum in score_rows:
+        if score_bin == NO_SCORE_BIN:
+            unscored += int(checkups)
+        else:
+            bins[score_bin] += checkups
+            score_sum += float(bin_sum)
+    scored = int(bins.sum())
+    total_checkups = scored + unscored
+    edges = np.minimum(np.arange(SCORE_BINS + 1) * SCORE_BIN_WIDTH, MAX_SCORE)
+
+    condition_rows = db.session.query(
+        AnalyticsConditionRollup.name,
+        func.sum(AnalyticsConditionRollup.detections),
+        func.sum(AnalyticsConditionRollup.confidence_sum)
+    ).filter(
+        AnalyticsConditionRollup.day >= start, AnalyticsConditionRollup.day <= end
+    ).group_by(AnalyticsConditionRollup.name).all()
+
+    conditions = sorted((
+        {
+            'name': name,
+            'detections': int(detections),
+            # Share of checkups in the window with this condition
+            'prevalence': round(int(detections) / total_checkups, 4) if total_checkups else None,
+            'avg_confidence': round(float(confidence_sum) / int(detections), 3)
+        }
+        for name, detections, confidence_sum in condition_rows
+    ), key=lambda condition: condition['detections'], reverse=True)
+
+    matrix = np.zeros((HABIT_WINDOW_DAYS + 1, HABIT_WINDOW_DAYS + 1))
+    for row in AnalyticsHabitDistribution.query.all():
+        matrix[row.brushed_days, row.flossed_days] = row.users
+    days = np.arange(HABIT_WINDOW_DAYS + 1)
+    tracked_users = int(matrix.sum())
+
+    states = {state.name: state for state in AnalyticsState.query.all()}
+    # The habits state holds the user count taken with the distribution
+    total_users = int(states['habits'].value) if 'habits' in states else tracked_users
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'health_score': {
+            'checkups': total_checkups,
+            'scored_checkups': scored,
+            'mean': round(score_sum / scored, 2) if scored else None,
+            **_histogram_percentiles(bins, edges),
+            'histogram': {'bin_width': SCORE_BIN_WIDTH, 'counts': bins.astype(int).tolist()}
+        },
+        'conditions': conditions,
+        'habits': {
+            'window_days': HABIT_WINDOW_DAYS,
+            'users': total_users,
+            'tracked_users': tracked_users,
+            'brushing_consistency': _discrete_summary(days, matrix.sum(axis=1)),
+            'flossing_consistency': _discrete_summary(days, matrix.sum(axis=0))
+        },
+        'refreshed_at': {
+            name: state.refreshed_at.isoformat() if state.refreshed_at else None
+            for name, state in states.items()
+        }
+    }
@@ -0,0 +1,143 @@
+"""
+Set-based bulk operations on reminders.
+
+A bulk request selects reminders either by id list or by filter and applies
+one action with a single UPDATE or DELETE. Ownership is part of the WHERE
+clause, so ids belonging to other users are simply not matched.
+"""
+from datetime import datetime
+from sqlalchemy import delete, func, update
+from models import Reminder
+
+ACTIONS = ('complete', 'snooze', 'update', 'delete')
+REMINDER_TYPES = ('appointment', 'medication')
+MAX_BULK_IDS = 1000
+MAX_SNOOZE_DAYS = 3650
+
+
+class BulkRequestError(ValueError):
+    pass
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise BulkRequestError(f'Invalid {name} format. Use YYYY-MM-DD')
+
+
+def selection_criteria(user_id, data):
+    """WHERE clauses for the reminders a bulk request targets"""
+    has_ids = 'ids' in data
+    has_filter = 'filter' in data
+    if has_ids == has_filter:
+        raise BulkRequestError('Provide either ids or filter')
+
+    criteria = [Reminder.user_id == user_id]
+
+    if has_ids:
+        ids = data['ids']
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            raise BulkRequestError('ids must be a non-empty list of integers')
+        if len(ids) > MAX_BULK_IDS:
+            raise BulkRequestError(f'At most {MAX_BULK_IDS} ids per request')
+        criteria.append(Reminder.id.in_(set(ids)))
+        return criteria
+
+    filters = data['filter']
+    if not isinstance(filters, dict) or not filters:
+        raise BulkRequestError('filter must be a non-empty object')
+
+    unknown = set(filters) - {'type', 'title', 'date_from', 'date_to', 'completed'}
+    if unknown:
+        raise BulkRequestError(f'Unknown filter keys: {", ".join(sorted(unknown))}')
+    if 'type' in filters:
+        if filters['type'] not in REMINDER_TYPES:
+            raise BulkRequestError('Invalid type. Must be "appointment" or "medication"')
+        criteria.append(Reminder.type == filters['type'])
+    if 'title' in filters:
+        criteria.append(Reminder.title == filters['title'])
+    if 'date_from' in filters:
+        criteria.append(Reminder.date >= _parse_date(filters['date_from'], 'date_from'))
+    if 'date_to' in filters:
+        criteria.append(Reminder.date <= _parse_date(filters['date_to'], 'date_to'))
+    if 'completed' in filters:
+        criteria.append(Reminder.completed == bool(filters['completed']))
+    return criteria
+
+
+def shifted_date(dialect_name, days):
+    """SQL expression for Reminder.date moved by `days`"""
+    if dialect_name == 'sqlite':
+        return func.date(Reminder.date, f'{days:+d} days')
+    # date + integer is a date on Postgres
+    return Reminder.date + days
+
+
+def update_values(data):
+    """Validated column values for the update action, mirroring PUT /api/reminders/<id>"""
+    fields = data.get('fields')
+    if not isinstance(fields, dict) or not fields:
+        raise BulkRequestError('fields must be a non-empty object')
+
+    unknown = set(fields) - {'type', 'title', 'description', 'date', 'time', 'completed',
+                             'frequency_days', 'pill_count'}
+    if unknown:
+        raise BulkRequestError(f'Unknown fields: {", ".join(sorted(unknown))}')
+
+    values = {}
+    if 'type' in fields:
+        if fields['type'] not in REMINDER_TYPES:
+            raise BulkRequestError('Invalid type. Must be "appointment" or "medication"')
+        values['type'] = fields['type']
+    if 'title' in fields:
+        if not fields['title']:
+            raise BulkRequestError('title cannot be empty')
+        values['title'] = fields['title']
+    if 'description' in fields:
+        values['description'] = fields['description']
+    if 'date' in fields:
+        values['date'] = _parse_date(fields['date'], 'date')
+        values['email_sent'] = False
+    if 'time' in fields:
+        if fields['time']:
+            try:
+                values['time'] = datetime.strptime(fields['time'], '%H:%M').time()
+            except (TypeError, ValueError):
+                raise BulkRequestError('Invalid time format. Use HH:MM')
+        else:
+            values['time'] = None
+    if 'completed' in fields:
+        values['completed'] = bool(fields['completed'])
+    if 'frequency_days' in fields:
+        values['frequency_days'] = fields['frequency_days']
+    if 'pill_count' in fields:
+        values['pill_count'] = fields['pill_count']
+    return values
+
+
+def bulk_statement(dialect_name, user_id, data):
+    """Build the single UPDATE/DELETE statement for a bulk request"""
+    action = data.get('action')
+    if action not in ACTIONS:
+        raise BulkRequestError(f'Invalid action. Must be one of {", ".join(ACTIONS)}')
+
+    criteria = selection_criteria(user_id, data)
+
+    if action == 'delete':
+        statement = delete(Reminder).where(*criteria)
+    elif action == 'complete':
+        statement = update(Reminder).where(*criteria).values(completed=bool(data.get('completed', True)))
+    elif action == 'snooze':
+        days = data.get('days')
+        if not isinstance(days, int) or isinstance(days, bool) or days == 0 or abs(days) > MAX_SNOOZE_DAYS:
+            raise BulkRequestError(f'days must be a non-zero integer up to {MAX_SNOOZE_DAYS}')
+        # A moved reminder should be emailed again on its new date
+        statement = update(Reminder).where(*criteria).values(
+            date=shifted_date(dialect_name, days), email_sent=False
+        )
+    else:
+        statement = update(Reminder).where(*criteria).values(**update_values(data))
+
+    # Rows are not loaded into the session, so skip synchronizing it
+    return statement.execution_options(synchronize_session=False)
@@ -0,0 +1,187 @@
+from flask import g, has_request_context, jsonify, request
+from contextlib import contextmanager
+import cProfile
+from datetime import datetime
+from functools import wraps
+import hmac
+import os
+import threading
+import time
+
+try:
+    import pyinstrument
+except ImportError:  # pyinstrument is optional, cProfile is always available
+    pyinstrument = None
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+# Armed profiling triggers: route rule -> {'remaining': N, 'profiler': name}
+_profile_triggers = {}
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def span(name):
+    """
+    Time a block and report it in this request's Server-Timing header.
+    Outside a request (scheduler, scripts) this is a no-op.
+    """
+    if not has_request_context():
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans = g.setdefault('timing_spans', {})
+        spans[name] = spans.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+
+def timed(name):
+    """Decorator form of span()"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            with span(name):
+                return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def server_timing_header(spans, total_ms):
+    """Format spans as a Server-Timing header value"""
+    entries = [f"{name};dur={duration:.2f}" for name, duration in spans.items()]
+    entries.append(f"total;dur={total_ms:.2f}")
+    return ', '.join(entries)
+
+
+def is_admin_request():
+    """Whether this request carries the ADMIN_TOKEN in its X-Admin-Token header"""
+    token = os.environ.get('ADMIN_TOKEN')
+    provided = request.headers.get('X-Admin-Token', '')
+    return bool(token) and hmac.compare_digest(token, provided)
+
+
+def admin_required(f):
+    """
+    Gate admin endpoints behind the ADMIN_TOKEN shared secret,
+    sent in the X-Admin-Token header. Disabled when ADMIN_TOKEN is unset.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not is_admin_request():
+            return jsonify({'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def arm_profiler(route, count, profiler='cprofile'):
+    """Profile the next `count` requests to a route rule"""
+    with _profile_lock:
+        _profile_triggers[route] = {'remaining': count, 'profiler': profiler}
+
+
+def _claim_profile_slot(route):
+    """Take one profiling slot for this route, if any are left"""
+    with _profile_lock:
+        trigger = _profile_triggers.get(route)
+        if not trigger:
+            return None
+        trigger['remaining'] -= 1
+        if trigger['remaining'] <= 0:
+            del _profile_triggers[route]
+        return trigger['profiler']
+
+
+def _start_profiler(name):
+    if name == 'pyinstrument':
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler
+
+
+def _write_profile(app, name, profiler, route):
+    """Stop the profiler and write its output under PROFILE_DIR"""
+    profile_dir = app.config['PROFILE_DIR']
+    os.makedirs(profile_dir, exist_ok=True)
+
+    slug = route.strip('/').replace('/', '_').replace('<', '').replace('>', '').replace(':', '-') or 'root'
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+
+    if name == 'pyinstrument':
+        profiler.stop()
+        path = os.path.join(profile_dir, f"{slug}_{stamp}.html")
+        with open(path, 'w') as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        path = os.path.join(profile_dir, f"{slug}_{stamp}.prof")
+        profiler.dump_stats(path)
+
+    app.logger.info("Wrote %s profile of %s to %s", name, route, path)
+    return path
+
+
+def init_request_timing(app):
+    """Register Server-Timing headers and the admin profiling trigger"""
+    app.config.setdefault('SERVER_TIMING_ENABLED', False)
+    app.config.setdefault('PROFILE_DIR', 'profiles')
+
+    @app.before_request
+    def start_request_timing():
+        g.timing_start = time.perf_counter()
+
+        route = request.url_rule.rule if request.url_rule else None
+        if route and _profile_triggers:
+            profiler_name = _claim_profile_slot(route)
+            if profiler_name:
+                g.profiler = (profiler_name, _start_profiler(profiler_name), route)
+
+    @app.after_request
+    def add_server_timing(response):
+        start = g.get('timing_start')
+        # Stage timings reveal server internals, so by default only admins see them
+        if start is not None and (app.config['SERVER_TIMING_ENABLED'] or is_admin_request()):
+            total_ms = (time.perf_counter() - start) * 1000
+            response.headers['Server-Timing'] = server_timing_header(
+                g.get('timing_spans', {}), total_ms
+            )
+        return response
+
+    @app.teardown_request
+    def stop_request_profiler(exception=None):
+        profiler = g.pop('profiler', None)
+        if profiler:
+            _write_profile(app, *profiler)
+
+    @app.route('/api/admin/profile', methods=['GET', 'POST'])
+    @admin_required
+    def profile_route():
+        if request.method == 'GET':
+            with _profile_lock:
+                return jsonify({'armed': dict(_profile_triggers)}), 200
+
+        data = request.get_json() or {}
+        route = data.get('route')
+        count = data.get('count', 1)
+        profiler = data.get('profiler', 'cprofile')
+
+        if route not in {rule.rule for rule in app.url_map.iter_rules()}:
+            return jsonify({'error': 'Unknown route. Use the route rule, e.g. /api/ai-checkup'}), 400
+        if profiler not in PROFILERS:
+            return jsonify({'error': f'Invalid profiler. Must be one of {", ".join(PROFILERS)}'}), 400
+        if profiler == 'pyinstrument' and pyinstrument is None:
+            return jsonify({'error': 'pyinstrument is not installed'}), 400
+        if not isinstance(count, int) or count < 1:
+            return jsonify({'error': 'count must be a positive integer'}), 400
+
+        arm_profiler(route, count, profiler)
+        return jsonify({
+            'message': f'Profiling the next {count} request(s) to {route}',
+            'profiler': profiler,
+            'profile_dir': os.path.abspath(app.config['PROFILE_DIR'])
+        }), 200
@@ -1,80 +1,280 @@
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+import hashlib
 from models import Reminder, User, db
-from email_service import send_reminder_email
+from email_service import render_reminder_email, render_reminder_digest
+from email_outbox import enqueue_email
+from scheduler_leases import acquire_lease, claim_reminders, mark_reminders_sent, release_lease, unmark_reminders_sent
+from write_queue import run_write
+import metrics
 import logging
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Reminder emails go out daily at this hour (server time)
+REMINDER_EMAIL_HOUR = 8
+REMINDER_EMAIL_LEASE = 'reminder_email_job'
+
+def _user_emails(user_id, reminders, digest):
+    """
+    (idempotency key, subject, body, html, reminders covered) for one
+    user's reminders: one
+    digest if they opted in, otherwise one email per reminder. Keys include
+    the date, so a reminder snoozed to another day is emailed again.
+    """
+    if digest and len(reminders) > 1:
+        subject, body, html = render_reminder_digest(reminders)
+        covered = ','.join(f"{reminder.id}@{reminder.date.isoformat()}" for reminder in reminders)
+        key = f"reminder-digest:{user_id}:{hashlib.sha256(covered.encode()).hexdigest()[:24]}"
+        return [(key, subject, body, html, reminders)]
+    
+    emails = []
+    for reminder in reminders:
+        subject, body = render_reminder_email(reminder)
+        emails.append((f"reminder:{reminder.id}:{reminder.date.isoformat()}", subject, body, None, [reminder]))
+    return emails
+
+def _queue_claimed_reminders(reminder_ids):
+    """
+    Render the emails for a claimed chunk of reminders, grouped by user, and
+    queue them in the email outbox in the same transaction that marks the
+    reminders email_sent. Returns (emails queued, reminders queued, reminders failed).
+    """
+    rows = db.session.query(Reminder, User.email, User.reminder_digest)\
+        .outerjoin(User, User.id == Reminder.user_id)\
+        .filter(Reminder.id.in_(reminder_ids))\
+        .order_by(Reminder.user_id, Reminder.date, Reminder.time, Reminder.id).all()
+    
+    by_user = {}
+    for reminder, email, digest in rows:
+        if not email:
+            logger.warning("No user or email found for reminder ID: %s", reminder.id)
+            continue
+        by_user.setdefault(reminder.user_id, (email, digest, []))[2].append(reminder)
+    
+    messages = []
+    failed = 0
+    for user_id, (email, digest, reminders) in by_user.items():
+        try:
+            for key, subject, body, html, covered in _user_emails(user_id, reminders, digest):
+                messages.append((key, email, subject, body, html, [reminder.id for reminder in covered]))
+        except Exception as e:
+            # Keeps its claims until they expire, then the next run retries them
+            failed += len(reminders)
+            logger.error("Error rendering reminders for %s: %s", email, e)
+    
+    def queue(db_session):
+        # Mark first: an email is queued only if every reminder it covers was
+        # still claimed by this instance. If a claim expired and another
+        # instance took a reminder over, that instance emails it; the rest of
+        # the email's reminders are released for the next claim.
+        marked = mark_reminders_sent(db_session, [reminder_id for *_, ids in messages for reminder_id in ids])
+        emails = queued = released = 0
+        for key, email, subject, body, html, ids in messages:
+            if marked.issuperset(ids):
+                enqueue_email(db_session, key, email, subject, body, html)
+                emails += 1
+                queued += len(ids)
+            else:
+                released += unmark_reminders_sent(db_session, marked.intersection(ids))
+        if released:
+            logger.warning("Released %d reminders whose email shared a lost claim", released)
+        return emails, queued
+    
+    db.session.rollback()  # End the read transaction before writing
+    emails, queued = run_write(queue)
+    metrics.REMINDERS_EMAILED.inc(queued)
+    return emails, queued, failed
+
+def send_reminder_slice(app, day):
+    """
+    Queue the reminder emails for day, plus unsent ones from the previous
+    REMINDER_EMAIL_CATCHUP_DAYS, one digest per user who opted in; the
+    email outbox sends them. The instance holding the lease runs the slice
+    and records it as done; instances that fire while it is running help by
+    claiming chunks; once done, nobody runs it again.
+    """
+    lease_seconds = app.config.get('REMINDER_EMAIL_LEASE_SECONDS', 300)
+    chunk_size = app.config.get('REMINDER_EMAIL_CHUNK_SIZE', 100)
+    claim_seconds = app.config.get('REMINDER_EMAIL_CLAIM_SECONDS', 600)
+    start = day - timedelta(days=app.config.get('REMINDER_EMAIL_CATCHUP_DAYS', 1))
+    slice_key = day.isoformat()
+    
+    owner, completed_slice = run_write(
+        lambda db_session: acquire_lease(db_session, REMINDER_EMAIL_LEASE, lease_seconds)
+    )
+    result = {'slice': slice_key, 'role': 'owned' if owner else 'helped', 'chunks': 0, 'emails': 0,
+              'reminders': 0, 'failed': 0}
+    
+    # ISO dates sort as strings
+    if completed_slice and completed_slice >= slice_key:
+        if owner:
+            run_write(lambda db_session: release_lease(db_session, REMINDER_EMAIL_LEASE))
+        result['role'] = 'skipped'
+        metrics.SCHEDULER_SLICES.labels(REMINDER_EMAIL_LEASE, 'skipped').inc()
+        logger.info("Reminder emails for %s were already sent", slice_key)
+        return result
+    
+    while True:
+        reminder_ids = run_write(
+            lambda db_session: claim_reminders(db_session, start, day, chunk_size, claim_seconds)
+        )
+        if not reminder_ids:
+            break
+        emails, queued, failed = _queue_claimed_reminders(reminder_ids)
+        result['chunks'] += 1
+        result['emails'] += emails
+        result['reminders'] += queued
+        result['failed'] += failed
+        if owner:
+            # Renew the lease between chunks; losing it means another instance took over
+            owner, _ = run_write(
+                lambda db_session: acquire_lease(db_session, REMINDER_EMAIL_LEASE, lease_seconds)
+            )
+    
+    if owner:
+        run_write(lambda db_session: release_lease(db_session, REMINDER_EMAIL_LEASE, completed_slice=slice_key))
+    metrics.SCHEDULER_SLICES.labels(REMINDER_EMAIL_LEASE, result['role']).inc()
+    logger.info("Reminder emails: %s", result)
+    return result
+
 def check_and_send_reminders():
     """
-    Check for reminders scheduled for today and send emails
-    Called daily at 8 AM
+    Send emails for reminders scheduled for today
+    Called daily at 8 AM on every instance; see send_reminder_slice
+    """
+    try:
+        from app import app  # Import here to avoid circular import
+        
+        with app.app_context(), metrics.observe_scheduler_job('reminder_email_job'):
+            send_reminder_slice(app, date.today())
+                    
+    except Exception as e:
+        logger.error("Error in check_and_send_reminders: %s", e, exc_info=True)
+
+def catch_up_reminders():
+    """
+    Run at startup: send the latest reminder slice that is due (today's
+    after 8 AM, otherwise yesterday's) if no instance has finished it, so
+    emails missed while the service was down still go out
+    """
+    try:
+        from app import app  # Import here to avoid circular import
+        
+        with app.app_context(), metrics.observe_scheduler_job('reminder_catchup_job'):
+            now = datetime.now()
+            day = now.date() if now.hour >= REMINDER_EMAIL_HOUR else now.date() - timedelta(days=1)
+            send_reminder_slice(app, day)
+            
+    except Exception as e:
+        logger.error("Error in catch_up_reminders: %s", e, exc_info=True)
+
+def refresh_population_analytics():
+    """
+    Fold new checkups and conditions into the analytics rollups and
+    recompute the habit distribution
     """
     try:
         from app import app  # Import here to avoid circular import
+        from population_analytics import refresh_rollups
         
-        with app.app_context():
-            today = date.today()
-            logger.info(f"Checking for reminders on {today}")
+        with app.app_context(), metrics.observe_scheduler_job('analytics_refresh_job'):
+            result = refresh_rollups(settle_seconds=app.config.get('ANALYTICS_SETTLE_SECONDS', 60))
+            logger.info("Analytics rollups refreshed: %s", result)
             
-            # Get all reminders for today that are:
-            # 1. Not completed
-            # 2. Haven't been emailed yet
-            reminders = Reminder.query.filter(
-                Reminder.date == today,
-                Reminder.completed == False,
-                Reminder.email_sent == False
-            ).all()
+    except Exception as e:
+        logger.error("Error in refresh_population_analytics: %s", e, exc_info=True)
+
+def collect_upload_garbage():
+    """Delete uploaded images no checkup references any more"""
+    try:
+        from app import app  # Import here to avoid circular import
+        from upload_store import collect_garbage
+        
+        with app.app_context(), metrics.observe_scheduler_job('upload_gc_job'):
+            collect_garbage(
+                app.extensions['upload_store'],
+                grace_seconds=app.config.get('UPLOAD_GC_GRACE_SECONDS', 3600)
+            )
             
-            logger.info(f"Found {len(reminders)} reminders to send emails for")
+    except Exception as e:
+        logger.error("Error in collect_upload_garbage: %s", e, exc_info=True)
+
+def deliver_email_outbox():
+    """Send queued emails, retrying failures with backoff"""
+    try:
+        from app import app  # Import here to avoid circular import
+        from email_outbox import deliver_outbox, purge_sent
+        
+        with app.app_context(), metrics.observe_scheduler_job('email_outbox_job'):
+            deliver_outbox(app)
+            purge_sent(app.config.get('EMAIL_OUTBOX_RETENTION_DAYS', 7))
             
-            for reminder in reminders:
-                try:
-                    # Get the user associated with this reminder
-                    user = User.query.get(reminder.user_id)
-                    
-                    if user and user.email:
-                        # Send the email
-                        success = send_reminder_email(user.email, reminder)
-                        
-                        if success:
-                            # Mark as email sent
-                            reminder.email_sent = True
-                            db.session.commit()
-                            logger.info(f"Sent reminder email for: {reminder.title} to {user.email}")
-                        else:
-                            logger.error(f"Failed to send email for reminder: {reminder.title}")
-                    else:
-                        logger.warning(f"No user or email found for reminder ID: {reminder.id}")
-                        
-                except Exception as e:
-                    logger.error(f"Error processing reminder {reminder.id}: {str(e)}")
-                    db.session.rollback()
-                    
     except Exception as e:
-        logger.error(f"Error in check_and_send_reminders: {str(e)}")
+        logger.error("Error in deliver_email_outbox: %s", e, exc_info=True)
 
 def start_scheduler(app):
     """
     Start the background scheduler
     Runs daily at 8:00 AM
     """
-    scheduler = BackgroundScheduler()
+    # The Postgres pool reserves a connection per scheduler thread (db_engine.py)
+    scheduler = BackgroundScheduler(executors={
+        'default': ThreadPoolExecutor(app.config.get('SCHEDULER_THREADS', 5))
+    })
     
     # Schedule the reminder checker to run daily at 8:00 AM
     scheduler.add_job(
         func=check_and_send_reminders,
         trigger='cron',
-        hour=8,
+        hour=REMINDER_EMAIL_HOUR,
         minute=00,
         id='reminder_email_job',
         name='Send daily reminder emails',
         replace_existing=True
     )
     
+    # Catch up on reminder emails missed while no instance was running
+    scheduler.add_job(
+        func=catch_up_reminders,
+        id='reminder_catchup_job',
+        name='Send missed reminder emails',
+        replace_existing=True
+    )
+    
+    # Drain the email outbox; one run at a time, later ticks are skipped while it works
+    scheduler.add_job(
+        func=deliver_email_outbox,
+        trigger='interval',
+        seconds=app.config.get('EMAIL_OUTBOX_POLL_SECONDS', 10),
+        id='email_outbox_job',
+        name='Send queued emails',
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True
+    )
+    
+    # Keep the population analytics rollups current
+    scheduler.add_job(
+        func=refresh_population_analytics,
+        trigger='interval',
+        minutes=app.config.get('ANALYTICS_REFRESH_MINUTES', 15),
+        id='analytics_refresh_job',
+        name='Refresh population analytics rollups',
+        replace_existing=True
+    )
+    
+    # Reclaim unreferenced upload blobs
+    scheduler.add_job(
+        func=collect_upload_garbage,
+        trigger='interval',
+        hours=app.config.get('UPLOAD_GC_INTERVAL_HOURS', 24),
+        id='upload_gc_job',
+        name='Collect unreferenced uploads',
+        replace_existing=True
+    )
+    
     scheduler.start()
     logger.info("Email reminder scheduler started - will check daily at 8:00 AM")
     
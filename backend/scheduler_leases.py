@@ -0,0 +1,140 @@
+"""
+Database-backed coordination for scheduler jobs that run on every instance.
+
+Each instance's scheduler fires the same jobs, so work is coordinated
+through the database instead of in memory:
+
+Leases (SchedulerLease) name an owner for a job until expires_at. The owner
+of a job's lease runs its current time slice (for reminder emails, one
+day) and records the slice in completed_slice when it is done, so an
+instance that fires later, or restarts and catches up, does not run it
+again. The owner renews the lease while it works; if it dies, the lease
+expires and another instance can take over.
+
+Claims split the work itself. claim_reminders() marks the due reminders of
+the next few users as claimed by this instance until a deadline, so instances
+without the lease can help with a large send and no reminder is handed to
+two of them. On Postgres the chunk is picked with SELECT ... FOR UPDATE
+SKIP LOCKED, so concurrent claims skip each other's rows instead of
+waiting. SQLite has a single writer, so the same UPDATE is atomic there
+without row locks. A claim left behind by a crashed instance expires and
+the reminder is claimed again, so delivery is at least once.
+"""
+from datetime import datetime, timedelta
+import os
+import socket
+import time
+import uuid
+from sqlalchemy import exists, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from models import SchedulerLease, Reminder
+
+# Identifies this process in lease and claim columns; the random suffix
+# keeps a restarted container (often pid 1 again) from inheriting claims
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Claims that find every candidate locked by another instance retry this often
+CLAIM_ATTEMPTS = 20
+CLAIM_RETRY_SECONDS = 0.05
+
+_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def acquire_lease(db_session, name, ttl_seconds, now=None):
+    """
+    Take or renew the lease on name unless another live instance holds it.
+    Returns (acquired, completed_slice).
+    """
+    now = now or datetime.utcnow()
+    table = SchedulerLease.__table__
+    insert = _INSERTS[db_session.get_bind().dialect.name]
+    expires_at = now + timedelta(seconds=ttl_seconds)
+
+    db_session.execute(insert(table).values(
+        name=name, owner=INSTANCE_ID, expires_at=expires_at, updated_at=now
+    ).on_conflict_do_update(
+        index_elements=[table.c.name],
+        set_={'owner': INSTANCE_ID, 'expires_at': expires_at, 'updated_at': now},
+        where=or_(table.c.expires_at < now, table.c.owner == INSTANCE_ID)
+    ))
+    owner, completed_slice = db_session.execute(
+        select(table.c.owner, table.c.completed_slice).where(table.c.name == name)
+    ).one()
+    return owner == INSTANCE_ID, completed_slice
+
+
+def release_lease(db_session, name, completed_slice=None, now=None):
+    """Give up a held lease, recording completed_slice if given"""
+    now = now or datetime.utcnow()
+    values = {'expires_at': now, 'updated_at': now}
+    if completed_slice is not None:
+        values['completed_slice'] = completed_slice
+    return db_session.execute(
+        update(SchedulerLease)
+        .where(SchedulerLease.name == name, SchedulerLease.owner == INSTANCE_ID)
+        .values(**values).execution_options(synchronize_session=False)
+    ).rowcount == 1
+
+
+def claim_reminders(db_session, start, end, chunk_size, claim_seconds, now=None):
+    """
+    Claim the unsent, uncompleted reminders dated start..end of the next few
+    users (about chunk_size reminders) that nobody holds a live claim on.
+    Whole users are claimed so each one's digest goes out in one email.
+    Returns the reminder ids.
+    """
+    now = now or datetime.utcnow()
+    claimable = (
+        Reminder.email_sent == False,
+        Reminder.date >= start,
+        Reminder.date <= end,
+        Reminder.completed == False,
+        or_(Reminder.email_claimed_until.is_(None), Reminder.email_claimed_until < now)
+    )
+    next_users = select(Reminder.user_id).where(*claimable).order_by(Reminder.user_id).limit(chunk_size)
+    rows = select(Reminder.id).where(*claimable, Reminder.user_id.in_(next_users))
+    skip_locked = db_session.get_bind().dialect.name == 'postgresql'
+    if skip_locked:
+        rows = rows.with_for_update(skip_locked=True)
+    statement = update(Reminder).where(Reminder.id.in_(rows)).values(
+        email_claimed_by=INSTANCE_ID,
+        email_claimed_until=now + timedelta(seconds=claim_seconds)
+    ).returning(Reminder.id).execution_options(synchronize_session=False)
+
+    for _ in range(CLAIM_ATTEMPTS):
+        claimed = db_session.execute(statement).scalars().all()
+        if claimed or not skip_locked:
+            return claimed
+        # Another instance is claiming the same users right now; once it
+        # commits they are no longer claimable, so look again
+        if not db_session.execute(select(exists().where(*claimable))).scalar():
+            return []
+        time.sleep(CLAIM_RETRY_SECONDS)
+    return []
+
+
+def mark_reminders_sent(db_session, reminder_ids):
+    """Mark reminders this instance still holds as emailed; returns the ids it marked"""
+    if not reminder_ids:
+        return set()
+    return set(db_session.execute(
+        update(Reminder).where(
+            Reminder.id.in_(reminder_ids), Reminder.email_claimed_by == INSTANCE_ID,
+            Reminder.email_sent == False
+        ).values(email_sent=True, email_claimed_until=None)
+        .returning(Reminder.id).execution_options(synchronize_session=False)
+    ).scalars())
+
+
+def unmark_reminders_sent(db_session, reminder_ids):
+    """Undo mark_reminders_sent for reminders whose email was not queued, releasing their claims"""
+    if not reminder_ids:
+        return 0
+    return db_session.execute(
+        update(Reminder).where(Reminder.id.in_(reminder_ids), Reminder.email_claimed_by == INSTANCE_ID)
+        .values(email_sent=False, email_claimed_by=None, email_claimed_until=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
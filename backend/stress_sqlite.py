@@ -0,0 +1,237 @@
+"""
+Concurrency stress test for the SQLite engine profile and the single-writer queue.
+
+Web client threads mix habit updates, checkup inserts and reads while a
+scheduler-like thread keeps marking reminder emails as sent, all against one
+SQLite file. Each mode runs in its own subprocess with a fresh database and
+the fake inference backend, and reports lock errors, latency and whether
+every acknowledged write actually landed.
+
+Usage:
+    python stress_sqlite.py --threads 8 --ops 200
+    python stress_sqlite.py --modes legacy,wal --json
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODES = {
+    # Rollback journal with full fsync: the engine before the SQLite profile
+    'legacy': {'SQLITE_WAL': 'False', 'SQLITE_SYNCHRONOUS': 'FULL', 'SQLITE_MMAP_SIZE': '0'},
+    'wal': {'SQLITE_WAL': 'True', 'DB_WRITE_QUEUE': 'False'},
+    'wal-queue': {'SQLITE_WAL': 'True', 'DB_WRITE_QUEUE': 'True'},
+}
+
+# Relative weights of client operations
+OPERATIONS = {
+    'habit_update': 5,
+    'checkup_insert': 2,
+    'habit_read': 2,
+    'history_read': 1,
+}
+
+
+def run_worker(threads, ops, reminders, seed, result_path):
+    """Hammer the app from several threads and record what happened"""
+    import numpy as np
+    sys.path.insert(0, BACKEND_DIR)
+    from app import app, db
+    from models import AICheckup, Reminder, User
+    from datetime import date
+    from write_queue import run_write
+
+    with app.app_context():
+        db.create_all()
+
+    image_path = sorted(glob.glob(os.path.join(BACKEND_DIR, 'uploads', '**', '*.jpg'), recursive=True))[0]
+    with open(image_path, 'rb') as f:
+        image = f.read()
+
+    latencies = {name: [] for name in OPERATIONS}
+    errors = []
+    checkups_acknowledged = [0]
+    reminders_acknowledged = [0]
+    lock = threading.Lock()
+    clients_done = threading.Event()
+
+    def client_loop(index):
+        rng = random.Random(seed + index)
+        client = app.test_client()
+        email = f"stress{index}@example.com"
+        client.post('/api/register', json={'email': email, 'password': 'pw', 'username': f"stress{index}"})
+        client.post('/api/login', json={'email': email, 'password': 'pw'})
+        # Cookie-authenticated writes must echo the CSRF cookie in a header
+        client.environ_base['HTTP_X_CSRF_TOKEN'] = client.get_cookie('csrf_access_token').value
+
+        names = list(OPERATIONS)
+        weights = list(OPERATIONS.values())
+        for _ in range(ops):
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            if name == 'habit_update':
+                response = client.post('/api/habits/today', json={
+                    'brushed': rng.random() < 0.5,
+                    'flossed': rng.random() < 0.5,
+                    'brushing_time': rng.randint(30, 180)
+                })
+            elif name == 'checkup_insert':
+                response = client.post(
+                    '/api/ai-checkup',
+                    data={'image': (io.BytesIO(image), 'stress.jpg')},
+                    content_type='multipart/form-data'
+                )
+            elif name == 'habit_read':
+                response = client.get('/api/habits/today')
+            else:
+                response = client.get('/api/ai-checkup/history')
+            elapsed = (time.perf_counter() - start) * 1000
+
+            with lock:
+                latencies[name].append(elapsed)
+                if response.status_code >= 400:
+                    errors.append((name, (response.get_json() or {}).get('error', '')))
+                elif name == 'checkup_insert':
+                    checkups_acknowledged[0] += 1
+
+    def scheduler_loop(reminder_ids):
+        """Mark reminder emails as sent one by one, like check_and_send_reminders"""
+        with app.app_context():
+            for reminder_id in reminder_ids:
+                try:
+                    run_write(lambda db_session, rid=reminder_id: db_session.query(Reminder)
+                              .filter_by(id=rid).update({'email_sent': True}))
+                    reminders_acknowledged[0] += 1
+                except Exception as e:
+                    db.session.rollback()
+                    with lock:
+                        errors.append(('reminder_mark', str(e)))
+                if clients_done.is_set():
+                    break
+
+    # The scheduler's reminders belong to a user created up front
+    with app.app_context():
+        owner = User(email='scheduler@example.com', username='scheduler', password='-')
+        db.session.add(owner)
+        db.session.flush()
+        reminders_due = [
+            Reminder(user_id=owner.id, type='appointment', title=f"Stress {i}", date=date.today())
+            for i in range(reminders)
+        ]
+        db.session.add_all(reminders_due)
+        db.session.commit()
+        reminder_ids = [reminder.id for reminder in reminders_due]
+
+    workers = [threading.Thread(target=client_loop, args=(i,)) for i in range(threads)]
+    scheduler = threading.Thread(target=scheduler_loop, args=(reminder_ids,))
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    scheduler.start()
+
+    for worker in workers:
+        worker.join()
+    clients_done.set()
+    scheduler.join()
+    wall = time.perf_counter() - start
+
+    with app.app_context():
+        checkups_stored = AICheckup.query.count()
+        reminders_marked = Reminder.query.filter_by(email_sent=True).count()
+
+    total_ops = sum(len(v) for v in latencies.values())
+    all_latencies = [ms for v in latencies.values() for ms in v]
+    write_latencies = latencies['habit_update'] + latencies['checkup_insert']
+
+    with open(result_path, 'w') as f:
+        json.dump({
+            'ops': total_ops,
+            'errors': len(errors),
+            'locked_errors': sum('locked' in message for _, message in errors),
+            'error_samples': errors[:5],
+            'ops_per_second': round(total_ops / wall, 1),
+            'p50_ms': round(float(np.percentile(all_latencies, 50)), 2),
+            'p99_ms': round(float(np.percentile(all_latencies, 99)), 2),
+            'write_p50_ms': round(float(np.percentile(write_latencies, 50)), 2),
+            'write_p99_ms': round(float(np.percentile(write_latencies, 99)), 2),
+            'checkups_acknowledged': checkups_acknowledged[0],
+            'checkups_stored': checkups_stored,
+            'reminders_acknowledged': reminders_acknowledged[0],
+            'reminders_marked': reminders_marked,
+        }, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stress SQLite with concurrent writers')
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent web clients')
+    parser.add_argument('--ops', type=int, default=100, help='Operations per client')
+    parser.add_argument('--reminders', type=int, default=200, help='Reminders the scheduler thread marks')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.threads, args.ops, args.reminders, args.seed, args.worker)
+        return
+
+    results = {}
+    failed = False
+    for mode in args.modes.split(','):
+        with tempfile.TemporaryDirectory() as workdir:
+            result_path = os.path.join(workdir, 'result.json')
+            env = dict(
+                os.environ,
+                DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'stress.db')}",
+                SECRET_KEY='stress',
+                MODEL_BACKEND='fake',
+                MODEL_FAKE_LATENCY_MS='0',
+                LOG_LEVEL='CRITICAL',
+                **MODES[mode]
+            )
+            process = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--worker', result_path,
+                 '--threads', str(args.threads), '--ops', str(args.ops),
+                 '--reminders', str(args.reminders), '--seed', str(args.seed)],
+                cwd=workdir, env=env, capture_output=True, text=True
+            )
+            if process.returncode != 0:
+                print(f"Mode {mode} failed:\n{process.stderr[-2000:]}", file=sys.stderr)
+                failed = True
+                continue
+            with open(result_path) as f:
+                results[mode] = json.load(f)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'mode':<12}{'ops/s':>8}{'errors':>8}{'locked':>8}{'p50 ms':>9}{'p99 ms':>9}"
+              f"{'wr p99':>9}{'checkups':>11}{'reminders':>11}")
+        for mode, r in results.items():
+            print(f"{mode:<12}{r['ops_per_second']:>8}{r['errors']:>8}{r['locked_errors']:>8}"
+                  f"{r['p50_ms']:>9}{r['p99_ms']:>9}{r['write_p99_ms']:>9}"
+                  f"{r['checkups_stored']:>5}/{r['checkups_acknowledged']:<5}"
+                  f"{r['reminders_marked']:>5}/{r['reminders_acknowledged']:<5}")
+            for name, message in r['error_samples']:
+                print(f"    {name}: {message[:100]}")
+
+    # A lost acknowledged write is a failure in any mode; lock errors are only reported
+    for r in results.values():
+        if (r['checkups_stored'] != r['checkups_acknowledged']
+                or r['reminders_marked'] != r['reminders_acknowledged']):
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
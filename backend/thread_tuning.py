@@ -0,0 +1,327 @@
+"""
+CPU-topology-aware thread tuning for inference workers.
+
+Every web worker loads its own copy of the model. Left alone, each inference
+runtime sizes its thread pool to all host cores, so N workers oversubscribe
+the machine N times over. This module detects the usable CPU budget (affinity
+mask and cgroup quota), splits it across workers and, optionally, calibrates
+the per-worker thread count by measuring throughput in subprocesses.
+
+Usage:
+    python thread_tuning.py detect
+    python thread_tuning.py calibrate --backend onnx --workers 4
+
+Environment:
+    WEB_CONCURRENCY / MODEL_WORKERS   number of worker processes sharing the host
+    MODEL_INTRA_OP_THREADS            override the per-worker intra-op thread count
+    MODEL_INTER_OP_THREADS            override the inter-op thread count (default 1)
+    MODEL_THREAD_CALIBRATE=True       run the calibration sweep at model load (first worker only)
+    MODEL_CPU_AFFINITY=True           pin each worker to its own slice of CPUs
+    MODEL_WORKER_INDEX                slot used for affinity (default pid % workers)
+    MODEL_THREAD_CONFIG               calibration file (default model/thread_config.json)
+"""
+import argparse
+import fcntl
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), 'model')
+DEFAULT_CONFIG_PATH = os.path.join(MODEL_DIR, 'thread_config.json')
+
+# Fewer threads win when within this fraction of the best throughput
+CALIBRATION_TOLERANCE = 0.05
+
+
+def allowed_cpus():
+    """CPUs this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cgroup_cpu_limit():
+    """
+    CPU quota from cgroup v2 (cpu.max) or v1 (cfs_quota_us/cfs_period_us),
+    rounded up to whole CPUs. Returns None when there is no quota.
+    """
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            return max(1, math.ceil(int(quota) / int(period)))
+        return None
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        if quota > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+
+def detect_cpu_budget():
+    """Number of CPUs actually usable: affinity mask capped by cgroup quota"""
+    cpus = len(allowed_cpus())
+    quota = cgroup_cpu_limit()
+    return min(cpus, quota) if quota else cpus
+
+
+def worker_count():
+    """Number of worker processes sharing this host's CPU budget"""
+    return max(1, int(os.environ.get('MODEL_WORKERS') or os.environ.get('WEB_CONCURRENCY') or 1))
+
+
+def heuristic_config(cpu_budget=None, workers=None):
+    """Split the CPU budget evenly across workers"""
+    cpu_budget = cpu_budget or detect_cpu_budget()
+    workers = workers or worker_count()
+    return {
+        'source': 'heuristic',
+        'cpu_budget': cpu_budget,
+        'workers': workers,
+        'intra_op_threads': max(1, cpu_budget // workers),
+        'inter_op_threads': 1,
+    }
+
+
+def candidate_thread_counts(max_threads):
+    """Powers of two up to max_threads, plus max_threads itself"""
+    counts = []
+    threads = 1
+    while threads < max_threads:
+        counts.append(threads)
+        threads *= 2
+    counts.append(max_threads)
+    return counts
+
+
+def measure_throughput(backend_name, model_path, threads, duration=2.0):
+    """Batch-of-one throughput of a backend with the given intra-op threads"""
+    import numpy as np
+    from inference_backends import load_backend
+
+    backend = load_backend(
+        backend_name, model_path,
+        intra_op_threads=threads, inter_op_threads=1
+    )
+    batch = np.random.default_rng(0).random((1, 224, 224, 3), dtype=np.float32)
+
+    for _ in range(3):
+        backend.predict(batch)
+
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        backend.predict(batch)
+        count += 1
+
+    return count / (time.perf_counter() - start)
+
+
+def calibrate(backend_name, model_path, cpu_budget=None, workers=None, duration=2.0):
+    """
+    Sweep intra-op thread counts up to the per-worker budget.
+    Each candidate runs in a fresh subprocess because TensorFlow's thread
+    pools cannot be resized once initialized.
+    """
+    config = heuristic_config(cpu_budget, workers)
+    sweep = []
+
+    for threads in candidate_thread_counts(config['intra_op_threads']):
+        output = subprocess.run(
+            [sys.executable, __file__, 'measure',
+             '--backend', backend_name, '--model-path', model_path,
+             '--threads', str(threads), '--duration', str(duration)],
+            capture_output=True, text=True
+        )
+        if output.returncode != 0:
+            logger.warning("Calibration with %d threads failed: %s", threads, output.stderr.strip()[-200:])
+            continue
+        images_per_second = float(output.stdout.strip().splitlines()[-1])
+        sweep.append({'threads': threads, 'images_per_second': round(images_per_second, 2)})
+
+    if not sweep:
+        return config
+
+    best = max(entry['images_per_second'] for entry in sweep)
+    chosen = next(
+        entry for entry in sweep
+        if entry['images_per_second'] >= best * (1 - CALIBRATION_TOLERANCE)
+    )
+
+    config.update({
+        'source': 'calibrated',
+        'backend': backend_name,
+        'intra_op_threads': chosen['threads'],
+        'measured_images_per_second': chosen['images_per_second'],
+        'sweep': sweep,
+        'calibrated_at': datetime.now().isoformat(),
+    })
+    return config
+
+
+def load_config(path=None):
+    """Previously saved calibration, or None"""
+    path = path or os.environ.get('MODEL_THREAD_CONFIG', DEFAULT_CONFIG_PATH)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_config(config, path=None):
+    path = path or os.environ.get('MODEL_THREAD_CONFIG', DEFAULT_CONFIG_PATH)
+    # Written to a temporary file and renamed so other workers never read half of it
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _matches(config, backend_name, cpu_budget, workers):
+    return bool(config) and config.get('backend') == backend_name \
+        and config.get('cpu_budget') == cpu_budget and config.get('workers') == workers
+
+
+def calibrate_once(backend_name, model_path, cpu_budget, workers):
+    """
+    Calibrate and save the result, unless another worker already has.
+    Workers starting together wait on a file lock, so only the first one runs
+    the sweep (the others would skew its measurements) and the rest load its
+    saved configuration.
+    """
+    path = os.environ.get('MODEL_THREAD_CONFIG', DEFAULT_CONFIG_PATH)
+    with open(f"{path}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            saved = load_config(path)
+            if _matches(saved, backend_name, cpu_budget, workers):
+                return saved
+            logger.info("Calibrating inference thread count...")
+            config = calibrate(backend_name, model_path, cpu_budget, workers)
+            if config['source'] == 'calibrated':
+                save_config(config, path)
+            return config
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def apply_affinity(config):
+    """
+    Pin this worker to its own contiguous slice of the allowed CPUs.
+    Needs a unique MODEL_WORKER_INDEX per worker (gunicorn.conf.py sets it);
+    guessing from the pid could put two workers on the same CPUs.
+    """
+    if not hasattr(os, 'sched_setaffinity'):
+        return None
+    if not os.environ.get('MODEL_WORKER_INDEX'):
+        logger.warning("MODEL_CPU_AFFINITY is on but MODEL_WORKER_INDEX is not set; not pinning CPUs")
+        return None
+
+    cpus = allowed_cpus()
+    threads = config['intra_op_threads']
+    index = int(os.environ['MODEL_WORKER_INDEX'])
+
+    start = (index * threads) % len(cpus)
+    selected = [cpus[(start + i) % len(cpus)] for i in range(min(threads, len(cpus)))]
+    os.sched_setaffinity(0, selected)
+    return selected
+
+
+def configure_threads(backend_name, model_path):
+    """
+    Choose the thread configuration for this worker.
+    Priority: explicit env overrides, then a matching saved calibration,
+    then a startup calibration if enabled, then the even-split heuristic.
+    """
+    cpu_budget = detect_cpu_budget()
+    workers = worker_count()
+    saved = load_config()
+
+    if _matches(saved, backend_name, cpu_budget, workers):
+        config = saved
+    elif os.environ.get('MODEL_THREAD_CALIBRATE', 'False') == 'True' and model_path and os.path.exists(model_path):
+        config = calibrate_once(backend_name, model_path, cpu_budget, workers)
+    else:
+        config = heuristic_config(cpu_budget, workers)
+
+    if os.environ.get('MODEL_INTRA_OP_THREADS'):
+        config['intra_op_threads'] = int(os.environ['MODEL_INTRA_OP_THREADS'])
+        config['source'] = 'environment'
+    if os.environ.get('MODEL_INTER_OP_THREADS'):
+        config['inter_op_threads'] = int(os.environ['MODEL_INTER_OP_THREADS'])
+
+    config['cpu_affinity'] = None
+    if os.environ.get('MODEL_CPU_AFFINITY', 'False') == 'True':
+        config['cpu_affinity'] = apply_affinity(config)
+
+    logger.info(
+        "Inference threads: %s intra-op, %s inter-op (%s, %s CPUs / %s workers)",
+        config['intra_op_threads'], config['inter_op_threads'], config['source'],
+        config['cpu_budget'], config['workers']
+    )
+    return config
+
+
+def main():
+    from inference_backends import BACKENDS, get_backend_name, get_model_path
+
+    parser = argparse.ArgumentParser(description='Tune inference thread counts')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('detect', help='Show the detected CPU budget')
+
+    calibrate_parser = subparsers.add_parser('calibrate', help='Run the thread sweep and save it')
+    calibrate_parser.add_argument('--backend', choices=BACKENDS, default=get_backend_name())
+    calibrate_parser.add_argument('--model-path')
+    calibrate_parser.add_argument('--workers', type=int, default=worker_count())
+    calibrate_parser.add_argument('--duration', type=float, default=2.0)
+    calibrate_parser.add_argument('--output')
+
+    measure_parser = subparsers.add_parser('measure', help=argparse.SUPPRESS)
+    measure_parser.add_argument('--backend', required=True)
+    measure_parser.add_argument('--model-path', required=True)
+    measure_parser.add_argument('--threads', type=int, required=True)
+    measure_parser.add_argument('--duration', type=float, default=2.0)
+
+    args = parser.parse_args()
+
+    if args.command == 'detect':
+        print(json.dumps({
+            'allowed_cpus': allowed_cpus(),
+            'cgroup_cpu_limit': cgroup_cpu_limit(),
+            'cpu_budget': detect_cpu_budget(),
+            'workers': worker_count(),
+            'heuristic': heuristic_config(),
+        }, indent=2))
+
+    elif args.command == 'calibrate':
+        model_path = args.model_path or get_model_path(args.backend)
+        config = calibrate(args.backend, model_path, workers=args.workers, duration=args.duration)
+        path = save_config(config, args.output)
+        print(json.dumps(config, indent=2))
+        print(f"✓ Saved thread configuration to {path}")
+
+    elif args.command == 'measure':
+        print(measure_throughput(args.backend, args.model_path, args.threads, args.duration))
+
+
+if __name__ == '__main__':
+    main()
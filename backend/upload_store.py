@@ -0,0 +1,208 @@
+"""
+Content-addressed store for uploaded checkup images.
+
+A blob lives at <root>/<aa>/<bb>/<sha256>.jpg, where aa and bb are the first
+two byte pairs of its SHA-256, so no directory grows past a few thousand
+entries and identical uploads share one file. Writes go to a temporary file
+under <root>/.tmp and are renamed into place, so a reader never sees a
+partial blob.
+
+Checkups reference blobs through AICheckup.image_path and image_sha256.
+collect_garbage() deletes blobs that no checkup references, once they are
+older than the grace period. Storing a blob that already exists refreshes
+its modification time, so a blob being re-uploaded is never collected.
+Uploads and GC may run in different processes, so GC does not delete in
+place: it first renames a candidate into <root>/.trash, after which a new
+put() writes a fresh copy. It then checks the moved file again and puts it
+back if it was refreshed just before the move or a checkup now references
+it.
+"""
+from flask import current_app
+import hashlib
+import logging
+import os
+import tempfile
+import time
+import uuid
+import metrics
+from models import db, AICheckup
+
+logger = logging.getLogger(__name__)
+
+BLOB_SUFFIX = '.jpg'
+TMP_DIR = '.tmp'
+TRASH_DIR = '.trash'
+
+# Digests checked against the database per query
+GC_BATCH_SIZE = 500
+
+
+class UploadStore:
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, TMP_DIR)
+        self.trash_dir = os.path.join(root, TRASH_DIR)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        os.makedirs(self.trash_dir, exist_ok=True)
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest + BLOB_SUFFIX)
+
+    def put(self, data):
+        """Store bytes and return (digest, path); identical data is stored once"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest)
+
+        if os.path.exists(path):
+            try:
+                os.utime(path)
+                metrics.UPLOADS_STORED.labels(outcome='duplicate').inc()
+                return digest, path
+            except FileNotFoundError:
+                pass  # Collected in between; write it again
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        metrics.UPLOADS_STORED.labels(outcome='new').inc()
+        return digest, path
+
+    def iter_blobs(self):
+        """Yield (digest, path) for every stored blob"""
+        for first in sorted(os.listdir(self.root)):
+            first_path = os.path.join(self.root, first)
+            if len(first) != 2 or not os.path.isdir(first_path):
+                continue
+            for second in sorted(os.listdir(first_path)):
+                second_path = os.path.join(first_path, second)
+                if not os.path.isdir(second_path):
+                    continue
+                for name in os.listdir(second_path):
+                    if name.endswith(BLOB_SUFFIX):
+                        yield name[:-len(BLOB_SUFFIX)], os.path.join(second_path, name)
+
+    def remove_if_older(self, path, cutoff):
+        """Delete a file unless it was written or re-uploaded after cutoff"""
+        try:
+            if os.stat(path).st_mtime >= cutoff:
+                return False
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def trash_if_older(self, digest, path, cutoff):
+        """
+        Move a blob into the trash unless it was written or re-uploaded after
+        cutoff. Returns the trash path, or None if the blob was kept.
+        """
+        trash_path = os.path.join(self.trash_dir, f"{digest}.{uuid.uuid4().hex[:8]}")
+        try:
+            if os.stat(path).st_mtime >= cutoff:
+                return None
+            os.rename(path, trash_path)
+            return trash_path
+        except FileNotFoundError:
+            return None
+
+    def iter_trash(self):
+        """Yield (digest, trash path) for blobs in the trash"""
+        for name in os.listdir(self.trash_dir):
+            yield name.split('.', 1)[0], os.path.join(self.trash_dir, name)
+
+    def restore(self, digest, trash_path):
+        """Put a trashed blob back; a copy stored again since is identical"""
+        path = self.path_for(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(trash_path, path)
+
+
+def init_upload_store(app):
+    """Create the upload store under UPLOAD_FOLDER"""
+    app.config.setdefault('UPLOAD_FOLDER', 'uploads')
+    app.config.setdefault('UPLOAD_GC_GRACE_SECONDS', 3600)
+    app.extensions['upload_store'] = UploadStore(app.config['UPLOAD_FOLDER'])
+
+
+def get_upload_store():
+    return current_app.extensions['upload_store']
+
+
+def _referenced(digests):
+    rows = db.session.query(AICheckup.image_sha256).filter(AICheckup.image_sha256.in_(digests)).distinct()
+    return {digest for (digest,) in rows}
+
+
+def collect_garbage(store, grace_seconds=3600, dry_run=False):
+    """
+    Delete blobs no checkup references and abandoned temporary files, if
+    they are older than grace_seconds. Returns counts of what was found.
+    """
+    cutoff = time.time() - grace_seconds
+    result = {'scanned': 0, 'unreferenced': 0, 'deleted': 0, 'restored': 0, 'tmp_deleted': 0}
+
+    def empty_trash(trashed):
+        # A put() may have refreshed a blob between its mtime check and the
+        # move, and its checkup may have committed since the first query
+        referenced = _referenced([digest for digest, _ in trashed])
+        db.session.rollback()
+        for digest, trash_path in trashed:
+            try:
+                if digest in referenced or os.stat(trash_path).st_mtime >= cutoff:
+                    store.restore(digest, trash_path)
+                    result['restored'] += 1
+                else:
+                    os.remove(trash_path)
+                    result['deleted'] += 1
+            except FileNotFoundError:
+                pass
+
+    def sweep(batch):
+        referenced = _referenced([digest for digest, _ in batch])
+        db.session.rollback()  # Don't hold a read transaction across the file system work
+        trashed = []
+        for digest, path in batch:
+            if digest in referenced:
+                continue
+            result['unreferenced'] += 1
+            if not dry_run:
+                trash_path = store.trash_if_older(digest, path, cutoff)
+                if trash_path:
+                    trashed.append((digest, trash_path))
+        if trashed:
+            empty_trash(trashed)
+
+    # Blobs left in the trash by a GC run that died are decided again
+    if not dry_run:
+        leftovers = list(store.iter_trash())
+        for i in range(0, len(leftovers), GC_BATCH_SIZE):
+            empty_trash(leftovers[i:i + GC_BATCH_SIZE])
+
+    batch = []
+    for digest, path in store.iter_blobs():
+        result['scanned'] += 1
+        batch.append((digest, path))
+        if len(batch) >= GC_BATCH_SIZE:
+            sweep(batch)
+            batch = []
+    if batch:
+        sweep(batch)
+
+    for name in os.listdir(store.tmp_dir):
+        if not dry_run and store.remove_if_older(os.path.join(store.tmp_dir, name), cutoff):
+            result['tmp_deleted'] += 1
+
+    if not dry_run:
+        metrics.UPLOAD_BLOBS_COLLECTED.inc(result['deleted'])
+    logger.info("Upload GC: %s", result)
+    return result
@@ -0,0 +1,134 @@
+"""
+Optional single-writer queue for databases that allow one writer at a time.
+
+With DB_WRITE_QUEUE=True every write submitted through run_write() is handed
+to one background thread. It takes whatever jobs are waiting (up to
+DB_WRITE_QUEUE_MAX_BATCH) and commits them together, so a burst of small
+writes costs one transaction instead of many competing ones. If a batch
+fails, its jobs are retried one at a time so one bad write cannot fail
+its neighbours.
+
+A job is a callable taking the SQLAlchemy session. It runs on the writer
+thread, so it must return plain values (ids, timestamps), not ORM objects.
+If run_write() times out before the writer picks a job up, the job is
+cancelled and never applied; if it was already running, WriteTimeoutError
+says so, because it may still commit.
+"""
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from flask import current_app
+import logging
+import queue
+import threading
+import time
+import metrics
+from models import db
+
+logger = logging.getLogger(__name__)
+
+
+class WriteTimeoutError(TimeoutError):
+    """run_write() gave up waiting; the message says whether the write may still be applied"""
+
+
+class WriteQueue:
+    def __init__(self, app, max_batch=50, max_wait_ms=0):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, job):
+        future = Future()
+        self._queue.put((job, future))
+        metrics.DB_WRITE_QUEUE_DEPTH.inc()
+        return future
+
+    def _next_batch(self):
+        """Block for one job, then take whatever else is waiting"""
+        jobs = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(jobs) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    jobs.append(self._queue.get(timeout=remaining))
+                else:
+                    jobs.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        metrics.DB_WRITE_QUEUE_DEPTH.dec(len(jobs))
+        return jobs
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                # Skip jobs whose caller timed out and cancelled them while queued
+                jobs = [(job, future) for job, future in self._next_batch()
+                        if future.set_running_or_notify_cancel()]
+                if not jobs:
+                    continue
+                metrics.DB_WRITE_BATCH_SIZE.observe(len(jobs))
+                try:
+                    self._run_batch(jobs)
+                finally:
+                    db.session.remove()
+
+    def _run_batch(self, jobs):
+        try:
+            results = [job(db.session) for job, _ in jobs]
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if len(jobs) == 1:
+                jobs[0][1].set_exception(e)
+                return
+            logger.warning("Write batch of %d failed (%s), retrying individually", len(jobs), e)
+            for job in jobs:
+                self._run_batch([job])
+            return
+
+        for (_, future), result in zip(jobs, results):
+            future.set_result(result)
+
+
+def init_write_queue(app):
+    """Start the writer thread if DB_WRITE_QUEUE is enabled"""
+    app.config.setdefault('DB_WRITE_QUEUE', False)
+    app.config.setdefault('DB_WRITE_QUEUE_MAX_BATCH', 50)
+    app.config.setdefault('DB_WRITE_QUEUE_MAX_WAIT_MS', 0)
+
+    if app.config['DB_WRITE_QUEUE']:
+        app.extensions['write_queue'] = WriteQueue(
+            app,
+            max_batch=app.config['DB_WRITE_QUEUE_MAX_BATCH'],
+            max_wait_ms=app.config['DB_WRITE_QUEUE_MAX_WAIT_MS']
+        )
+
+
+def run_write(job, timeout=30):
+    """
+    Run a write job and return its result.
+    Goes through the writer thread when the queue is enabled, otherwise
+    runs and commits on the current session.
+    """
+    write_queue = current_app.extensions.get('write_queue')
+    if write_queue:
+        future = write_queue.submit(job)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise WriteTimeoutError(f"Write was not started within {timeout}s and was cancelled; nothing was applied")
+            raise WriteTimeoutError(f"Write did not finish within {timeout}s; it is still running and may yet be applied")
+
+    try:
+        result = job(db.session)
+        db.session.commit()
+        return result
+    except Exception:
+        db.session.rollback()
+        raise
@@ -12,6 +12,22 @@ const apiClient = axios.create({
   },
 });
 
+// The access token travels in an HttpOnly cookie; writes must echo its CSRF token
+const readCookie = (name) => {
+  const match = document.cookie.match(new RegExp(`(?:^|; )${name}=([^;]*)`));
+  return match ? decodeURIComponent(match[1]) : null;
+};
+
+apiClient.interceptors.request.use((config) => {
+  if (!['get', 'head', 'options'].includes((config.method || 'get').toLowerCase())) {
+    const csrfToken = readCookie('csrf_access_token');
+    if (csrfToken) {
+      config.headers['X-CSRF-TOKEN'] = csrfToken;
+    }
+  }
+  return config;
+});
+
 // Auth API
 const login = (email, password) => {
   return apiClient.post('/login', { email, password });
@@ -46,11 +62,33 @@ const getHistory = (days = 7) => {
   return apiClient.get(`/habits/history?days=${days}`);
 };
 
+// Batch upsert of habits recorded offline: [{date, brushed, flossed, brushing_time, updated_at}]
+const syncHabits = (entries) => {
+  return apiClient.post('/habits/sync', { entries });
+};
+
+// Compact calendar: base64 day bitmaps (tracked, brushed, flossed) + run-length brushing times
+const getCalendar = (start, end) => {
+  const params = new URLSearchParams();
+  if (start) params.append('start', start);
+  if (end) params.append('end', end);
+  return apiClient.get(`/habits/calendar?${params.toString()}`);
+};
+
 // Profile API
 const getProfile = () => {
   return apiClient.get('/profile');
 };
 
+const updateProfile = (profileData) => {
+  return apiClient.put('/profile', profileData);
+};
+
+// Full account export is a streamed zip; link to it instead of loading it through axios
+const getExportUrl = () => {
+  return `${baseURL}/api/export`;
+};
+
 // AI Checkup API
 const uploadImage = (imageFile) => {
   const formData = new FormData();
@@ -71,16 +109,20 @@ const getCheckupDetails = (checkupId) => {
   return apiClient.get(`/ai-checkup/${checkupId}`);
 };
 
+// Health score / condition confidence trend: bucket 'day' | 'week' | 'month', optional start, end, conditions[]
+const getCheckupTrend = (bucket = 'week', { start, end, conditions } = {}) => {
+  const params = new URLSearchParams({ bucket });
+  if (start) params.append('start', start);
+  if (end) params.append('end', end);
+  if (conditions && conditions.length) params.append('conditions', conditions.join(','));
+  return apiClient.get(`/ai-checkup/trend?${params.toString()}`);
+};
+
 // Model health check
 const getModelHealth = () => {
   return apiClient.get('/model-health');
 };
 
-// Test model endpoint
-const testModel = () => {
-  return apiClient.get('/test-model');
-};
-
 // Reminders API
 const getReminders = () => {
   return apiClient.get('/reminders');
@@ -110,6 +152,24 @@ const clearAllReminders = () => {
   return apiClient.delete('/reminders');
 };
 
+// {action: 'complete'|'snooze'|'update'|'delete', ids: [...] or filter: {...}, days?, fields?}
+const bulkReminders = (operation) => {
+  return apiClient.post('/reminders/bulk', operation);
+};
+
+// Calendar API: per-day buckets for a month ('YYYY-MM') or a {start, end} window
+const getCalendarWindow = (window) => {
+  const params = typeof window === 'string'
+    ? new URLSearchParams({ month: window })
+    : new URLSearchParams(window);
+  return apiClient.get(`/calendar?${params.toString()}`);
+};
+
+// Dashboard API: today's habit, streak, 7-day history, today's reminders and latest checkup
+const getDashboard = () => {
+  return apiClient.get('/dashboard');
+};
+
 // Export all API functions
 export const authAPI = {
   login,
@@ -124,18 +184,22 @@ export const habitsAPI = {
   updateHabit,
   getStreak,
   getHistory,
+  getCalendar,
+  syncHabits,
 };
 
 export const profileAPI = {
   getProfile,
+  updateProfile,
+  getExportUrl,
 };
 
 export const aiCheckupAPI = {
   uploadImage,
   getHistory: getCheckupHistory,
   getCheckupDetails,
+  getTrend: getCheckupTrend,
   getModelHealth,
-  testModel,
 };
 
 export const remindersAPI = {
@@ -146,6 +210,15 @@ export const remindersAPI = {
   deleteReminder,
   getUpcomingReminders,
   clearAllReminders,
+  bulkReminders,
+};
+
+export const calendarAPI = {
+  getWindow: getCalendarWindow,
+};
+
+export const dashboardAPI = {
+  getDashboard,
 };
 
 export default apiClient;
\ No newline at end of file
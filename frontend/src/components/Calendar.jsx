@@ -1,12 +1,13 @@
 import React, { useState, useEffect } from 'react';
-import { remindersAPI } from '../api/api';
+import { remindersAPI, calendarAPI } from '../api/api';
 import toast from 'react-hot-toast';
 import Sidebar from './Sidebar';
 import '../styles/Calendar.css';
 
 const Calendar = () => {
     const [sidebarOpen, setSidebarOpen] = useState(false);
-    const [reminders, setReminders] = useState([]);
+    const [reminders, setReminders] = useState([]); // Reminders in the visible month
+    const [upcomingReminders, setUpcomingReminders] = useState([]);
     const [showForm, setShowForm] = useState(false);
     const [currentDate, setCurrentDate] = useState(new Date());
     const [formData, setFormData] = useState({
@@ -25,12 +26,20 @@ const Calendar = () => {
 
     useEffect(() => {
         loadReminders();
-    }, []);
+    }, [currentDate]);
 
     const loadReminders = async () => {
         try {
-            const response = await remindersAPI.getReminders();
-            setReminders(response.data.reminders);
+            // Only the visible month and the next few upcoming reminders, not the whole history
+            const month = `${currentDate.getFullYear()}-${String(currentDate.getMonth() + 1).padStart(2, '0')}`;
+            const [windowResponse, upcomingResponse] = await Promise.all([
+                calendarAPI.getWindow(month),
+                remindersAPI.getUpcomingReminders(365)
+            ]);
+            setReminders(Object.entries(windowResponse.data.days).flatMap(
+                ([date, day]) => day.reminders.map(reminder => ({ ...reminder, date }))
+            ));
+            setUpcomingReminders(upcomingResponse.data.reminders.slice(0, 5));
             setLoading(false);
         } catch (error) {
             console.error('Error loading reminders:', error);
@@ -219,11 +228,6 @@ const Calendar = () => {
     const monthNames = ['January', 'February', 'March', 'April', 'May', 'June',
         'July', 'August', 'September', 'October', 'November', 'December'];
 
-    const upcomingReminders = reminders
-        .filter(r => !r.completed && new Date(r.date) >= new Date())
-        .sort((a, b) => new Date(a.date) - new Date(b.date))
-        .slice(0, 5);
-
     return (
         <div className="app-layout">
             <Sidebar isOpen={sidebarOpen} setIsOpen={setSidebarOpen} />
@@ -235,7 +239,7 @@ const Calendar = () => {
                             <button className="btn-primary" onClick={() => setShowForm(!showForm)}>
                                 {showForm ? 'Cancel' : '+ New Reminder'}
                             </button>
-                            {reminders.length > 0 && (
+                            {(reminders.length > 0 || upcomingReminders.length > 0) && (
                                 <button className="btn-danger" onClick={handleClearAll}>
                                     🗑️ Clear All
                                 </button>
@@ -418,7 +422,7 @@ const Calendar = () => {
 
                         {reminders.filter(r => r.completed).length > 0 && (
                             <>
-                                <h2 style={{ marginTop: '2rem' }}>Completed Reminders</h2>
+                                <h2 style={{ marginTop: '2rem' }}>Completed in {monthNames[currentDate.getMonth()]}</h2>
                                 <div className="reminders-list">
                                     {reminders.filter(r => r.completed).map(reminder => (
                                         <div key={reminder.id} className={`reminder-card ${reminder.type} completed`}>
@@ -23,7 +23,7 @@ import {
   Filler
 } from 'chart.js';
 import Sidebar from './Sidebar';
-import { habitsAPI } from '../api/api';
+import { dashboardAPI, habitsAPI } from '../api/api';
 import '../styles/Dashboard.css';
 
 ChartJS.register(
@@ -61,15 +61,11 @@ const Dashboard = () => {
 
   const fetchDashboardData = async () => {
     try {
-      const [habitRes, streakRes, historyRes] = await Promise.all([
-        habitsAPI.getTodayHabit(),
-        habitsAPI.getStreak(),
-        habitsAPI.getHistory(7)
-      ]);
-
-      setTodayHabit(habitRes.data);
-      setStreakData(streakRes.data);
-      setHistory(historyRes.data?.history || []);
+      const { data } = await dashboardAPI.getDashboard();
+
+      setTodayHabit(data.today);
+      setStreakData(data.streak);
+      setHistory(data.history || []);
     } catch (error) {
       console.error('Error fetching dashboard data:', error);
       toast.error('Failed to load dashboard data');
@@ -13,7 +13,7 @@ import {
 } from 'react-icons/fa';
 import Sidebar from './Sidebar';
 import { useNavigate } from 'react-router-dom';
-import { authAPI } from '../api/api';
+import { authAPI, profileAPI } from '../api/api';
 import toast from 'react-hot-toast';
 import '../styles/Profile.css';
 
@@ -27,7 +27,8 @@ const Profile = () => {
     username: '',
     email: '',
     notifications: true,
-    emailNotifications: true
+    emailNotifications: true,
+    reminderDigest: true
   });
 
   useEffect(() => {
@@ -36,14 +37,15 @@ const Profile = () => {
 
   const fetchProfile = async () => {
     try {
-      const response = await authAPI.getProfile();
+      const response = await profileAPI.getProfile();
       const userData = response.data;
       setUser(userData);
       setFormData({
         username: userData.username,
         email: userData.email,
         notifications: true,
-        emailNotifications: true
+        emailNotifications: true,
+        reminderDigest: userData.reminder_digest
       });
     } catch (error) {
       console.error('Error fetching profile:', error);
@@ -63,7 +65,7 @@ const Profile = () => {
 
   const handleSave = async () => {
     try {
-      // Update profile API call would go here
+      await profileAPI.updateProfile({ reminder_digest: formData.reminderDigest });
       toast.success('Profile updated successfully!');
       setEditing(false);
     } catch (error) {
@@ -245,6 +247,23 @@ const Profile = () => {
                     <span className="slider"></span>
                   </label>
                 </div>
+
+                <div className="setting-option">
+                  <div className="option-info">
+                    <h4>Daily Reminder Digest</h4>
+                    <p>Get all of a day's reminders in one email</p>
+                  </div>
+                  <label className="toggle-switch">
+                    <input
+                      type="checkbox"
+                      name="reminderDigest"
+                      checked={formData.reminderDigest}
+                      onChange={handleChange}
+                      disabled={!editing}
+                    />
+                    <span className="slider"></span>
+                  </label>
+                </div>
               </div>
             </div>
 
@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import { remindersAPI } from '../api/api';
+import { dashboardAPI } from '../api/api';
 import '../styles/TodaysReminders.css';
 
 const TodaysReminders = () => {
@@ -15,14 +15,9 @@ const TodaysReminders = () => {
 
     const loadTodaysReminders = async () => {
         try {
-            const response = await remindersAPI.getUpcomingReminders(0); // Today only
-            const now = new Date();
-            const today = now.toISOString().split('T')[0];
-
-            const filtered = response.data.reminders.filter(
-                r => r.date === today && !r.completed
-            );
-            setTodaysReminders(filtered);
+            // Today's open reminders, shared with the (cached) dashboard payload
+            const response = await dashboardAPI.getDashboard();
+            setTodaysReminders(response.data.reminders);
         } catch (error) {
             console.error('Error loading today\'s reminders:', error);
         }